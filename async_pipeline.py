@@ -0,0 +1,275 @@
+import os
+import sys
+import time
+import uuid
+import asyncio
+import argparse
+import traceback
+import aiohttp
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+from utils.logger import setup_logger, log_context
+from main import ReelAutomationBot, STAGES, COMPONENTS
+from groc_client import AsyncGrocClient
+from sora_client import AsyncSoraClient
+from voice_engine import AsyncVoiceEngine
+from music_engine import AsyncMusicEngine
+from post_engine import AsyncPostEngine
+from rate_limiter import get_rate_limiter
+
+logger = setup_logger("async_pipeline")
+
+
+class AsyncReelAutomationBot(ReelAutomationBot):
+    """
+    Orchestrator running many reels concurrently on one event loop
+
+    API calls (Groq, Sora, Edge-TTS, Pixabay, SocialBu) share one aiohttp
+    session and yield while waiting; FFmpeg encodes run in threads capped
+    at max_concurrent_encodes. Use as an async context manager:
+
+        async with AsyncReelAutomationBot() as bot:
+            results = await bot.generate_reels(12)
+    """
+
+    def __init__(self, config_path: str = "settings.yaml"):
+        super().__init__(config_path)
+
+        async_config = self.config.get('async', {})
+        self.max_concurrent_reels = async_config.get('max_concurrent_reels', 12)
+        self.max_concurrent_encodes = async_config.get('max_concurrent_encodes', os.cpu_count() or 2)
+        self.max_connections = async_config.get('max_connections', 100)
+
+        self.session: Optional[aiohttp.ClientSession] = None
+        self._reel_slots: Optional[asyncio.Semaphore] = None
+        self._encode_slots: Optional[asyncio.Semaphore] = None
+        self._genre_lock: Optional[asyncio.Lock] = None
+        self._active: Dict[str, Dict[str, Any]] = {}
+
+    async def __aenter__(self):
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.max_connections)
+        )
+
+        # Swap the blocking clients for ones sharing this loop and session
+        self.groc = AsyncGrocClient(self.config, self.session)
+        self.sora = AsyncSoraClient(self.config, self.session)
+        self.voice = AsyncVoiceEngine(self.config)
+        self.music = AsyncMusicEngine(self.config, self.session)
+        self.publisher = AsyncPostEngine(self.config, self.session)
+
+        # Build the remaining components off the loop now rather than on
+        # first use inside a reel: they read files and open databases
+        await asyncio.gather(*(
+            asyncio.to_thread(self.component, name)
+            for name in COMPONENTS if name not in self.__dict__
+        ))
+
+        self._reel_slots = asyncio.Semaphore(self.max_concurrent_reels)
+        self._encode_slots = asyncio.Semaphore(self.max_concurrent_encodes)
+        self._genre_lock = asyncio.Lock()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+
+    async def generate_reels(
+            self,
+            count: int,
+            tier: Optional[str] = None,
+            release_at: Optional[float] = None
+    ) -> List[Dict]:
+        """
+        Generate several reels concurrently
+
+        Args:
+            count: Number of reels
+            tier: Encode tier for all reels (default: chosen per reel)
+            release_at: Unix time to publish at (queue mode only)
+
+        Returns:
+            List of generate_reel() results
+        """
+        return await asyncio.gather(*(
+            self.generate_reel(tier=tier, release_at=release_at)
+            for _ in range(count)
+        ))
+
+    async def generate_reel(
+            self,
+            tier: Optional[str] = None,
+            deadline_seconds: Optional[float] = None,
+            release_at: Optional[float] = None
+    ) -> Dict:
+        """
+        Async generate_reel(); at most max_concurrent_reels run at once
+        """
+        async with self._reel_slots:
+            state = self.new_run(
+                tier,
+                deadline_seconds,
+                release_at,
+                run_id=f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+            )
+            self._active[state['run_id']] = state
+
+            # Each reel is its own task, so the context doesn't leak between reels
+            with log_context(run_id=state['run_id']):
+                try:
+                    logger.info(f"[{state['run_id']}] Starting reel generation")
+
+                    for stage in STAGES:
+                        await self.run_stage(stage, state)
+                    await asyncio.to_thread(self.accounting.finish_run, state, True)
+
+                    logger.info(f"[{state['run_id']}] ✓ Reel complete: {state['story_data']['title']}")
+                    return self.result(state)
+
+                except Exception as e:
+                    logger.error(f"[{state['run_id']}] ❌ REEL GENERATION FAILED: {str(e)}")
+                    logger.error(traceback.format_exc())
+
+                    await asyncio.to_thread(self.fail_run, state)
+
+                    return {
+                        "success": False,
+                        "error": str(e)
+                    }
+
+                finally:
+                    self._active.pop(state['run_id'], None)
+
+    async def run_stage(self, stage: str, state: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Async run_stage(); SQLite and JSON bookkeeping runs in threads
+        """
+        with log_context(run_id=state['run_id'], stage=stage):
+            async with self.accounting.stage_async(state['run_id'], stage):
+                started = time.time()
+                await getattr(self, f"_stage_{stage}_async")(state)
+                await asyncio.to_thread(self._record_timing, stage, state, time.time() - started)
+        state.setdefault('completed_stages', []).append(stage)
+        return state
+
+    async def _stage_story_async(self, state: Dict[str, Any]):
+        """
+        Step 1: Select genre and generate story
+        """
+        if await asyncio.to_thread(get_rate_limiter(self.config).quota_remaining, 'sora') == 0:
+            raise Exception("Sora daily quota exhausted, skipping run")
+
+        # Reels in flight haven't reached history yet, keep their genres
+        # out; picks are serialized so two reels can't take the same one
+        async with self._genre_lock:
+            in_flight = [s['genre'] for s in self._active.values() if s.get('genre')]
+            genre = await asyncio.to_thread(self.story_engine.get_next_genre, in_flight)
+            state['genre'] = genre
+
+        recent_themes = await asyncio.to_thread(self.story_engine.get_recent_themes)
+        story_data = await self.groc.generate_story_script(genre, recent_themes)
+        story_data['genre'] = genre
+
+        logger.info(f"[{state['run_id']}] 📖 Story: {story_data['title']} ({genre})")
+
+        state['story_data'] = story_data
+
+    async def _stage_video_async(self, state: Dict[str, Any]):
+        """
+        Step 2: Generate video with Sora
+        """
+        raw_video_path = os.path.join(
+            self.config['paths']['raw_videos'],
+            f"raw_{state['run_id']}.mp4"
+        )
+
+        await self.sora.generate_video(state['story_data']['visual_prompt'], raw_video_path)
+        await asyncio.to_thread(self.storage.track, state['run_id'], raw_video_path, "artifact")
+
+        state['raw_video_path'] = raw_video_path
+
+    async def _stage_audio_async(self, state: Dict[str, Any]):
+        """
+        Steps 3-5: Voice-over and music fetched together, then captions
+        """
+        voice_path, music_path = self._audio_paths(state)
+
+        _, music_file = await asyncio.gather(
+            self.voice.generate_voiceover(state['story_data']['script'], voice_path),
+            self.music.get_background_music(state['genre'], music_path)
+        )
+
+        # Probes media with ffprobe
+        await asyncio.to_thread(self._finish_audio, state, voice_path, music_file)
+
+    async def _stage_compose_async(self, state: Dict[str, Any]):
+        """
+        Steps 6-7: FFmpeg compose in a worker thread
+        """
+        async with self._encode_slots:
+            await asyncio.to_thread(self._stage_compose, state)
+
+    async def _stage_publish_async(self, state: Dict[str, Any]):
+        """
+        Step 8: Publish and record the story
+        """
+        story_data = state['story_data']
+
+        if self.config.get('publish', {}).get('mode', 'inline') == 'queue':
+            # Enqueue hashes the file
+            publish_job = await asyncio.to_thread(self._publish, state)
+        else:
+            publish_job = None
+
+            hold = self._hold_seconds(state)
+            if hold > 0:
+                logger.info(f"[{state['run_id']}] Holding reel {hold / 60:.1f} min for its release time")
+                await asyncio.sleep(hold)
+                state['held_seconds'] = hold
+
+            started = time.time()
+            if self.fanout.targets:
+                # Fan-out runs its own upload threads
+                await asyncio.to_thread(self._upload, state)
+            else:
+                await self.publisher.publish_to_facebook(
+                    state['final_video_path'],
+                    story_data['title'],
+                    story_data['script'][:100] + "..."
+                )
+            state['upload_seconds'] = time.time() - started
+
+        # History and manifest writes
+        await asyncio.to_thread(self._record_published, state, publish_job)
+
+
+async def run(count: int, tier: Optional[str] = None) -> List[Dict]:
+    async with AsyncReelAutomationBot() as bot:
+        return await bot.generate_reels(count, tier=tier)
+
+
+def main():
+    """Generate several reels concurrently in one process"""
+    parser = argparse.ArgumentParser(description="Generate reels concurrently on one event loop")
+    parser.add_argument("--count", type=int, default=1, help="Number of reels")
+    parser.add_argument("--tier", choices=["draft", "standard", "archival"],
+                        help="Encode tier (default: chosen per reel)")
+    args = parser.parse_args()
+
+    try:
+        results = asyncio.run(run(args.count, args.tier))
+    except Exception as e:
+        logger.error(f"Critical error: {str(e)}")
+        logger.error(traceback.format_exc())
+        sys.exit(1)
+
+    succeeded = [r for r in results if r['success']]
+    for result in succeeded:
+        logger.info(f"✅ SUCCESS: {result['title']}")
+    logger.info(f"{len(succeeded)}/{len(results)} reel(s) generated")
+
+    sys.exit(0 if len(succeeded) == len(results) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+import os
+import sys
+import time
+import uuid
+import yaml
+import argparse
+import multiprocessing
+import multiprocessing.util
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+from utils.logger import setup_logger, configure_logging, stop_logging
+from main import ReelAutomationBot
+from story_engine import StoryEngine
+
+logger = setup_logger("batch")
+
+# Stages bound by local CPU (FFmpeg encodes); the rest mostly wait on APIs
+CPU_STAGES = {"compose"}
+
+
+class BatchReelBot(ReelAutomationBot):
+    """
+    Bot for one batch worker process; CPU-bound stages take a slot shared
+    by all workers
+    """
+
+    def __init__(self, config_path: str, cpu_slots):
+        super().__init__(config_path)
+        self.cpu_slots = cpu_slots
+
+    def run_stage(self, stage: str, state: Dict[str, Any]) -> Dict[str, Any]:
+        if stage in CPU_STAGES:
+            # Wait for the slot outside run_stage so it isn't timed as work
+            with self.cpu_slots:
+                return super().run_stage(stage, state)
+        return super().run_stage(stage, state)
+
+
+# Per worker process, set by _init_worker
+_bot: Optional[BatchReelBot] = None
+
+
+def _init_worker(config_path: str, cpu_slots):
+    global _bot
+    _bot = BatchReelBot(config_path, cpu_slots)
+    # Pool workers exit without running atexit handlers
+    multiprocessing.util.Finalize(None, stop_logging, exitpriority=10)
+
+
+def _generate(genre: str, tier: Optional[str]) -> Dict[str, Any]:
+    """
+    Generate one reel in a worker process
+    """
+    started = time.time()
+    result = _bot.generate_reel(
+        tier=tier,
+        genre=genre,
+        run_id=f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+    )
+    return {**result, "genre": genre, "seconds": time.time() - started}
+
+
+def plan_genres(config: Dict[str, Any], count: int) -> List[str]:
+    """
+    Genres for the next count reels, continuing the history's rotation
+
+    Planned here, once, because workers running at the same time would
+    all see the same history and pick the same genres.
+    """
+    story_engine = StoryEngine(config)
+    per_round = len(config['genres'])
+
+    planned = []
+    for _ in range(count):
+        # Each full round through the genres starts over
+        round_start = len(planned) - len(planned) % per_round
+        planned.append(story_engine.get_next_genre(exclude=planned[round_start:]))
+    return planned
+
+
+def run_batch(
+        config_path: str,
+        genres: List[str],
+        tier: Optional[str] = None,
+        io_workers: Optional[int] = None,
+        cpu_workers: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Generate one reel per genre through a pool of worker processes
+
+    Args:
+        config_path: Path to settings.yaml
+        genres: Genre of each reel
+        tier: Encode tier for all reels (default: chosen per reel)
+        io_workers: Worker processes, i.e. reels in flight
+        cpu_workers: Reels composing (FFmpeg) at the same time
+
+    Returns:
+        Dict with results and throughput figures
+    """
+    with open(config_path, 'r') as f:
+        config = yaml.safe_load(f)
+
+    batch_config = config.get('batch', {})
+    io_workers = max(1, min(io_workers or batch_config.get('io_workers', 4), len(genres)))
+    cpu_workers = max(1, cpu_workers or batch_config.get('cpu_workers', max(1, (os.cpu_count() or 2) // 2)))
+
+    logger.info(f"Generating {len(genres)} reel(s) with {io_workers} worker(s), {cpu_workers} encode slot(s)")
+
+    # Spawned workers: no logging or SQLite state inherited from this process
+    context = multiprocessing.get_context("spawn")
+    cpu_slots = context.BoundedSemaphore(cpu_workers)
+
+    results = []
+    started = time.time()
+
+    with ProcessPoolExecutor(
+            max_workers=io_workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(config_path, cpu_slots)
+    ) as pool:
+        futures = {pool.submit(_generate, genre, tier): genre for genre in genres}
+        try:
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # Worker crashed outside generate_reel
+                    result = {"success": False, "error": str(e), "genre": futures[future], "seconds": 0.0}
+
+                results.append(result)
+                if result['success']:
+                    logger.info(f"✓ [{len(results)}/{len(genres)}] {result['genre']}: {result['title']} "
+                                f"({result['seconds']:.0f}s)")
+                else:
+                    logger.error(f"❌ [{len(results)}/{len(genres)}] {result['genre']}: {result['error']}")
+
+        except KeyboardInterrupt:
+            logger.warning("Interrupted, cancelling reels not started yet")
+            pool.shutdown(wait=True, cancel_futures=True)
+            raise
+
+    elapsed = time.time() - started
+    durations = sorted(r['seconds'] for r in results if r['success'])
+    succeeded = len(durations)
+
+    return {
+        "results": results,
+        "requested": len(genres),
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "elapsed_seconds": elapsed,
+        "reels_per_hour": succeeded * 3600 / elapsed if elapsed else 0.0,
+        "avg_reel_seconds": sum(durations) / succeeded if succeeded else 0.0,
+        "p95_reel_seconds": durations[max(0, -(-95 * succeeded // 100) - 1)] if durations else 0.0
+    }
+
+
+def main():
+    """Generate many reels in one command"""
+    parser = argparse.ArgumentParser(description="Generate a batch of reels with a process pool")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--count", type=int, help="Number of reels, genres continue the rotation")
+    target.add_argument("--genres", help="Comma-separated genres, one reel each")
+    parser.add_argument("--tier", choices=["draft", "standard", "archival"],
+                        help="Encode tier (default: chosen per reel)")
+    parser.add_argument("--io-workers", type=int, help="Reels in flight (worker processes)")
+    parser.add_argument("--cpu-workers", type=int, help="Concurrent FFmpeg composes")
+    parser.add_argument("--config", default="settings.yaml")
+    args = parser.parse_args()
+
+    with open(args.config, 'r') as f:
+        config = yaml.safe_load(f)
+    configure_logging(config)
+
+    if args.genres:
+        genres = [g.strip() for g in args.genres.split(',') if g.strip()]
+        unknown = [g for g in genres if g not in config['genres']]
+        if unknown:
+            parser.error(f"unknown genre(s): {', '.join(unknown)}")
+    else:
+        if args.count < 1:
+            parser.error("--count must be at least 1")
+        genres = plan_genres(config, args.count)
+
+    summary = run_batch(args.config, genres, args.tier, args.io_workers, args.cpu_workers)
+
+    print(f"\n{summary['succeeded']}/{summary['requested']} reel(s) in {summary['elapsed_seconds'] / 60:.1f} min: "
+          f"{summary['reels_per_hour']:.1f} reels/hour, "
+          f"avg {summary['avg_reel_seconds']:.0f}s, p95 {summary['p95_reel_seconds']:.0f}s per reel")
+    for result in summary['results']:
+        if not result['success']:
+            print(f"  ❌ {result['genre']}: {result['error']}")
+
+    sys.exit(0 if summary['failed'] == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import os
+import uuid
+import threading
+import requests
+from typing import Dict, Any, Optional
+from utils.logger import setup_logger
+
+logger = setup_logger("broker_client")
+
+
+class BrokerError(Exception):
+    """The job broker rejected a call"""
+
+    def __init__(self, message: str, code: Optional[str] = None, payload: Optional[Dict[str, Any]] = None):
+        super().__init__(message)
+        self.code = code
+        self.payload = payload or {}
+
+
+def broker_configured(config: Dict[str, Any]) -> bool:
+    """
+    True when this node reaches the job queue and rate limits through a broker
+    """
+    return bool(config.get('distributed', {}).get('broker_url'))
+
+
+class BrokerClient:
+    """
+    HTTP client for the job broker (`python distributed_worker.py broker`)
+
+    One requests session per thread, as the heartbeat and the claim loops
+    call the broker concurrently.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        distributed_config = config.get('distributed', {})
+
+        self.url = distributed_config['broker_url'].rstrip('/')
+        self.timeout = distributed_config.get('broker_timeout_seconds', 30)
+        self.headers = {}
+        if distributed_config.get('broker_token'):
+            self.headers['Authorization'] = f"Bearer {distributed_config['broker_token']}"
+
+        self._local = threading.local()
+
+    @property
+    def session(self) -> requests.Session:
+        if not hasattr(self._local, 'session'):
+            session = requests.Session()
+            session.headers.update(self.headers)
+            self._local.session = session
+        return self._local.session
+
+    def call(self, path: str, **params) -> Any:
+        """
+        Call a broker method
+
+        Args:
+            path: Method path, e.g. "jobs/claim"
+            **params: JSON arguments
+
+        Returns:
+            The method's result
+
+        Raises:
+            BrokerError: The broker returned an error
+        """
+        response = self.session.post(f"{self.url}/{path}", json=params, timeout=self.timeout)
+        self._check(response, path)
+        return response.json().get('result')
+
+    def upload(self, run_id: str, name: str, path: str):
+        """
+        Stream a stage output file to the broker
+        """
+        with open(path, 'rb') as f:
+            response = self.session.put(
+                f"{self.url}/artifacts/{run_id}/{name}",
+                data=f,
+                headers={"Content-Length": str(os.path.getsize(path))},
+                timeout=self.timeout
+            )
+        self._check(response, f"artifacts/{run_id}/{name}")
+
+    def download(self, run_id: str, name: str, path: str):
+        """
+        Fetch a stage output file from the broker to the given path
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.part"
+
+        try:
+            with self.session.get(
+                    f"{self.url}/artifacts/{run_id}/{name}", stream=True, timeout=self.timeout
+            ) as response:
+                self._check(response, f"artifacts/{run_id}/{name}")
+                with open(tmp_path, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=1024 * 1024):
+                        f.write(chunk)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    @staticmethod
+    def _check(response: requests.Response, path: str):
+        if response.status_code == 200:
+            return
+        try:
+            payload = response.json()
+        except ValueError:
+            payload = {}
+        raise BrokerError(
+            f"Broker {path} failed: {response.status_code} {payload.get('message') or response.text[:200]}",
+            code=payload.get('error'),
+            payload=payload
+        )
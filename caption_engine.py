@@ -1,75 +1,322 @@
-import re
-from typing import List, Dict
-from utils.logger import setup_logger
-
-logger = setup_logger("caption_engine")
-
-
-class CaptionEngine:
-    """
-    Generate SRT captions for videos
-    """
-
-    def __init__(self):
-        pass
-
-    def generate_srt(self, script: str, output_path: str, duration: int = 30) -> str:
-        """
-        Generate SRT subtitle file from script
-
-        Args:
-            script: The narration text
-            output_path: Where to save the SRT file
-            duration: Total video duration in seconds
-
-        Returns:
-            Path to SRT file
-        """
-        try:
-            logger.info("Generating captions...")
-
-            # Split script into chunks (every 3-5 words)
-            words = script.split()
-            chunks = []
-
-            chunk_size = 4
-            for i in range(0, len(words), chunk_size):
-                chunk = ' '.join(words[i:i + chunk_size])
-                chunks.append(chunk)
-
-            # Calculate timing
-            time_per_chunk = duration / len(chunks)
-
-            srt_content = []
-            for i, chunk in enumerate(chunks):
-                start_time = i * time_per_chunk
-                end_time = (i + 1) * time_per_chunk
-
-                srt_content.append(f"{i + 1}")
-                srt_content.append(
-                    f"{self._format_time(start_time)} --> {self._format_time(end_time)}"
-                )
-                srt_content.append(chunk)
-                srt_content.append("")
-
-            # Write SRT file
-            with open(output_path, 'w', encoding='utf-8') as f:
-                f.write('\n'.join(srt_content))
-
-            logger.info(f"✓ Captions generated: {output_path}")
-            return output_path
-
-        except Exception as e:
-            logger.error(f"Error generating captions: {str(e)}")
-            raise
-
-    def _format_time(self, seconds: float) -> str:
-        """
-        Format seconds to SRT time format (HH:MM:SS,mmm)
-        """
-        hours = int(seconds // 3600)
-        minutes = int((seconds % 3600) // 60)
-        secs = int(seconds % 60)
-        millis = int((seconds % 1) * 1000)
-
-        return f"{hours:02d}:{minutes:02d}:{secs:02d},{millis:03d}"
\ No newline at end of file
+import re
+import os
+import hashlib
+import threading
+import subprocess
+from typing import List, Dict, Any, Optional
+from utils.logger import setup_logger
+
+logger = setup_logger("caption_engine")
+
+# Family of the bundled assets/fonts/DejaVuSans-Bold.ttf
+DEFAULT_FONT = "DejaVu Sans"
+
+
+class CaptionEngine:
+    """
+    Generate SRT or styled ASS captions for videos
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        caption_config = (config or {}).get('captions', {})
+        self.font_name = caption_config.get('font_name', DEFAULT_FONT)
+        self.font_size = caption_config.get('font_size', 80)
+        self.highlight_words = caption_config.get('highlight_words', True)
+        self.highlight_colour = caption_config.get('highlight_colour', '&H0000D7FF')
+        self.margin_v = caption_config.get('margin_v', 320)
+        self.resolution = (config or {}).get('video', {}).get('resolution', '1080x1920')
+
+    def generate_srt(self, script: str, output_path: str, duration: int = 30) -> str:
+        """
+        Generate SRT subtitle file from script
+
+        Args:
+            script: The narration text
+            output_path: Where to save the SRT file
+            duration: Total video duration in seconds
+
+        Returns:
+            Path to SRT file
+        """
+        try:
+            logger.info("Generating captions...")
+
+            chunks = [' '.join(words) for words in self._chunk_words(script)]
+
+            # Calculate timing
+            time_per_chunk = duration / len(chunks)
+
+            srt_content = []
+            for i, chunk in enumerate(chunks):
+                start_time = i * time_per_chunk
+                end_time = (i + 1) * time_per_chunk
+
+                srt_content.append(f"{i + 1}")
+                srt_content.append(
+                    f"{self._format_time(start_time)} --> {self._format_time(end_time)}"
+                )
+                srt_content.append(chunk)
+                srt_content.append("")
+
+            # Write SRT file
+            with open(output_path, 'w', encoding='utf-8') as f:
+                f.write('\n'.join(srt_content))
+
+            logger.info(f"✓ Captions generated: {output_path}")
+            return output_path
+
+        except Exception as e:
+            logger.error(f"Error generating captions: {str(e)}")
+            raise
+
+    def _format_time(self, seconds: float) -> str:
+        """
+        Format seconds to SRT time format (HH:MM:SS,mmm)
+        """
+        hours = int(seconds // 3600)
+        minutes = int((seconds % 3600) // 60)
+        secs = int(seconds % 60)
+        millis = int((seconds % 1) * 1000)
+
+        return f"{hours:02d}:{minutes:02d}:{secs:02d},{millis:03d}"
+
+    def generate_ass(self, script: str, output_path: str, duration: float = 30) -> str:
+        """
+        Generate a styled ASS subtitle file from script
+
+        Styling lives in the file itself, so FFmpeg doesn't need force_style
+        and libass only has to resolve the configured font. With word
+        highlighting on, the active word of each chunk is drawn in the
+        highlight colour.
+
+        Args:
+            script: The narration text
+            output_path: Where to save the ASS file
+            duration: Total video duration in seconds
+
+        Returns:
+            Path to ASS file
+        """
+        try:
+            logger.info("Generating styled captions...")
+
+            width, height = self.resolution.split('x')
+            chunks = self._chunk_words(script)
+            time_per_chunk = duration / len(chunks)
+
+            lines = [
+                "[Script Info]",
+                "ScriptType: v4.00+",
+                f"PlayResX: {width}",
+                f"PlayResY: {height}",
+                "WrapStyle: 0",
+                "ScaledBorderAndShadow: yes",
+                "",
+                "[V4+ Styles]",
+                "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, "
+                "BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, "
+                "BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding",
+                f"Style: Default,{self.font_name},{self.font_size},&H00FFFFFF,&H000000FF,&H00000000,"
+                f"&H80000000,-1,0,0,0,100,100,0,0,1,5,2,2,60,60,{self.margin_v},1",
+                "",
+                "[Events]",
+                "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text"
+            ]
+
+            for i, words in enumerate(chunks):
+                chunk_start = i * time_per_chunk
+                words = [self._escape_ass(w) for w in words]
+
+                if not self.highlight_words:
+                    lines.append(self._ass_dialogue(chunk_start, chunk_start + time_per_chunk, ' '.join(words)))
+                    continue
+
+                # Split the chunk's time across its words by length
+                total_chars = sum(len(w) for w in words)
+                word_start = chunk_start
+                for j, word in enumerate(words):
+                    word_end = word_start + time_per_chunk * len(word) / total_chars
+                    if j == len(words) - 1:
+                        word_end = chunk_start + time_per_chunk
+
+                    text = ' '.join(
+                        f"{{\\c{self.highlight_colour}&}}{w}{{\\r}}" if k == j else w
+                        for k, w in enumerate(words)
+                    )
+                    lines.append(self._ass_dialogue(word_start, word_end, text))
+                    word_start = word_end
+
+            with open(output_path, 'w', encoding='utf-8') as f:
+                f.write('\n'.join(lines) + '\n')
+
+            logger.info(f"✓ Styled captions generated: {output_path}")
+            return output_path
+
+        except Exception as e:
+            logger.error(f"Error generating styled captions: {str(e)}")
+            raise
+
+    def _chunk_words(self, script: str, chunk_size: int = 4) -> List[List[str]]:
+        """
+        Split script into caption chunks (every 3-5 words)
+        """
+        words = script.split()
+        return [words[i:i + chunk_size] for i in range(0, len(words), chunk_size)]
+
+    def _ass_dialogue(self, start: float, end: float, text: str) -> str:
+        return f"Dialogue: 0,{self._format_ass_time(start)},{self._format_ass_time(end)},Default,,0,0,0,,{text}"
+
+    @staticmethod
+    def _escape_ass(text: str) -> str:
+        """
+        Keep script text from being read as ASS override tags
+        """
+        return text.replace('\\', '/').replace('{', '(').replace('}', ')')
+
+    @staticmethod
+    def _format_ass_time(seconds: float) -> str:
+        """
+        Format seconds to ASS time format (H:MM:SS.cc)
+        """
+        centis = int(round(seconds * 100))
+        hours, centis = divmod(centis, 360000)
+        minutes, centis = divmod(centis, 6000)
+        secs, centis = divmod(centis, 100)
+
+        return f"{hours}:{minutes:02d}:{secs:02d}.{centis:02d}"
+
+
+class FontCache:
+    """
+    Bundled fonts with a pre-built, isolated fontconfig cache
+
+    libass is pointed at a fonts.conf that only knows the bundled fonts
+    directory, and that cache is built once up front. Every encode then
+    starts with the same small, already-indexed font set instead of a
+    system-wide fontconfig scan.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        caption_config = config.get('captions', {})
+        self.fonts_dir = os.path.abspath(caption_config.get('fonts_dir', 'assets/fonts'))
+        self.config_dir = os.path.abspath(os.path.join(config['paths']['output'], 'fontconfig'))
+        self.config_file = os.path.join(self.config_dir, 'fonts.conf')
+        self.cache_dir = os.path.join(self.config_dir, 'cache')
+        self.font_name = caption_config.get('font_name', DEFAULT_FONT)
+        self._env = None
+        self._font_checked = False
+        self._lock = threading.Lock()
+
+    def has_fonts(self) -> bool:
+        return bool(self._font_files())
+
+    def _font_files(self) -> List[str]:
+        if not os.path.isdir(self.fonts_dir):
+            return []
+        return sorted(
+            f for f in os.listdir(self.fonts_dir)
+            if f.lower().endswith(('.ttf', '.otf', '.ttc'))
+        )
+
+    def warm(self) -> Dict[str, str]:
+        """
+        Write the isolated fonts.conf and build its cache if the fonts changed
+
+        Returns:
+            Environment overrides for FFmpeg subprocesses (empty when no
+            bundled fonts are present and the system fonts are used)
+        """
+        # Concurrent encodes wait for the first one to build the cache
+        with self._lock:
+            if self._env is None:
+                self._env = self._build()
+            return self._env
+
+    def _build(self) -> Dict[str, str]:
+        fonts = self._font_files()
+        if not fonts:
+            logger.warning(
+                f"⚠ No bundled fonts in {self.fonts_dir} (DejaVuSans-Bold.ttf ships there), "
+                f"falling back to a system font scan"
+            )
+            return {}
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        with open(self.config_file, 'w', encoding='utf-8') as f:
+            f.write(
+                '<?xml version="1.0"?>\n'
+                '<!DOCTYPE fontconfig SYSTEM "fonts.dtd">\n'
+                '<fontconfig>\n'
+                f'  <dir>{self.fonts_dir}</dir>\n'
+                f'  <cachedir>{self.cache_dir}</cachedir>\n'
+                '</fontconfig>\n'
+            )
+
+        env = {"FONTCONFIG_FILE": self.config_file}
+
+        # Rebuild the cache only when the set of bundled fonts changes
+        fingerprint = hashlib.sha256()
+        for name in fonts:
+            stat = os.stat(os.path.join(self.fonts_dir, name))
+            fingerprint.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+        stamp_file = os.path.join(self.cache_dir, 'fonts.stamp')
+
+        if os.path.exists(stamp_file):
+            with open(stamp_file, 'r') as f:
+                if f.read() == fingerprint.hexdigest():
+                    return env
+
+        try:
+            logger.info(f"Building font cache for {len(fonts)} bundled fonts...")
+            subprocess.run(
+                ['fc-cache', '-f', self.fonts_dir],
+                env={**os.environ, **env},
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                timeout=60,
+                check=True
+            )
+            with open(stamp_file, 'w') as f:
+                f.write(fingerprint.hexdigest())
+            logger.info("✓ Font cache ready")
+        except Exception as e:
+            # libass still loads the fonts through fontsdir, just without the cache
+            logger.warning(f"Could not pre-build font cache: {str(e)}")
+
+        return env
+
+    def check_font(self):
+        """
+        Make sure libass can resolve the configured caption font
+
+        With bundled fonts only those are visible, otherwise the system
+        fonts. Skipped with a warning when fontconfig's tools are missing.
+
+        Raises:
+            FileNotFoundError: If no font of that family is available
+        """
+        if self._font_checked:
+            return
+
+        try:
+            result = subprocess.run(
+                ['fc-list', f':family={self.font_name}', 'family'],
+                env={**os.environ, **self.warm()},
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                timeout=60,
+                check=True
+            )
+        except Exception as e:
+            logger.warning(f"⚠ Could not check caption font '{self.font_name}': {str(e)}")
+            return
+
+        if not result.stdout.strip():
+            where = self.fonts_dir if self.has_fonts() else "the system fonts"
+            raise FileNotFoundError(
+                f"Caption font '{self.font_name}' not found in {where}: "
+                f"add it to {self.fonts_dir} or change captions.font_name"
+            )
+        self._font_checked = True
@@ -0,0 +1,766 @@
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import shutil
+import sqlite3
+import argparse
+import threading
+import yaml
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, List, Optional, Iterable
+from broker_client import BrokerClient, BrokerError, broker_configured
+from rate_limiter import RateLimiter, QuotaExceededError
+from utils.logger import setup_logger, configure_logging
+
+logger = setup_logger("distributed_worker")
+
+
+class LeaseLostError(Exception):
+    """The job's lease expired and another worker took it over"""
+
+
+class JobQueue:
+    """
+    Shared queue of reel jobs, claimed stage by stage under a lease
+
+    A job is claimed for one stage at a time, so Sora-only workers can
+    wait on renders while encode workers compose.
+
+    The database sits on the local disk of one host. Workers on that
+    host may open it directly; workers on other hosts reach it through
+    JobBroker (see RemoteJobQueue), which also carries the files one
+    stage hands to the next.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        distributed_config = config.get('distributed', {})
+
+        self.db_path = distributed_config.get(
+            'db_path',
+            os.path.join(config['paths']['output'], "reel_jobs.db")
+        )
+        self.lease_seconds = distributed_config.get('lease_seconds', 120)
+        self.max_attempts = distributed_config.get('max_attempts', 3)
+        self.backoff_base = distributed_config.get('backoff_base_seconds', 30)
+
+        self._init_db()
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _init_db(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS reel_jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    run_id TEXT NOT NULL UNIQUE,
+                    stage TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'ready',
+                    state TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL,
+                    lease_owner TEXT,
+                    lease_expires REAL,
+                    last_error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_reel_jobs_ready ON reel_jobs (status, stage, next_attempt_at)")
+
+    def submit(self, state: Dict[str, Any], stage: str) -> int:
+        """
+        Add a reel job at its first stage
+
+        Args:
+            state: Run state from ReelAutomationBot.new_run()
+            stage: Stage to start at
+
+        Returns:
+            Job id
+        """
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                """
+                INSERT INTO reel_jobs (run_id, stage, state, next_attempt_at, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (state['run_id'], stage, json.dumps(state), now, now, now)
+            )
+        logger.info(f"✓ Submitted reel job {cursor.lastrowid} (run {state['run_id']})")
+        return cursor.lastrowid
+
+    def claim(self, worker_id: str, stages: Iterable[str]) -> Optional[Dict[str, Any]]:
+        """
+        Claim the oldest ready job waiting at one of the given stages
+
+        Jobs whose lease expired (node died mid-stage) are claimable again
+        at the stage they were on.
+
+        Args:
+            worker_id: Identifier of the claiming worker
+            stages: Stages this worker runs
+
+        Returns:
+            Job record with state decoded, or None when nothing is ready
+        """
+        stages = list(stages)
+        placeholders = ",".join("?" for _ in stages)
+        now = time.time()
+
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    f"""
+                    SELECT * FROM reel_jobs
+                    WHERE stage IN ({placeholders})
+                      AND ((status = 'ready' AND next_attempt_at <= ?)
+                           OR (status = 'claimed' AND lease_expires < ?))
+                    ORDER BY created_at, id
+                    LIMIT 1
+                    """,
+                    (*stages, now, now)
+                ).fetchone()
+
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+
+                if row['status'] == 'claimed':
+                    logger.warning(
+                        f"Reclaiming job {row['id']} at stage '{row['stage']}' "
+                        f"from expired lease of {row['lease_owner']}"
+                    )
+
+                conn.execute(
+                    """
+                    UPDATE reel_jobs
+                    SET status = 'claimed', lease_owner = ?, lease_expires = ?, updated_at = ?
+                    WHERE id = ?
+                    """,
+                    (worker_id, now + self.lease_seconds, now, row['id'])
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+        job = dict(row)
+        job['state'] = json.loads(job['state'])
+        return job
+
+    def heartbeat(self, job_id: int, worker_id: str) -> bool:
+        """
+        Extend a held lease
+
+        Returns:
+            False if the lease was lost to another worker
+        """
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                """
+                UPDATE reel_jobs SET lease_expires = ?, updated_at = ?
+                WHERE id = ? AND status = 'claimed' AND lease_owner = ?
+                """,
+                (now + self.lease_seconds, now, job_id, worker_id)
+            )
+        return cursor.rowcount > 0
+
+    def advance(self, job_id: int, worker_id: str, next_stage: Optional[str], state: Dict[str, Any]):
+        """
+        Hand a job on to its next stage, or mark it done
+
+        Only the current lease owner may advance, so a worker that stalled
+        past its lease can't overwrite the work of the one that took over.
+
+        Raises:
+            LeaseLostError: The lease is no longer held by this worker
+        """
+        now = time.time()
+        status = 'ready' if next_stage else 'done'
+
+        with self._connect() as conn:
+            cursor = conn.execute(
+                """
+                UPDATE reel_jobs
+                SET stage = COALESCE(?, stage), status = ?, state = ?, attempts = 0,
+                    next_attempt_at = ?, lease_owner = NULL, lease_expires = NULL,
+                    last_error = NULL, updated_at = ?
+                WHERE id = ? AND status = 'claimed' AND lease_owner = ?
+                """,
+                (next_stage, status, json.dumps(state), now, now, job_id, worker_id)
+            )
+        if cursor.rowcount == 0:
+            raise LeaseLostError(f"Lease on job {job_id} lost, result discarded")
+
+    def fail(self, job_id: int, worker_id: str, error: str) -> Optional[str]:
+        """
+        Record a failed stage; retried with backoff up to max_attempts
+
+        Returns:
+            New status ('ready' or 'failed'), or None if the lease was lost
+        """
+        now = time.time()
+
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT attempts FROM reel_jobs WHERE id = ? AND status = 'claimed' AND lease_owner = ?",
+                (job_id, worker_id)
+            ).fetchone()
+            if row is None:
+                return None
+
+            attempts = row['attempts'] + 1
+            status = 'failed' if attempts >= self.max_attempts else 'ready'
+            delay = self.backoff_base * 2 ** (attempts - 1) * random.uniform(0.8, 1.2)
+
+            conn.execute(
+                """
+                UPDATE reel_jobs
+                SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?,
+                    lease_owner = NULL, lease_expires = NULL, updated_at = ?
+                WHERE id = ?
+                """,
+                (status, attempts, now + delay, error, now, job_id)
+            )
+        return status
+
+    def in_flight_genres(self) -> List[str]:
+        """
+        Genres picked by jobs not yet published, so parallel nodes rotate
+        through different genres
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT state FROM reel_jobs WHERE status IN ('ready', 'claimed')"
+            ).fetchall()
+        genres = [json.loads(row['state']).get('genre') for row in rows]
+        return [genre for genre in genres if genre]
+
+    def list_jobs(self, status: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        with self._connect() as conn:
+            if status:
+                rows = conn.execute(
+                    "SELECT * FROM reel_jobs WHERE status = ? ORDER BY id DESC LIMIT ?", (status, limit)
+                ).fetchall()
+            else:
+                rows = conn.execute("SELECT * FROM reel_jobs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        """
+        Job counts per stage/status, e.g. {"video/claimed": 2}
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT stage, status, COUNT(*) AS n FROM reel_jobs GROUP BY stage, status"
+            ).fetchall()
+        return {f"{row['stage']}/{row['status']}": row['n'] for row in rows}
+
+
+class RemoteJobQueue:
+    """
+    JobQueue on the broker host, reached over HTTP from any node
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        self.client = BrokerClient(config)
+
+    def submit(self, state: Dict[str, Any], stage: str) -> int:
+        job_id = self.client.call("jobs/submit", state=state, stage=stage)
+        logger.info(f"✓ Submitted reel job {job_id} (run {state['run_id']}) to {self.client.url}")
+        return job_id
+
+    def claim(self, worker_id: str, stages: Iterable[str]) -> Optional[Dict[str, Any]]:
+        return self.client.call("jobs/claim", worker_id=worker_id, stages=list(stages))
+
+    def heartbeat(self, job_id: int, worker_id: str) -> bool:
+        return self.client.call("jobs/heartbeat", job_id=job_id, worker_id=worker_id)
+
+    def advance(self, job_id: int, worker_id: str, next_stage: Optional[str], state: Dict[str, Any]):
+        try:
+            self.client.call("jobs/advance", job_id=job_id, worker_id=worker_id, next_stage=next_stage, state=state)
+        except BrokerError as e:
+            if e.code == 'lease_lost':
+                raise LeaseLostError(e.payload.get('message', str(e)))
+            raise
+
+    def fail(self, job_id: int, worker_id: str, error: str) -> Optional[str]:
+        return self.client.call("jobs/fail", job_id=job_id, worker_id=worker_id, error=error)
+
+    def in_flight_genres(self) -> List[str]:
+        return self.client.call("jobs/in_flight_genres")
+
+    def list_jobs(self, status: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        return self.client.call("jobs/list_jobs", status=status, limit=limit)
+
+    def counts(self) -> Dict[str, int]:
+        return self.client.call("jobs/counts")
+
+
+def get_job_queue(config: Dict[str, Any]):
+    """
+    The broker's queue when distributed.broker_url is set, else the local database
+    """
+    return RemoteJobQueue(config) if broker_configured(config) else JobQueue(config)
+
+
+# Run state keys holding files one stage produces for a later one
+ARTIFACT_KEYS = ("raw_video_path", "voice_path", "music_file", "srt_path", "final_video_path")
+
+
+class StageArtifacts:
+    """
+    Ships stage output files between nodes through the broker
+
+    After a stage, new files named in the run state are uploaded; before
+    a stage, any the node doesn't have are downloaded to the same path.
+    Without a broker all stages share one disk and this does nothing.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        self.client = BrokerClient(config) if broker_configured(config) else None
+
+    @staticmethod
+    def _paths(state: Dict[str, Any]) -> List[str]:
+        paths = [state.get(key) for key in ARTIFACT_KEYS]
+        paths.extend((state.get('variant_paths') or {}).values())
+        return [path for path in paths if path]
+
+    def push(self, state: Dict[str, Any]):
+        """
+        Upload files the last stage added to the run state
+        """
+        if self.client is None:
+            return
+
+        shipped = state.setdefault('artifacts', {})
+        for path in self._paths(state):
+            if path in shipped or not os.path.exists(path):
+                continue
+            name = f"{len(shipped)}_{os.path.basename(path)}"
+            self.client.upload(state['run_id'], name, path)
+            shipped[path] = name
+            logger.debug(f"Shipped {path} for run {state['run_id']}")
+
+    def pull(self, state: Dict[str, Any]):
+        """
+        Download earlier stages' files missing on this node
+        """
+        if self.client is None:
+            return
+
+        for path, name in state.get('artifacts', {}).items():
+            if not os.path.exists(path):
+                self.client.download(state['run_id'], name, path)
+                logger.debug(f"Fetched {path} for run {state['run_id']}")
+
+
+class JobBroker:
+    """
+    HTTP front for the job queue, rate limits and stage files
+
+    Runs on the host whose local disk holds the queue database. Workers,
+    the scheduler and publish workers on every node point
+    distributed.broker_url here, so they claim from one queue, share one
+    set of rate limit buckets and hand stage files to each other.
+    Requests carry the shared broker_token as a bearer token.
+    """
+
+    JOB_METHODS = ("submit", "claim", "heartbeat", "advance", "fail", "in_flight_genres", "list_jobs", "counts")
+    LIMIT_METHODS = {
+        "try_acquire": "_try_acquire",
+        "bucket_wait": "_bucket_wait",
+        "quota_used": "_quota_used",
+        "release": "release",
+        "block": "block",
+    }
+    NAME_PATTERN = re.compile(r"^[\w.-]+$")
+
+    def __init__(self, config: Dict[str, Any]):
+        distributed_config = config.get('distributed', {})
+
+        self.host = distributed_config.get('broker_host', '0.0.0.0')
+        self.port = distributed_config.get('broker_port', 8765)
+        self.token = distributed_config.get('broker_token', '')
+        self.artifacts_dir = distributed_config.get(
+            'artifacts_dir',
+            os.path.join(config['paths']['output'], "artifacts")
+        )
+
+        self.queue = JobQueue(config)
+        self.limiter = RateLimiter(config)
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def start(self):
+        """
+        Start serving in a background thread
+        """
+        broker = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                broker._handle(self)
+
+            def do_POST(self):
+                broker._handle(self)
+
+            def do_PUT(self):
+                broker._handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        os.makedirs(self.artifacts_dir, exist_ok=True)
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="job-broker", daemon=True).start()
+        logger.info(f"✓ Job broker listening on {self.host}:{self.port}")
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def _reply(self, request: BaseHTTPRequestHandler, status: int, payload: Dict[str, Any]):
+        body = json.dumps(payload).encode()
+        request.send_response(status)
+        request.send_header('Content-Type', 'application/json')
+        request.send_header('Content-Length', str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
+
+    def _handle(self, request: BaseHTTPRequestHandler):
+        if self.token and request.headers.get('Authorization') != f"Bearer {self.token}":
+            logger.warning(f"Rejected broker call with bad token from {request.client_address[0]}")
+            self._reply(request, 403, {"error": "forbidden", "message": "bad broker token"})
+            return
+
+        parts = request.path.strip('/').split('/')
+        try:
+            if parts[0] == 'artifacts' and len(parts) == 3:
+                self._handle_artifact(request, parts[1], parts[2])
+                return
+
+            if request.command != 'POST' or len(parts) != 2:
+                self._reply(request, 404, {"error": "not_found", "message": request.path})
+                return
+
+            length = int(request.headers.get('Content-Length', 0))
+            params = json.loads(request.rfile.read(length) or b'{}')
+
+            if parts[0] == 'jobs' and parts[1] in self.JOB_METHODS:
+                result = self._call_job(parts[1], params)
+            elif parts[0] == 'limits' and parts[1] in self.LIMIT_METHODS:
+                result = getattr(self.limiter, self.LIMIT_METHODS[parts[1]])(**params)
+            else:
+                self._reply(request, 404, {"error": "not_found", "message": request.path})
+                return
+
+            self._reply(request, 200, {"result": result})
+
+        except LeaseLostError as e:
+            self._reply(request, 409, {"error": "lease_lost", "message": str(e)})
+        except QuotaExceededError as e:
+            self._reply(request, 429, {"error": "quota_exceeded", "message": str(e), "reset_in": e.reset_in})
+        except (ValueError, TypeError) as e:
+            self._reply(request, 400, {"error": "bad_request", "message": str(e)})
+        except Exception as e:
+            logger.error(f"❌ Broker call {request.path} failed: {str(e)}")
+            self._reply(request, 500, {"error": "internal", "message": str(e)})
+
+    def _call_job(self, method: str, params: Dict[str, Any]) -> Any:
+        result = getattr(self.queue, method)(**params)
+
+        # Files in transit are only needed until the reel is done or given up
+        finished = (method == 'advance' and params.get('next_stage') is None) or \
+                   (method == 'fail' and result == 'failed')
+        if finished:
+            run_id = params.get('state', {}).get('run_id') or self._run_id(params['job_id'])
+            if run_id and self.NAME_PATTERN.match(run_id):
+                shutil.rmtree(os.path.join(self.artifacts_dir, run_id), ignore_errors=True)
+        return result
+
+    def _run_id(self, job_id: int) -> Optional[str]:
+        with self.queue._connect() as conn:
+            row = conn.execute("SELECT run_id FROM reel_jobs WHERE id = ?", (job_id,)).fetchone()
+        return row['run_id'] if row else None
+
+    def _handle_artifact(self, request: BaseHTTPRequestHandler, run_id: str, name: str):
+        if not (self.NAME_PATTERN.match(run_id) and self.NAME_PATTERN.match(name)) or name.startswith('.'):
+            self._reply(request, 400, {"error": "bad_request", "message": "bad artifact name"})
+            return
+
+        path = os.path.join(self.artifacts_dir, run_id, name)
+
+        if request.command == 'PUT':
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{uuid.uuid4().hex}.part"
+            remaining = int(request.headers.get('Content-Length', 0))
+            try:
+                with open(tmp_path, 'wb') as f:
+                    while remaining > 0:
+                        chunk = request.rfile.read(min(remaining, 1024 * 1024))
+                        if not chunk:
+                            raise ValueError("upload cut short")
+                        f.write(chunk)
+                        remaining -= len(chunk)
+                os.replace(tmp_path, path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            self._reply(request, 200, {"result": os.path.getsize(path)})
+
+        elif request.command == 'GET':
+            if not os.path.exists(path):
+                self._reply(request, 404, {"error": "not_found", "message": f"{run_id}/{name}"})
+                return
+            request.send_response(200)
+            request.send_header('Content-Type', 'application/octet-stream')
+            request.send_header('Content-Length', str(os.path.getsize(path)))
+            request.end_headers()
+            with open(path, 'rb') as f:
+                shutil.copyfileobj(f, request.wfile, 1024 * 1024)
+
+        else:
+            self._reply(request, 405, {"error": "bad_method", "message": request.command})
+
+
+class DistributedWorker:
+    """
+    Node worker that claims reel jobs for a subset of pipeline stages
+    """
+
+    def __init__(self, config_path: str = "settings.yaml", stages: Optional[List[str]] = None):
+        from main import ReelAutomationBot, STAGES
+
+        self.bot = ReelAutomationBot(config_path)
+        self.config = self.bot.config
+        self.pipeline = STAGES
+
+        distributed_config = self.config.get('distributed', {})
+        self.stages = stages or distributed_config.get('stages') or STAGES
+        unknown = set(self.stages) - set(STAGES)
+        if unknown:
+            raise ValueError(f"Unknown stages: {', '.join(sorted(unknown))}")
+
+        self.queue = get_job_queue(self.config)
+        self.artifacts = StageArtifacts(self.config)
+        self.concurrency = distributed_config.get('concurrency', 1)
+        self.heartbeat_seconds = distributed_config.get('heartbeat_seconds', 30)
+        self.poll_interval = distributed_config.get('poll_interval_seconds', 5)
+
+        # Queued uploads land in this node's publish queue, next to the
+        # reel file, so the node running the publish stage drains them
+        self.publish_worker = None
+        if 'publish' in self.stages and self.config.get('publish', {}).get('mode') == 'queue':
+            from publish_queue import PublishWorker
+            self.publish_worker = PublishWorker(self.config)
+
+        self._stop = threading.Event()
+        self._held: Dict[int, str] = {}
+        self._held_lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+
+    def process_one(self, worker_id: str) -> bool:
+        """
+        Claim a job and run its current stage
+
+        Returns:
+            True if a job was processed
+        """
+        job = self.queue.claim(worker_id, self.stages)
+        if job is None:
+            return False
+
+        stage, state = job['stage'], job['state']
+        logger.info(f"[{worker_id}] Job {job['id']} (run {state['run_id']}): stage '{stage}'")
+
+        with self._held_lock:
+            self._held[job['id']] = worker_id
+
+        try:
+            if stage == "story":
+                state['exclude_genres'] = self.queue.in_flight_genres()
+
+            started = time.time()
+            self.artifacts.pull(state)
+            self.bot.run_stage(stage, state)
+            self.artifacts.push(state)
+
+            index = self.pipeline.index(stage)
+            next_stage = self.pipeline[index + 1] if index + 1 < len(self.pipeline) else None
+            self.queue.advance(job['id'], worker_id, next_stage, state)
+            if next_stage is None:
+                self.bot.accounting.finish_run(state, success=True)
+
+            logger.info(
+                f"[{worker_id}] ✓ Job {job['id']} stage '{stage}' done in {time.time() - started:.0f}s"
+                + (f", handed off to '{next_stage}'" if next_stage else ", reel complete")
+            )
+
+        except LeaseLostError as e:
+            logger.warning(f"[{worker_id}] {str(e)}")
+
+        except Exception as e:
+            status = self.queue.fail(job['id'], worker_id, str(e))
+            if status == 'failed':
+                logger.error(f"[{worker_id}] ❌ Job {job['id']} failed at stage '{stage}': {str(e)}")
+                self.bot.fail_run(state)
+            else:
+                logger.warning(f"[{worker_id}] Job {job['id']} stage '{stage}' failed, will retry: {str(e)}")
+
+        finally:
+            with self._held_lock:
+                self._held.pop(job['id'], None)
+
+        return True
+
+    def _heartbeat(self):
+        while not self._stop.wait(self.heartbeat_seconds):
+            with self._held_lock:
+                held = dict(self._held)
+            for job_id, worker_id in held.items():
+                try:
+                    if not self.queue.heartbeat(job_id, worker_id):
+                        logger.warning(f"[{worker_id}] Lost lease on job {job_id}")
+                except Exception as e:
+                    logger.error(f"Heartbeat failed for job {job_id}: {str(e)}")
+
+    def _run(self, worker_id: str):
+        while not self._stop.is_set():
+            try:
+                if not self.process_one(worker_id):
+                    self._stop.wait(self.poll_interval)
+            except Exception as e:
+                logger.error(f"[{worker_id}] Worker error: {str(e)}")
+                self._stop.wait(self.poll_interval)
+
+    def start(self):
+        """
+        Start claim loops and the lease heartbeat in the background
+        """
+        heartbeat = threading.Thread(target=self._heartbeat, name="lease-heartbeat", daemon=True)
+        heartbeat.start()
+        self._threads.append(heartbeat)
+
+        for i in range(self.concurrency):
+            worker_id = f"{os.uname().nodename}-{os.getpid()}-{i}-{uuid.uuid4().hex[:6]}"
+            thread = threading.Thread(target=self._run, args=(worker_id,), name=f"reel-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+        if self.publish_worker:
+            self.publish_worker.start()
+
+        logger.info(f"✓ Started {self.concurrency} reel worker(s) for stages: {', '.join(self.stages)}")
+
+    def stop(self, timeout: float = 30):
+        self._stop.set()
+        if self.publish_worker:
+            self.publish_worker.stop(timeout)
+        for thread in self._threads:
+            thread.join(timeout)
+
+
+def submit_reels(
+        config: Dict[str, Any],
+        count: int = 1,
+        tier: Optional[str] = None,
+        release_at: Optional[float] = None,
+        deadline_seconds: Optional[float] = None
+) -> List[int]:
+    """
+    Queue new reel jobs for the worker nodes
+
+    Returns:
+        Job ids
+    """
+    from main import ReelAutomationBot, STAGES
+
+    queue = get_job_queue(config)
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    job_ids = []
+    for _ in range(count):
+        state = ReelAutomationBot.new_run(
+            tier=tier,
+            deadline_seconds=deadline_seconds,
+            release_at=release_at,
+            run_id=f"{timestamp}_{uuid.uuid4().hex[:6]}"
+        )
+        job_ids.append(queue.submit(state, STAGES[0]))
+    return job_ids
+
+
+def main():
+    """Distributed mode CLI: submit reels, run the broker or a node worker, or show status"""
+    parser = argparse.ArgumentParser(description="Distributed reel production")
+    parser.add_argument("command", choices=["submit", "broker", "worker", "status"])
+    parser.add_argument("--count", type=int, default=1, help="Reels to submit")
+    parser.add_argument("--tier", choices=["draft", "standard", "archival"])
+    parser.add_argument("--stages", help="Comma-separated stages this node runs (default: all)")
+    parser.add_argument("--config", default="settings.yaml")
+    args = parser.parse_args()
+
+    with open(args.config, 'r') as f:
+        config = yaml.safe_load(f)
+    configure_logging(config)
+
+    if args.command == "submit":
+        job_ids = submit_reels(config, args.count, args.tier)
+        print(f"Submitted job(s): {', '.join(str(i) for i in job_ids)}")
+
+    elif args.command == "broker":
+        broker = JobBroker(config)
+        broker.start()
+        try:
+            while True:
+                time.sleep(60)
+        except KeyboardInterrupt:
+            logger.info("Stopping job broker...")
+            broker.stop()
+
+    elif args.command == "worker":
+        stages = args.stages.split(",") if args.stages else None
+        worker = DistributedWorker(args.config, stages)
+        worker.start()
+        try:
+            while True:
+                time.sleep(60)
+        except KeyboardInterrupt:
+            logger.info("Stopping reel workers...")
+            worker.stop()
+
+    else:
+        queue = get_job_queue(config)
+        for key, n in sorted(queue.counts().items()):
+            print(f"{key:20s} {n:5d}")
+        print()
+        for job in queue.list_jobs():
+            updated = datetime.fromtimestamp(job['updated_at']).strftime('%Y-%m-%d %H:%M')
+            owner = job['lease_owner'] or ""
+            print(f"{job['id']:5d}  {job['stage']:8s} {job['status']:8s} {job['attempts']:2d}  {updated}  {owner}")
+
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+import json
+import os
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+from utils.logger import setup_logger
+
+logger = setup_logger("encode_profiles")
+
+
+# Speed/quality tiers. encode_ratio (encode seconds per output second) and
+# bitrate_kbps are starting estimates, replaced by measurements over time.
+DEFAULT_TIERS = {
+    "draft": {"preset": "veryfast", "crf": 28, "encode_ratio": 0.6, "bitrate_kbps": 2500},
+    "standard": {"preset": "medium", "crf": 23, "encode_ratio": 1.5, "bitrate_kbps": 4500},
+    "archival": {"preset": "slow", "crf": 18, "encode_ratio": 4.0, "bitrate_kbps": 8000},
+}
+
+# Best quality first
+TIER_ORDER = ["archival", "standard", "draft"]
+
+
+class EncodeProfiles:
+    """
+    Encode tiers with bitrate/size targets and a deadline-aware tier picker
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        encode_config = config.get('encode', {})
+
+        self.tiers = {name: dict(tier) for name, tier in DEFAULT_TIERS.items()}
+        for name, overrides in encode_config.get('tiers', {}).items():
+            self.tiers.setdefault(name, dict(DEFAULT_TIERS['standard'])).update(overrides)
+
+        self.default_tier = encode_config.get('default_tier', 'standard')
+        self.mode = encode_config.get('mode', 'capped_crf')
+        self.target_size_mb = encode_config.get('target_size_mb')
+        self.max_bitrate_kbps = encode_config.get('max_bitrate_kbps')
+        self.audio_bitrate_kbps = encode_config.get('audio_bitrate_kbps', 192)
+        self.default_upload_mbps = encode_config.get('upload_mbps', 5.0)
+
+        self.stats_file = os.path.join(config['paths']['output'], "encode_stats.json")
+        self._lock = threading.Lock()
+        self.stats = self._load_stats()
+
+    def _load_stats(self) -> Dict:
+        """Load measured encode and upload stats"""
+        if os.path.exists(self.stats_file):
+            try:
+                with open(self.stats_file, 'r') as f:
+                    return json.load(f)
+            except:
+                return {"tiers": {}, "upload": {}}
+        return {"tiers": {}, "upload": {}}
+
+    def _save_stats(self):
+        """Save measured encode and upload stats"""
+        os.makedirs(os.path.dirname(self.stats_file), exist_ok=True)
+        with open(self.stats_file, 'w') as f:
+            json.dump(self.stats, f, indent=2)
+
+    def get_tier(self, tier: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Get tier settings, falling back to the default tier
+        """
+        name = tier or self.default_tier
+        if name not in self.tiers:
+            raise ValueError(f"Unknown encode tier: {name}")
+        return self.tiers[name]
+
+    def target_bitrate_kbps(self, duration: float) -> Optional[int]:
+        """
+        Video bitrate cap from the configured file size and bitrate limits
+
+        Args:
+            duration: Output duration in seconds
+
+        Returns:
+            Video bitrate in kbps, or None when nothing is capped
+        """
+        caps = []
+        if self.max_bitrate_kbps:
+            caps.append(int(self.max_bitrate_kbps))
+        if self.target_size_mb and duration > 0:
+            total_kbps = self.target_size_mb * 8 * 1024 / duration
+            # Leave room for audio and ~2% container overhead
+            caps.append(int(total_kbps * 0.98 - self.audio_bitrate_kbps))
+        if not caps:
+            return None
+        return max(200, min(caps))
+
+    def video_args(
+            self,
+            tier: Optional[str],
+            duration: float,
+            allow_two_pass: bool = True
+    ) -> Tuple[List[str], bool]:
+        """
+        Build libx264 arguments for a tier
+
+        Args:
+            tier: Tier name (default tier if None)
+            duration: Output duration in seconds
+            allow_two_pass: Fall back to capped CRF when the caller can't
+                run two passes
+
+        Returns:
+            Tuple of ffmpeg video arguments and whether two-pass is required
+        """
+        settings = self.get_tier(tier)
+        args = ['-c:v', 'libx264', '-preset', settings['preset']]
+        bitrate = self.target_bitrate_kbps(duration)
+
+        if bitrate and self.mode == 'two_pass' and allow_two_pass:
+            args += ['-b:v', f"{bitrate}k", '-maxrate', f"{int(bitrate * 1.5)}k", '-bufsize', f"{bitrate * 2}k"]
+            return args, True
+
+        args += ['-crf', str(settings['crf'])]
+        if bitrate:
+            # Capped CRF: quality-driven, but never above the size budget
+            args += ['-maxrate', f"{bitrate}k", '-bufsize', f"{bitrate * 2}k"]
+        return args, False
+
+    def audio_args(self) -> List[str]:
+        return ['-c:a', 'aac', '-b:a', f"{self.audio_bitrate_kbps}k"]
+
+    def upload_mbps(self) -> float:
+        """
+        Measured upstream bandwidth in Mbit/s, or the configured default
+        """
+        return self.stats.get('upload', {}).get('mbps', self.default_upload_mbps)
+
+    def estimate(self, tier: str, duration: float) -> Dict[str, float]:
+        """
+        Estimate encode and upload seconds for a tier
+
+        Args:
+            tier: Tier name
+            duration: Output duration in seconds
+
+        Returns:
+            Dict with encode_seconds, upload_seconds, size_mb and total_seconds
+        """
+        settings = self.get_tier(tier)
+        measured = self.stats.get('tiers', {}).get(tier, {})
+
+        encode_ratio = measured.get('encode_ratio', settings['encode_ratio'])
+        bitrate = measured.get('bitrate_kbps', settings['bitrate_kbps'])
+        cap = self.target_bitrate_kbps(duration)
+        if cap:
+            bitrate = min(bitrate, cap)
+
+        size_mb = (bitrate + self.audio_bitrate_kbps) * duration / 8 / 1024
+        encode_seconds = encode_ratio * duration
+        upload_seconds = size_mb * 8 / self.upload_mbps()
+
+        return {
+            "encode_seconds": encode_seconds,
+            "upload_seconds": upload_seconds,
+            "size_mb": size_mb,
+            "total_seconds": encode_seconds + upload_seconds
+        }
+
+    def choose_tier(self, duration: float, deadline_seconds: Optional[float] = None) -> str:
+        """
+        Pick the best-quality tier whose encode plus upload fits the deadline
+
+        Without a deadline the default tier is used. If no tier fits, the
+        one with the shortest estimated total is returned.
+
+        Args:
+            duration: Output duration in seconds
+            deadline_seconds: Time budget for encode and upload
+
+        Returns:
+            Tier name
+        """
+        if deadline_seconds is None:
+            return self.default_tier
+
+        # Pick up measurements recorded by other components/processes
+        self.stats = self._load_stats()
+
+        estimates = {
+            name: self.estimate(name, duration)
+            for name in TIER_ORDER if name in self.tiers
+        }
+
+        for name, est in estimates.items():
+            if est['total_seconds'] <= deadline_seconds:
+                logger.info(
+                    f"Encode tier '{name}': ~{est['encode_seconds']:.0f}s encode + "
+                    f"~{est['upload_seconds']:.0f}s upload ({est['size_mb']:.1f} MB) "
+                    f"within {deadline_seconds:.0f}s"
+                )
+                return name
+
+        fastest = min(estimates, key=lambda n: estimates[n]['total_seconds'])
+        logger.warning(
+            f"No encode tier fits {deadline_seconds:.0f}s deadline, using '{fastest}' "
+            f"(~{estimates[fastest]['total_seconds']:.0f}s)"
+        )
+        return fastest
+
+    def record_encode(self, tier: str, duration: float, encode_seconds: Optional[float], output_path: str):
+        """
+        Fold a measured encode into the tier's speed and bitrate estimates
+
+        Args:
+            tier: Tier the output was encoded with
+            duration: Reel duration in seconds
+            encode_seconds: Wall time of the encode, or None when it can't
+                be attributed to this output alone (only the bitrate is
+                learned then)
+            output_path: Encoded file
+        """
+        if duration <= 0 or not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
+            return
+
+        bitrate = os.path.getsize(output_path) * 8 / 1024 / duration - self.audio_bitrate_kbps
+
+        with self._lock:
+            measured = self.stats.setdefault('tiers', {}).setdefault(tier, {})
+            if encode_seconds is not None:
+                measured['encode_ratio'] = self._ewma(measured.get('encode_ratio'), encode_seconds / duration)
+            measured['bitrate_kbps'] = self._ewma(measured.get('bitrate_kbps'), max(bitrate, 0))
+            self._save_stats()
+
+    def record_upload(self, size_bytes: int, upload_seconds: float):
+        """
+        Fold a measured upload into the bandwidth estimate
+        """
+        if upload_seconds <= 0 or size_bytes <= 0:
+            return
+
+        mbps = size_bytes * 8 / (1024 * 1024) / upload_seconds
+
+        with self._lock:
+            upload = self.stats.setdefault('upload', {})
+            upload['mbps'] = self._ewma(upload.get('mbps'), mbps)
+            self._save_stats()
+
+        logger.info(f"Measured upload bandwidth: {mbps:.2f} Mbit/s")
+
+    @staticmethod
+    def _ewma(previous: Optional[float], value: float, alpha: float = 0.3) -> float:
+        if previous is None:
+            return round(value, 3)
+        return round(previous * (1 - alpha) + value * alpha, 3)
@@ -0,0 +1,198 @@
+import os
+import mmap
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Any, List, Optional, Iterable, Callable
+from rate_limiter import get_rate_limiter
+from utils.logger import setup_logger
+
+logger = setup_logger("fanout_publisher")
+
+DEFAULT_CAPTION_TEMPLATE = "{title}\n\n{description}\n\n#PocketFM #Shorts #DramaStory #Reels #Viral"
+
+
+class FanoutPublisher:
+    """
+    Publish one reel to several accounts/platforms concurrently
+    """
+
+    def __init__(self, config: Dict[str, Any], publisher=None):
+        publish_config = config.get('publish', {})
+
+        self.config = config
+        self.publisher = publisher
+        self.targets = publish_config.get('targets', [])
+        self.max_workers = publish_config.get('fanout_workers', max(1, len(self.targets)))
+        self.limiter = get_rate_limiter(config)
+        for target in self.targets:
+            limits = self.target_limits(target)
+            if limits:
+                self.limiter.set_limits(self.provider(target), limits)
+
+    @staticmethod
+    def provider(target: Dict[str, Any]) -> str:
+        """
+        Rate limiter provider holding a target's bucket
+        """
+        return f"socialbu:{target['name']}"
+
+    @staticmethod
+    def target_limits(target: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Token bucket for a target's min_interval_seconds and max_per_hour
+
+        Posts are spaced evenly by whichever is stricter, e.g. max_per_hour
+        4 allows one post every 15 minutes.
+        """
+        interval = target.get('min_interval_seconds', 0)
+        if target.get('max_per_hour'):
+            interval = max(interval, 3600 / target['max_per_hour'])
+        if not interval:
+            return None
+        return {"rate_per_minute": 60 / interval, "burst": 1}
+
+    def _get_publisher(self):
+        if self.publisher is None:
+            from post_engine import PostEngine
+            self.publisher = PostEngine(self.config)
+        return self.publisher
+
+    def publish(
+            self,
+            video_path: str,
+            title: str,
+            description: str,
+            extra: Optional[Dict[str, Any]] = None,
+            skip: Iterable[str] = (),
+            max_wait: Optional[float] = None,
+            on_result: Optional[Callable[[str, Dict[str, Any]], None]] = None
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Upload a video to every configured target at once
+
+        The file is memory-mapped once and every upload streams its request
+        body from the same read-only view, so no upload copies the video.
+        Uploads don't take the shared socialbu limiter slot: they run
+        fanout_workers at a time, paced per target by min_interval_seconds
+        and max_per_hour, so total time stays close to the slowest target.
+        The per-target buckets live in the shared rate limiter, so the
+        pacing holds across runs and processes, and a SocialBu-wide block
+        (429 Retry-After) still holds every upload back.
+
+        Args:
+            video_path: Path to final video
+            title: Post title
+            description: Post description
+            extra: Additional fields for the caption templates (e.g. genre)
+            skip: Target names already published (for retries)
+            max_wait: Longest a target may wait on its rate limit; targets
+                limited for longer are left out and marked deferred with
+                retry_in seconds (default: wait as long as it takes)
+            on_result: Called with (name, result) as each target finishes
+
+        Returns:
+            Dict mapping target name to {success, result or error, seconds},
+            plus deferred and retry_in for targets left out
+        """
+        targets = [t for t in self.targets if t['name'] not in set(skip)]
+        if not targets:
+            return {}
+
+        if not os.path.exists(video_path):
+            raise FileNotFoundError(f"Video file not found: {video_path}")
+
+        logger.info(f"Publishing '{title}' to {len(targets)} target(s): {', '.join(t['name'] for t in targets)}")
+        fields = {"title": title, "description": description, **(extra or {})}
+        results = {}
+        started = time.time()
+
+        with open(video_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            media = memoryview(mm)
+            try:
+                with ThreadPoolExecutor(max_workers=min(self.max_workers, len(targets))) as pool:
+                    futures = {
+                        pool.submit(
+                            # Uploads count against the publishing run's stage
+                            contextvars.copy_context().run,
+                            self._publish_target, target, video_path, fields, media, max_wait
+                        ): target['name']
+                        for target in targets
+                    }
+                    for future in as_completed(futures):
+                        name = futures[future]
+                        results[name] = future.result()
+                        if on_result:
+                            on_result(name, results[name])
+            finally:
+                media.release()
+
+        succeeded = sum(1 for r in results.values() if r['success'])
+        deferred = sum(1 for r in results.values() if r.get('deferred'))
+        logger.info(
+            f"✓ Fan-out finished in {time.time() - started:.1f}s: "
+            f"{succeeded}/{len(results)} target(s) published"
+            + (f", {deferred} deferred by rate limits" if deferred else "")
+        )
+        return results
+
+    def _publish_target(
+            self,
+            target: Dict[str, Any],
+            video_path: str,
+            fields: Dict[str, Any],
+            media: memoryview,
+            max_wait: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        Publish to one target, never raising so the other uploads continue
+        """
+        started = time.time()
+        provider = self.provider(target)
+        try:
+            blocked = self.limiter.wait_time('socialbu')
+            if blocked > 0:
+                if max_wait is not None and blocked > max_wait:
+                    raise TimeoutError(f"SocialBu rate limited for {blocked:.0f}s")
+                logger.info(f"[{target['name']}] SocialBu rate limited, waiting {blocked:.0f}s")
+                time.sleep(blocked)
+            lease_id = self.limiter.acquire(provider, timeout=max_wait)
+
+        except TimeoutError as e:
+            retry_in = max(self.limiter.wait_time('socialbu'), self.limiter.wait_time(provider), 1.0)
+            logger.info(f"[{target['name']}] Rate limited, deferred for {retry_in:.0f}s")
+            return {
+                "success": False, "deferred": True, "retry_in": retry_in,
+                "error": str(e), "seconds": time.time() - started
+            }
+        except Exception as e:
+            logger.error(f"[{target['name']}] ❌ Publish failed: {str(e)}")
+            return {"success": False, "error": str(e), "seconds": time.time() - started}
+
+        try:
+            caption = target.get('caption_template', DEFAULT_CAPTION_TEMPLATE).format_map(
+                _DefaultDict(fields)
+            )
+            result = self._get_publisher().publish(
+                video_path,
+                caption,
+                account_id=target['account_id'],
+                post_type=target.get('post_type', 'reel'),
+                media=media,
+                shared_slot=False
+            )
+            return {"success": True, "result": result, "seconds": time.time() - started}
+
+        except Exception as e:
+            logger.error(f"[{target['name']}] ❌ Publish failed: {str(e)}")
+            return {"success": False, "error": str(e), "seconds": time.time() - started}
+
+        finally:
+            self.limiter.release(lease_id)
+
+
+class _DefaultDict(dict):
+    """Leave unknown template fields empty instead of raising"""
+
+    def __missing__(self, key):
+        return ""
@@ -1,153 +1,468 @@
-import subprocess
-import os
-from typing import Optional
-from utils.logger import setup_logger
-
-logger = setup_logger("ffmpeg_engine")
-
-
-class FFmpegEngine:
-    """
-    Video editing and composition using FFmpeg
-    """
-
-    def __init__(self, config):
-        self.resolution = config['video']['resolution']
-        self.fps = config['video']['fps']
-        self.duration = config['video']['duration']
-
-    def compose_final_video(
-            self,
-            video_path: str,
-            audio_path: str,
-            music_path: Optional[str],
-            srt_path: str,
-            output_path: str
-    ) -> str:
-        """
-        Compose final video with all elements
-
-        Args:
-            video_path: Raw video file
-            audio_path: Voice-over audio
-            music_path: Background music (optional)
-            srt_path: Subtitle file
-            output_path: Final output path
-
-        Returns:
-            Path to final video
-        """
-        try:
-            logger.info("Composing final video with FFmpeg...")
-
-            width, height = self.resolution.split('x')
-
-            # Build FFmpeg command
-            # Complex filter for: subtitles + audio mixing + effects
-
-            filter_complex = []
-
-            # Add subtle zoom/pan effect
-            filter_complex.append(
-                f"[0:v]scale={int(width) * 1.1}:{int(height) * 1.1},"
-                f"zoompan=z='min(zoom+0.0005,1.1)':d={self.fps * self.duration}:s={width}x{height},"
-                f"format=yuv420p[v]"
-            )
-
-            # Add subtitles with styling
-            subtitle_style = (
-                "FontName=Arial,FontSize=28,PrimaryColour=&H00FFFFFF,"
-                "OutlineColour=&H00000000,BorderStyle=3,Outline=2,"
-                "Shadow=1,Alignment=2,MarginV=80,Bold=1"
-            )
-
-            filter_complex.append(
-                f"[v]subtitles='{srt_path}':force_style='{subtitle_style}'[vout]"
-            )
-
-            # Audio mixing
-            if music_path and os.path.exists(music_path):
-                # Mix voice-over with background music
-                audio_filter = "[1:a]volume=1.0[voice];[2:a]volume=0.3[music];[voice][music]amix=inputs=2:duration=first[aout]"
-
-                cmd = [
-                    'ffmpeg',
-                    '-i', video_path,
-                    '-i', audio_path,
-                    '-i', music_path,
-                    '-filter_complex', ';'.join(filter_complex + [audio_filter]),
-                    '-map', '[vout]',
-                    '-map', '[aout]',
-                    '-c:v', 'libx264',
-                    '-preset', 'medium',
-                    '-crf', '23',
-                    '-c:a', 'aac',
-                    '-b:a', '192k',
-                    '-t', str(self.duration),
-                    '-y',
-                    output_path
-                ]
-            else:
-                # Just voice-over
-                cmd = [
-                    'ffmpeg',
-                    '-i', video_path,
-                    '-i', audio_path,
-                    '-filter_complex', ';'.join(filter_complex),
-                    '-map', '[vout]',
-                    '-map', '1:a',
-                    '-c:v', 'libx264',
-                    '-preset', 'medium',
-                    '-crf', '23',
-                    '-c:a', 'aac',
-                    '-b:a', '192k',
-                    '-t', str(self.duration),
-                    '-y',
-                    output_path
-                ]
-
-            logger.info(f"Running FFmpeg command...")
-            logger.debug(f"Command: {' '.join(cmd)}")
-
-            result = subprocess.run(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                timeout=300
-            )
-
-            if result.returncode != 0:
-                logger.error(f"FFmpeg error: {result.stderr}")
-                raise Exception(f"FFmpeg failed with code {result.returncode}")
-
-            if os.path.exists(output_path):
-                logger.info(f"✓ Final video created: {output_path}")
-                return output_path
-            else:
-                raise Exception("Output video not created")
-
-        except Exception as e:
-            logger.error(f"Error composing video: {str(e)}")
-            raise
-
-    def add_intro_outro(self, video_path: str, output_path: str) -> str:
-        """
-        Add fade in/out effects
-        """
-        try:
-            cmd = [
-                'ffmpeg',
-                '-i', video_path,
-                '-vf', 'fade=t=in:st=0:d=0.5,fade=t=out:st=29.5:d=0.5',
-                '-c:a', 'copy',
-                '-y',
-                output_path
-            ]
-
-            subprocess.run(cmd, check=True, timeout=120)
-            return output_path
-
-        except Exception as e:
-            logger.error(f"Error adding intro/outro: {str(e)}")
-            return video_path
\ No newline at end of file
+import os
+import time
+from typing import Optional, Dict, Any, List
+from utils.logger import setup_logger
+from media_probe import MediaProbe
+from encode_profiles import EncodeProfiles
+from caption_engine import FontCache
+from music_stems import is_stem
+from resource_accounting import run_subprocess
+
+logger = setup_logger("ffmpeg_engine")
+
+
+class FFmpegEngine:
+    """
+    Video editing and composition using FFmpeg
+    """
+
+    def __init__(self, config):
+        self.resolution = config['video']['resolution']
+        self.fps = config['video']['fps']
+        self.duration = config['video']['duration']
+        self.end_padding = config['video'].get('end_padding', 1.0)
+        self.fade_duration = config['video'].get('fade_duration', 0.5)
+        self.music_fade_out = config.get('music_stems', {}).get('fade_out_seconds', 1.0)
+        self.thumbnail_time = config['video'].get('thumbnail_time', 1.0)
+        self.probe = MediaProbe(config)
+        self.profiles = EncodeProfiles(config)
+        self.fonts = FontCache(config)
+
+    def compose_final_video(
+            self,
+            video_path: str,
+            audio_path: str,
+            music_path: Optional[str],
+            srt_path: str,
+            output_path: str,
+            tier: Optional[str] = None
+    ) -> str:
+        """
+        Compose final video with all elements, fades included
+
+        Args:
+            video_path: Raw video file
+            audio_path: Voice-over audio
+            music_path: Background music (optional)
+            srt_path: Subtitle file
+            output_path: Final output path
+            tier: Encode tier (draft, standard, archival), default tier if None
+
+        Returns:
+            Path to final video
+        """
+        try:
+            logger.info("Composing final video with FFmpeg...")
+
+            duration = self.get_output_duration(video_path, audio_path)
+            has_music = bool(music_path and os.path.exists(music_path))
+
+            # Build FFmpeg command
+            # Complex filter for: subtitles + audio mixing + effects
+            cmd = self._input_args(video_path, audio_path, music_path if has_music else None, duration)
+
+            # Fades go in the same chain, so the reel is encoded once with
+            # the tier's settings
+            fade = min(self.fade_duration, duration / 4)
+            filter_complex = [
+                self._video_filter(video_path, duration) + "," +
+                self._subtitle_filter(srt_path) +
+                f",fade=t=in:st=0:d={fade:.3f},fade=t=out:st={max(0.0, duration - fade):.3f}:d={fade:.3f}[vout]"
+            ]
+
+            # Audio mixing
+            if has_music:
+                # Mix voice-over with background music
+                filter_complex.append(self._music_mix_filter(music_path, duration) + "[aout]")
+                audio_map = '[aout]'
+                audio_codec = self.profiles.audio_args()
+            else:
+                # Just voice-over
+                audio_map = '1:a'
+                audio_codec = self._voice_audio_codec(audio_path)
+
+            video_codec, two_pass = self.profiles.video_args(tier, duration)
+            started = time.time()
+
+            if two_pass:
+                # First pass only needs the video chain
+                passlog = os.path.splitext(output_path)[0] + "_2pass"
+                self._run(
+                    cmd + [
+                        '-filter_complex', filter_complex[0],
+                        '-map', '[vout]'
+                    ] + video_codec + [
+                        '-pass', '1',
+                        '-passlogfile', passlog,
+                        '-an',
+                        '-t', f"{duration:.3f}",
+                        '-f', 'null',
+                        '-y',
+                        os.devnull
+                    ],
+                    timeout=300
+                )
+                video_codec += ['-pass', '2', '-passlogfile', passlog]
+
+            cmd += [
+                '-filter_complex', ';'.join(filter_complex),
+                '-map', '[vout]',
+                '-map', audio_map
+            ] + video_codec + audio_codec + [
+                '-t', f"{duration:.3f}",
+                '-movflags', '+faststart',
+                '-y',
+                output_path
+            ]
+
+            try:
+                self._run(cmd, timeout=300)
+            finally:
+                if two_pass:
+                    self._remove_passlogs(passlog)
+
+            self.profiles.record_encode(
+                tier or self.profiles.default_tier, duration, time.time() - started, output_path
+            )
+
+            if os.path.exists(output_path):
+                logger.info(f"✓ Final video created: {output_path}")
+                return output_path
+            else:
+                raise Exception("Output video not created")
+
+        except Exception as e:
+            logger.error(f"Error composing video: {str(e)}")
+            raise
+
+    def compose_variants(
+            self,
+            video_path: str,
+            audio_path: str,
+            music_path: Optional[str],
+            srt_path: str,
+            output_base: str,
+            variants: List[Dict[str, Any]],
+            thumbnail_path: Optional[str] = None,
+            tier: Optional[str] = None
+    ) -> Dict[str, str]:
+        """
+        Compose several output variants from a single decode
+
+        The raw clip is decoded and run through the zoom, subtitle and fade
+        chain once, then split into one encoder per variant inside the same
+        FFmpeg process. An optional cover frame is taken from the same pass.
+
+        Args:
+            video_path: Raw video file
+            audio_path: Voice-over audio
+            music_path: Background music (optional)
+            srt_path: Subtitle file
+            output_base: Output path without extension, variant names are appended
+            variants: List of dicts with name, resolution and optional crf,
+                maxrate, preset and audio_bitrate
+            thumbnail_path: Where to save the cover frame (optional)
+            tier: Encode tier for the first (published) variant; the others
+                fall back to the tier preset when they don't set their own
+
+        Returns:
+            Dict mapping variant name (and "thumbnail") to output path
+        """
+        try:
+            logger.info(f"Composing {len(variants)} video variants in one pass...")
+
+            duration = self.get_output_duration(video_path, audio_path)
+            has_music = bool(music_path and os.path.exists(music_path))
+            width, height = (int(x) for x in self.resolution.split('x'))
+
+            cmd = self._input_args(video_path, audio_path, music_path if has_music else None, duration)
+
+            # Shared chain: zoom, fades and a split per output. The cover
+            # frame branches off before the captions are burned in.
+            branches = len(variants) + (1 if thumbnail_path else 0)
+            fade = min(self.fade_duration, duration / 4)
+            shared = self._video_filter(video_path, duration)
+            if thumbnail_path:
+                shared += ",split=2[vclean][vthumb];[vclean]"
+            else:
+                shared += ","
+            shared += (
+                self._subtitle_filter(srt_path) +
+                f",fade=t=in:st=0:d={fade:.3f},fade=t=out:st={max(0.0, duration - fade):.3f}:d={fade:.3f}"
+            )
+
+            labels = [f"[v{i}]" for i in range(len(variants))]
+            filter_complex = [shared + f",split={len(variants)}" + ''.join(labels)]
+
+            for i, variant in enumerate(variants):
+                out_w, out_h = (int(x) for x in variant['resolution'].split('x'))
+                filter_complex.append(
+                    f"[v{i}]{self._fit_filter(width, height, out_w, out_h)}[vout{i}]"
+                )
+
+            if has_music:
+                filter_complex.append(
+                    self._music_mix_filter(music_path, duration) +
+                    f",asplit={len(variants)}" + ''.join(f"[a{i}]" for i in range(len(variants)))
+                )
+
+            if thumbnail_path:
+                thumb_at = min(self.thumbnail_time, duration / 2)
+                filter_complex.append(f"[vthumb]select='gte(t,{thumb_at:.3f})'[thumb]")
+
+            cmd += ['-filter_complex', ';'.join(filter_complex)]
+
+            outputs = {}
+            for i, variant in enumerate(variants):
+                output_path = f"{output_base}_{variant['name']}.mp4"
+
+                if i == 0 and not variant.get('crf'):
+                    # Published variant follows the encode profile. Two-pass
+                    # doesn't fit a shared decode, so it runs as capped CRF.
+                    video_codec, _ = self.profiles.video_args(tier, duration, allow_two_pass=False)
+                else:
+                    video_codec = [
+                        '-c:v', 'libx264',
+                        '-preset', variant.get('preset', self.profiles.get_tier(tier)['preset']),
+                        '-crf', str(variant.get('crf', 23))
+                    ]
+                    if variant.get('maxrate'):
+                        video_codec += ['-maxrate', variant['maxrate'], '-bufsize', variant.get('bufsize', variant['maxrate'])]
+
+                if has_music:
+                    audio_map = f'[a{i}]'
+                    audio_codec = ['-c:a', 'aac', '-b:a', variant.get('audio_bitrate', '192k')]
+                elif variant.get('audio_bitrate'):
+                    audio_map = '1:a'
+                    audio_codec = ['-c:a', 'aac', '-b:a', variant['audio_bitrate']]
+                else:
+                    audio_map = '1:a'
+                    audio_codec = self._voice_audio_codec(audio_path)
+
+                cmd += [
+                    '-map', f'[vout{i}]',
+                    '-map', audio_map
+                ] + video_codec + audio_codec + [
+                    '-t', f"{duration:.3f}",
+                    '-movflags', '+faststart',
+                    '-y',
+                    output_path
+                ]
+                outputs[variant['name']] = output_path
+
+            if thumbnail_path:
+                cmd += [
+                    '-map', '[thumb]',
+                    '-frames:v', '1',
+                    '-q:v', '2',
+                    '-y',
+                    thumbnail_path
+                ]
+
+            started = time.time()
+            self._run(cmd, timeout=300 * len(variants))
+
+            for name, output_path in outputs.items():
+                if not os.path.exists(output_path):
+                    raise Exception(f"Output variant not created: {name}")
+                logger.info(f"✓ Variant '{name}' created: {output_path}")
+
+            # The wall time covers every variant, so it only says how fast
+            # the tier encodes when there was just the one
+            self.profiles.record_encode(
+                tier or self.profiles.default_tier,
+                duration,
+                time.time() - started if len(variants) == 1 else None,
+                outputs[variants[0]['name']]
+            )
+
+            if thumbnail_path and os.path.exists(thumbnail_path):
+                logger.info(f"✓ Thumbnail created: {thumbnail_path}")
+                outputs['thumbnail'] = thumbnail_path
+
+            return outputs
+
+        except Exception as e:
+            logger.error(f"Error composing variants: {str(e)}")
+            raise
+
+    def _input_args(
+            self,
+            video_path: str,
+            audio_path: str,
+            music_path: Optional[str],
+            duration: float
+    ) -> List[str]:
+        """
+        Build the ffmpeg input arguments shared by every compose mode
+        """
+        cmd = ['ffmpeg']
+
+        # Loop the clip when the narration runs longer than the video
+        video_duration = self.probe.duration(video_path)
+        if video_duration and video_duration < duration:
+            logger.info(f"Looping {video_duration:.1f}s raw video to fill {duration:.1f}s")
+            cmd += ['-stream_loop', '-1']
+
+        cmd += ['-i', video_path, '-i', audio_path]
+
+        if music_path:
+            # Looped so a track shorter than the reel still covers it
+            cmd += ['-stream_loop', '-1', '-i', music_path]
+
+        return cmd
+
+    def _video_filter(self, video_path: str, duration: float) -> str:
+        """
+        Build the zoom/pan chain for the raw clip, without output label
+        """
+        width, height = self.resolution.split('x')
+        video_info = self.probe.video_info(video_path) or {}
+
+        # Pre-scale only when the clip doesn't already match the target,
+        # zoompan resamples to the output size either way
+        if self._matches_resolution(video_info):
+            logger.info("Raw video already at target resolution, skipping scale")
+            video_chain = "[0:v]"
+        else:
+            video_chain = f"[0:v]scale={int(width) * 1.1}:{int(height) * 1.1},"
+
+        # Add subtle zoom/pan effect
+        return (
+            f"{video_chain}"
+            f"zoompan=z='min(zoom+0.0005,1.1)':d={int(self.fps * duration)}:s={width}x{height}:fps={self.fps},"
+            f"format=yuv420p"
+        )
+
+    def _subtitle_filter(self, srt_path: str) -> str:
+        """
+        Burn in subtitles with styling
+
+        ASS files carry their own styles and are rendered with the bundled
+        fonts; SRT files go through the generic subtitles filter.
+        """
+        if srt_path.endswith('.ass'):
+            self.fonts.check_font()
+            subtitle_filter = f"ass={self._escape_filter_value(srt_path)}"
+            if self.fonts.has_fonts():
+                subtitle_filter += f":fontsdir={self._escape_filter_value(self.fonts.fonts_dir)}"
+            return subtitle_filter
+
+        subtitle_style = (
+            "FontName=Arial,FontSize=28,PrimaryColour=&H00FFFFFF,"
+            "OutlineColour=&H00000000,BorderStyle=3,Outline=2,"
+            "Shadow=1,Alignment=2,MarginV=80,Bold=1"
+        )
+
+        return f"subtitles='{srt_path}':force_style='{subtitle_style}'"
+
+    def _music_mix_filter(self, music_path: str, duration: float) -> str:
+        """
+        Mix voice-over with background music, without output label
+
+        The music is cut at the reel's length and fades out over its last
+        fade_out_seconds. The voice is padded with silence so the mix runs
+        to the end of the reel, past the last word, and the fade is heard.
+        Prepared stems are already levelled and at the output sample rate.
+        """
+        fade = min(self.music_fade_out, duration / 4)
+        music = f"atrim=0:{duration:.3f},afade=t=out:st={max(0.0, duration - fade):.3f}:d={fade:.3f}"
+        if is_stem(music_path):
+            return f"[1:a]apad[voice];[2:a]{music}[music];[voice][music]amix=inputs=2:duration=shortest"
+        return (
+            f"[1:a]volume=1.0,apad[voice];[2:a]volume=0.3,{music}[music];"
+            "[voice][music]amix=inputs=2:duration=shortest"
+        )
+
+    @staticmethod
+    def _fit_filter(width: int, height: int, out_w: int, out_h: int) -> str:
+        """
+        Center-crop to the output aspect ratio and scale to the output size
+        """
+        crop_w = min(width, round(height * out_w / out_h))
+        crop_h = min(height, round(width * out_h / out_w))
+        chain = []
+        if (crop_w, crop_h) != (width, height):
+            chain.append(f"crop={crop_w}:{crop_h}")
+        if (out_w, out_h) != (crop_w, crop_h):
+            chain.append(f"scale={out_w}:{out_h}")
+        return ','.join(chain) or "null"
+
+    def _run(self, cmd: List[str], timeout: int):
+        """
+        Run an ffmpeg command, raising on failure
+        """
+        logger.info(f"Running FFmpeg command...")
+        logger.debug(f"Command: {' '.join(cmd)}")
+
+        result = run_subprocess(cmd, timeout=timeout, env={**os.environ, **self.fonts.warm()})
+
+        if result.returncode != 0:
+            logger.error(f"FFmpeg error: {result.stderr}")
+            raise Exception(f"FFmpeg failed with code {result.returncode}")
+
+    def get_output_duration(self, video_path: str, audio_path: str) -> float:
+        """
+        Work out the final reel length from the real input durations
+
+        The voice-over drives the length, with a short tail so the last
+        word isn't cut by the fade. Falls back to the configured duration
+        when the inputs can't be probed.
+
+        Args:
+            video_path: Raw video file
+            audio_path: Voice-over audio
+
+        Returns:
+            Output duration in seconds
+        """
+        voice_duration = self.probe.duration(audio_path)
+        if voice_duration:
+            return voice_duration + self.end_padding
+
+        video_duration = self.probe.duration(video_path)
+        if video_duration:
+            return min(video_duration, float(self.duration))
+
+        return float(self.duration)
+
+    def _matches_resolution(self, video_info: Dict[str, Any]) -> bool:
+        """
+        Check whether a probed video stream is already at output size
+        """
+        width, height = self.resolution.split('x')
+        return (
+            video_info.get('width') == int(width) and
+            video_info.get('height') == int(height)
+        )
+
+    def _voice_audio_codec(self, audio_path: str) -> List[str]:
+        """
+        Stream-copy the voice-over when it's already AAC, otherwise encode
+        """
+        audio_info = self.probe.audio_info(audio_path) or {}
+        if audio_info.get('codec') == 'aac':
+            logger.info("Voice-over already AAC, copying audio stream")
+            return ['-c:a', 'copy']
+        return self.profiles.audio_args()
+
+    @staticmethod
+    def _escape_filter_value(value: str) -> str:
+        """
+        Escape a filter option value for use inside -filter_complex
+
+        Applies both FFmpeg escaping levels (option value, then filtergraph)
+        so paths with quotes, colons or brackets survive intact.
+        """
+        value = value.replace('\\', '/')
+        value = ''.join('\\' + c if c in "\\':" else c for c in value)
+        return ''.join('\\' + c if c in "\\'[],;" else c for c in value)
+
+    @staticmethod
+    def _remove_passlogs(passlog: str):
+        """
+        Remove x264 two-pass log files
+        """
+        for suffix in ('-0.log', '-0.log.mbtree'):
+            if os.path.exists(passlog + suffix):
+                os.remove(passlog + suffix)
@@ -1,191 +1,652 @@
-import os
-import sys
-import yaml
-import traceback
-from datetime import datetime
-from pathlib import Path
-
-from utils.logger import setup_logger
-from groc_client import GrocClient
-from sora_client import SoraClient
-from voice_engine import VoiceEngine
-from music_engine import MusicEngine
-from caption_engine import CaptionEngine
-from ffmpeg_engine import FFmpegEngine
-from post_engine import PostEngine
-from story_engine import StoryEngine
-
-logger = setup_logger("main")
-
-
-class ReelAutomationBot:
-    """
-    Main orchestrator for AI Reel Automation
-    """
-
-    def __init__(self, config_path: str = "settings.yaml"):
-        logger.info("=" * 60)
-        logger.info("AI Reel Automation Bot Starting")
-        logger.info("=" * 60)
-
-        # Load configuration
-        with open(config_path, 'r') as f:
-            self.config = yaml.safe_load(f)
-
-        # Create output directories
-        self._setup_directories()
-
-        # Initialize components
-        self.groc = GrocClient(self.config)
-        self.sora = SoraClient(self.config)
-        self.voice = VoiceEngine(self.config)
-        self.music = MusicEngine(self.config)
-        self.captions = CaptionEngine()
-        self.ffmpeg = FFmpegEngine(self.config)
-        self.publisher = PostEngine(self.config)
-        self.story_engine = StoryEngine(self.config)
-
-        logger.info("✓ All components initialized")
-
-    def _setup_directories(self):
-        """Create necessary directories"""
-        for path in self.config['paths'].values():
-            Path(path).mkdir(parents=True, exist_ok=True)
-
-    def generate_reel(self) -> Dict:
-        """
-        Complete pipeline to generate one reel
-
-        Returns:
-            Dict with generation results
-        """
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-
-        try:
-            logger.info("\n" + "=" * 60)
-            logger.info("STARTING NEW REEL GENERATION")
-            logger.info("=" * 60)
-
-            # Step 1: Select genre and generate story
-            genre = self.story_engine.get_next_genre()
-            recent_themes = self.story_engine.get_recent_themes()
-
-            story_data = self.groc.generate_story_script(genre, recent_themes)
-            story_data['genre'] = genre
-
-            logger.info(f"\n📖 Story: {story_data['title']}")
-            logger.info(f"Genre: {genre}")
-            logger.info(f"Theme: {story_data['theme']}")
-
-            # Step 2: Generate video with Sora
-            raw_video_path = os.path.join(
-                self.config['paths']['raw_videos'],
-                f"raw_{timestamp}.mp4"
-            )
-
-            self.sora.generate_video(story_data['visual_prompt'], raw_video_path)
-
-            # Step 3: Generate voice-over
-            voice_path = os.path.join(
-                self.config['paths']['voice'],
-                f"voice_{timestamp}.mp3"
-            )
-
-            self.voice.generate_voiceover(story_data['script'], voice_path)
-
-            # Step 4: Get background music
-            music_path = os.path.join(
-                self.config['paths']['music'],
-                f"music_{timestamp}.mp3"
-            )
-
-            music_file = self.music.get_background_music(genre, music_path)
-
-            # Step 5: Generate captions
-            srt_path = os.path.join(
-                self.config['paths']['voice'],
-                f"captions_{timestamp}.srt"
-            )
-
-            self.captions.generate_srt(
-                story_data['script'],
-                srt_path,
-                self.config['video']['duration']
-            )
-
-            # Step 6: Compose final video
-            temp_video_path = os.path.join(
-                self.config['paths']['final_videos'],
-                f"temp_{timestamp}.mp4"
-            )
-
-            self.ffmpeg.compose_final_video(
-                raw_video_path,
-                voice_path,
-                music_file,
-                srt_path,
-                temp_video_path
-            )
-
-            # Step 7: Add fade effects
-            final_video_path = os.path.join(
-                self.config['paths']['final_videos'],
-                f"final_{timestamp}.mp4"
-            )
-
-            self.ffmpeg.add_intro_outro(temp_video_path, final_video_path)
-
-            # Step 8: Publish to social media
-            self.publisher.publish_to_facebook(
-                final_video_path,
-                story_data['title'],
-                story_data['script'][:100] + "..."
-            )
-
-            # Record in history
-            story_data['video_path'] = final_video_path
-            self.story_engine.record_story(story_data)
-
-            logger.info("\n" + "=" * 60)
-            logger.info("✓ REEL GENERATION COMPLETE")
-            logger.info("=" * 60)
-
-            return {
-                "success": True,
-                "video_path": final_video_path,
-                "title": story_data['title'],
-                "genre": genre
-            }
-
-        except Exception as e:
-            logger.error(f"\n❌ REEL GENERATION FAILED")
-            logger.error(f"Error: {str(e)}")
-            logger.error(traceback.format_exc())
-
-            return {
-                "success": False,
-                "error": str(e)
-            }
-
-
-def main():
-    """Main entry point"""
-    try:
-        bot = ReelAutomationBot()
-        result = bot.generate_reel()
-
-        if result['success']:
-            logger.info(f"\n✅ SUCCESS: {result['title']}")
-            sys.exit(0)
-        else:
-            logger.error(f"\n❌ FAILED: {result['error']}")
-            sys.exit(1)
-
-    except Exception as e:
-        logger.error(f"Critical error: {str(e)}")
-        logger.error(traceback.format_exc())
-        sys.exit(1)
-
-
-if __name__ == "__main__":
+import time
+
+_import_started = time.perf_counter()
+
+import os
+import sys
+import json
+import yaml
+import argparse
+import importlib
+import threading
+import traceback
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+from utils.logger import setup_logger, configure_logging, log_context
+
+logger = setup_logger("main")
+
+_import_seconds = time.perf_counter() - _import_started
+
+# Pipeline stages in order; each maps to a ReelAutomationBot._stage_* method
+STAGES = ["story", "video", "audio", "compose", "publish"]
+
+# Bot components: attribute -> (module, class). Each is imported and built
+# the first time it's used, so a run only pays for the stages it executes
+# and short commands (history, dry runs) start without loading any client.
+COMPONENTS = {
+    "groc": ("groc_client", "GrocClient"),
+    "sora": ("sora_client", "SoraClient"),
+    "voice": ("voice_engine", "VoiceEngine"),
+    "music": ("music_engine", "MusicEngine"),
+    "captions": ("caption_engine", "CaptionEngine"),
+    "ffmpeg": ("ffmpeg_engine", "FFmpegEngine"),
+    "publisher": ("post_engine", "PostEngine"),
+    "story_engine": ("story_engine", "StoryEngine"),
+    "storage": ("storage_manager", "StorageManager"),
+    "publish_queue": ("publish_queue", "PublishQueue"),
+    "fanout": ("fanout_publisher", "FanoutPublisher"),
+    "timings": ("stage_timings", "StageTimings"),
+    "music_stems": ("music_stems", "MusicStemCache"),
+    "accounting": ("resource_accounting", "ResourceAccounting"),
+}
+
+
+class ReelAutomationBot:
+    """
+    Main orchestrator for AI Reel Automation
+    """
+
+    def __init__(self, config_path: str = "settings.yaml"):
+        logger.info("=" * 60)
+        logger.info("AI Reel Automation Bot Starting")
+        logger.info("=" * 60)
+
+        # Load configuration
+        with open(config_path, 'r') as f:
+            self.config = yaml.safe_load(f)
+        configure_logging(self.config)
+
+        # Create output directories
+        self._setup_directories()
+
+        # Components are built on first use, see COMPONENTS
+        self._components_lock = threading.RLock()
+
+        logger.info("✓ Bot ready")
+
+    def __getattr__(self, name: str):
+        # Only called for attributes not set yet: build lazy components
+        if name not in COMPONENTS:
+            raise AttributeError(f"{type(self).__name__!r} object has no attribute {name!r}")
+        return self.component(name)
+
+    def component(self, name: str) -> Any:
+        """
+        Get a component, importing its module and building it on first use
+
+        Args:
+            name: Attribute name from COMPONENTS
+
+        Returns:
+            The component instance (also set as the attribute)
+        """
+        with self._components_lock:
+            if name in self.__dict__:
+                return self.__dict__[name]
+
+            module_name, class_name = COMPONENTS[name]
+            # The fan-out publisher builds its own blocking PostEngine when
+            # it first uploads, so async bots can swap self.publisher freely
+            instance = getattr(importlib.import_module(module_name), class_name)(self.config)
+            setattr(self, name, instance)
+            return instance
+
+    def profile_startup(self) -> List[Dict[str, Any]]:
+        """
+        Import and build every component, timing each
+
+        Import time is what loading the module added on top of modules
+        already loaded (shared dependencies count toward the first
+        component that needs them).
+
+        Returns:
+            Per-component dicts with module, import_seconds, init_seconds
+            and error (None unless the component failed to load)
+        """
+        profile = []
+        for name, (module_name, _) in COMPONENTS.items():
+            if name in self.__dict__:
+                continue
+
+            error = None
+            started = time.perf_counter()
+            imported = started
+            try:
+                importlib.import_module(module_name)
+                imported = time.perf_counter()
+                self.component(name)
+            except Exception as e:
+                error = f"{type(e).__name__}: {str(e)}"
+            built = time.perf_counter()
+
+            profile.append({
+                "component": name,
+                "module": module_name,
+                "import_seconds": imported - started,
+                "init_seconds": built - imported,
+                "error": error
+            })
+        return profile
+
+    def dry_run(self) -> Dict[str, Any]:
+        """
+        What the next run would do, without calling any API
+
+        Returns:
+            Dict with the next genre, Sora quota left, publish mode and the
+            estimated time until the reel is live
+        """
+        from rate_limiter import get_rate_limiter
+
+        return {
+            "genre": self.story_engine.get_next_genre(),
+            "sora_quota_remaining": get_rate_limiter(self.config).quota_remaining('sora'),
+            "publish_mode": self.config.get('publish', {}).get('mode', 'inline'),
+            "variants": [v['name'] for v in self.config['video'].get('variants') or []],
+            "caption_format": self.config.get('captions', {}).get('format', 'srt'),
+            "estimated_seconds": self.timings.lead_seconds()
+        }
+
+    def _setup_directories(self):
+        """Create necessary directories"""
+        for path in self.config['paths'].values():
+            Path(path).mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def new_run(
+            tier: Optional[str] = None,
+            deadline_seconds: Optional[float] = None,
+            release_at: Optional[float] = None,
+            run_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Create the state for a new reel run
+
+        The state is a plain JSON-serializable dict that every stage reads
+        from and adds to, so a run can be handed between processes.
+        """
+        return {
+            "run_id": run_id or datetime.now().strftime('%Y%m%d_%H%M%S'),
+            "started": time.time(),
+            "tier": tier,
+            "deadline_seconds": deadline_seconds,
+            "release_at": release_at
+        }
+
+    def generate_reel(
+            self,
+            tier: Optional[str] = None,
+            deadline_seconds: Optional[float] = None,
+            release_at: Optional[float] = None,
+            genre: Optional[str] = None,
+            run_id: Optional[str] = None,
+            prefetched: Optional[Dict[str, Any]] = None
+    ) -> Dict:
+        """
+        Complete pipeline to generate one reel
+
+        Args:
+            tier: Encode tier (draft, standard, archival). Chosen by the
+                encode cost model when None.
+            deadline_seconds: Time budget for the whole run, used to pick a
+                tier that leaves enough time to encode and upload
+            release_at: Unix time to publish at (queue mode only, default now)
+            genre: Genre to use instead of the next one in rotation
+            run_id: Run id (default: start time, which is only unique
+                within one process)
+            prefetched: State of a run whose story and Sora clip were
+                prepared ahead of its slot (sora_prefetch.py); only its
+                remaining stages run
+
+        Returns:
+            Dict with generation results
+        """
+        if prefetched:
+            state = {
+                **prefetched,
+                "started": time.time(),
+                "tier": tier,
+                "deadline_seconds": deadline_seconds,
+                "release_at": release_at
+            }
+        else:
+            state = self.new_run(tier, deadline_seconds, release_at, run_id=run_id)
+            if genre:
+                state['genre'] = genre
+
+        with log_context(run_id=state['run_id']):
+            return self._generate(state)
+
+    def _generate(self, state: Dict[str, Any]) -> Dict:
+        """Run every stage of a new run"""
+        try:
+            logger.info("\n" + "=" * 60)
+            logger.info("STARTING NEW REEL GENERATION")
+            logger.info("=" * 60)
+
+            for stage in STAGES:
+                if stage not in state.get('completed_stages', []):
+                    self.run_stage(stage, state)
+            self.accounting.finish_run(state, success=True)
+
+            logger.info("\n" + "=" * 60)
+            logger.info("✓ REEL GENERATION COMPLETE")
+            logger.info("=" * 60)
+
+            return self.result(state)
+
+        except Exception as e:
+            logger.error(f"\n❌ REEL GENERATION FAILED")
+            logger.error(f"Error: {str(e)}")
+            logger.error(traceback.format_exc())
+
+            self.fail_run(state)
+
+            return {
+                "success": False,
+                "error": str(e)
+            }
+
+    def run_stage(self, stage: str, state: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Run one pipeline stage, updating the run state in place
+
+        Args:
+            stage: One of STAGES
+            state: Run state from new_run() and earlier stages
+
+        Returns:
+            The updated state
+        """
+        with log_context(run_id=state['run_id'], stage=stage), self.accounting.stage(state['run_id'], stage):
+            started = time.time()
+            getattr(self, f"_stage_{stage}")(state)
+            self._record_timing(stage, state, time.time() - started)
+        state.setdefault('completed_stages', []).append(stage)
+        return state
+
+    def _record_timing(self, stage: str, state: Dict[str, Any], seconds: float):
+        """
+        Feed a stage duration into the scheduler's lead-time estimate
+        """
+        # Time spent holding a finished reel for its slot isn't work, and
+        # an inline upload is measured on its own, as the publish queue does
+        seconds -= state.pop('held_seconds', 0)
+        upload = state.pop('upload_seconds', None)
+        try:
+            if upload is not None:
+                seconds -= upload
+                self.timings.record('upload', upload)
+            self.timings.record(stage, seconds)
+        except Exception as e:
+            logger.warning(f"Could not record {stage} timing: {str(e)}")
+
+    @staticmethod
+    def _hold_seconds(state: Dict[str, Any]) -> float:
+        """
+        Seconds until the reel's release time, 0 if it can go out now
+        """
+        if not state.get('release_at'):
+            return 0.0
+        return max(0.0, state['release_at'] - time.time())
+
+    def result(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Summarize a completed run
+        """
+        return {
+            "success": True,
+            "video_path": state['final_video_path'],
+            "title": state['story_data']['title'],
+            "genre": state['genre'],
+            "publish_job": state.get('publish_job')
+        }
+
+    def fail_run(self, state: Dict[str, Any]):
+        """
+        Mark a run failed, keeping its files for debugging
+        """
+        self.storage.complete_run(state['run_id'], success=False)
+        self.accounting.finish_run(state, success=False)
+
+    def _stage_story(self, state: Dict[str, Any]):
+        """
+        Step 1: Select genre and generate story
+        """
+        from rate_limiter import get_rate_limiter
+
+        # Don't spend Groq/TTS calls on a reel Sora can't render today
+        if get_rate_limiter(self.config).quota_remaining('sora') == 0:
+            raise Exception("Sora daily quota exhausted, skipping run")
+
+        genre = state.get('genre') or self.story_engine.get_next_genre(exclude=state.get('exclude_genres'))
+        recent_themes = self.story_engine.get_recent_themes()
+
+        story_data = self.groc.generate_story_script(genre, recent_themes)
+        story_data['genre'] = genre
+
+        logger.info(f"\n📖 Story: {story_data['title']}")
+        logger.info(f"Genre: {genre}")
+        logger.info(f"Theme: {story_data['theme']}")
+
+        state['genre'] = genre
+        state['story_data'] = story_data
+
+    def _stage_video(self, state: Dict[str, Any]):
+        """
+        Step 2: Generate video with Sora
+        """
+        timestamp = state['run_id']
+
+        raw_video_path = os.path.join(
+            self.config['paths']['raw_videos'],
+            f"raw_{timestamp}.mp4"
+        )
+
+        self.sora.generate_video(state['story_data']['visual_prompt'], raw_video_path)
+        self.storage.track(timestamp, raw_video_path, "artifact")
+
+        state['raw_video_path'] = raw_video_path
+
+    def _stage_audio(self, state: Dict[str, Any]):
+        """
+        Steps 3-5: Voice-over, background music and captions
+        """
+        voice_path, music_path = self._audio_paths(state)
+
+        # Step 3: Generate voice-over
+        self.voice.generate_voiceover(state['story_data']['script'], voice_path)
+
+        # Step 4: Get background music
+        music_file = self.music.get_background_music(state['genre'], music_path)
+
+        self._finish_audio(state, voice_path, music_file)
+
+    def _audio_paths(self, state: Dict[str, Any]):
+        """
+        Voice-over and music paths for a run
+        """
+        voice_path = os.path.join(
+            self.config['paths']['voice'],
+            f"voice_{state['run_id']}.mp3"
+        )
+        music_path = os.path.join(
+            self.config['paths']['music'],
+            f"music_{state['run_id']}.mp3"
+        )
+        return voice_path, music_path
+
+    def _finish_audio(self, state: Dict[str, Any], voice_path: str, music_file: Optional[str]):
+        """
+        Step 5: Track the audio files and generate captions
+        """
+        timestamp = state['run_id']
+        story_data = state['story_data']
+
+        self.storage.track(timestamp, voice_path, "intermediate")
+        self.storage.track(timestamp, music_file, "intermediate")
+
+        # Step 5: Generate captions timed to the real reel length
+        reel_duration = self.ffmpeg.get_output_duration(state['raw_video_path'], voice_path)
+
+        if music_file and self.music_stems.enabled:
+            # Levelled, reel-length stem so compose only has to mix it
+            music_file = self.music_stems.prepare(music_file, reel_duration)
+
+        if self.config.get('captions', {}).get('format', 'srt') == 'ass':
+            # Styled ASS rendered with the bundled fonts
+            srt_path = os.path.join(
+                self.config['paths']['voice'],
+                f"captions_{timestamp}.ass"
+            )
+
+            self.captions.generate_ass(
+                story_data['script'],
+                srt_path,
+                reel_duration
+            )
+        else:
+            srt_path = os.path.join(
+                self.config['paths']['voice'],
+                f"captions_{timestamp}.srt"
+            )
+
+            self.captions.generate_srt(
+                story_data['script'],
+                srt_path,
+                reel_duration
+            )
+
+        self.storage.track(timestamp, srt_path, "intermediate")
+
+        state['voice_path'] = voice_path
+        state['music_file'] = music_file
+        state['srt_path'] = srt_path
+        state['reel_duration'] = reel_duration
+
+    def _stage_compose(self, state: Dict[str, Any]):
+        """
+        Steps 6-7: Compose final video and add fade effects
+        """
+        timestamp = state['run_id']
+        raw_video_path = state['raw_video_path']
+        voice_path = state['voice_path']
+        music_file = state['music_file']
+        srt_path = state['srt_path']
+
+        tier = state.get('tier')
+        if tier is None:
+            remaining = None
+            if state.get('deadline_seconds') is not None:
+                remaining = state['deadline_seconds'] - (time.time() - state['started'])
+            tier = self.ffmpeg.profiles.choose_tier(state['reel_duration'], remaining)
+
+        final_video_path = os.path.join(
+            self.config['paths']['final_videos'],
+            f"final_{timestamp}.mp4"
+        )
+
+        variants = self.config['video'].get('variants')
+        variant_paths = {}
+
+        if variants:
+            # All variants, fades and the cover frame in one FFmpeg pass
+            variant_paths = self.ffmpeg.compose_variants(
+                raw_video_path,
+                voice_path,
+                music_file,
+                srt_path,
+                os.path.join(self.config['paths']['final_videos'], f"final_{timestamp}"),
+                variants,
+                thumbnail_path=os.path.join(
+                    self.config['paths']['final_videos'],
+                    f"cover_{timestamp}.jpg"
+                ),
+                tier=tier
+            )
+            final_video_path = variant_paths[variants[0]['name']]
+
+            for path in variant_paths.values():
+                self.storage.track(timestamp, path, "artifact")
+        else:
+            # Fades are applied in the same encode
+            self.ffmpeg.compose_final_video(
+                raw_video_path,
+                voice_path,
+                music_file,
+                srt_path,
+                final_video_path,
+                tier=tier
+            )
+            self.storage.track(timestamp, final_video_path, "artifact")
+
+        state['tier'] = tier
+        state['final_video_path'] = final_video_path
+        state['variant_paths'] = variant_paths
+
+    def _stage_publish(self, state: Dict[str, Any]):
+        """
+        Step 8: Publish to social media and record the story
+        """
+        self._record_published(state, self._publish(state))
+
+    def _publish(self, state: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Queue or upload the final video
+
+        Returns:
+            Publish queue job in queue mode, else None
+        """
+        story_data = state['story_data']
+        final_video_path = state['final_video_path']
+
+        if self.config.get('publish', {}).get('mode', 'inline') == 'queue':
+            # Background workers upload it; a failed upload is retried
+            # instead of failing the reel
+            return self.publish_queue.enqueue(
+                final_video_path,
+                story_data['title'],
+                story_data['script'][:100] + "...",
+                release_at=state.get('release_at')
+            )
+
+        # Inline publishing: hold the finished reel until its slot
+        hold = self._hold_seconds(state)
+        if hold > 0:
+            logger.info(f"Holding reel {hold / 60:.1f} min for its release time")
+            time.sleep(hold)
+            state['held_seconds'] = hold
+
+        started = time.time()
+        self._upload(state)
+        state['upload_seconds'] = time.time() - started
+        return None
+
+    def _upload(self, state: Dict[str, Any]):
+        """
+        Upload the final video now, to the fan-out targets if configured
+        """
+        story_data = state['story_data']
+        final_video_path = state['final_video_path']
+
+        if self.fanout.targets:
+            results = self.fanout.publish(
+                final_video_path,
+                story_data['title'],
+                story_data['script'][:100] + "...",
+                extra={"genre": state['genre']}
+            )
+            failed = [name for name, r in results.items() if not r['success']]
+            if len(failed) == len(results):
+                raise Exception(f"Publish failed for all targets: {', '.join(failed)}")
+        else:
+            self.publisher.publish_to_facebook(
+                final_video_path,
+                story_data['title'],
+                story_data['script'][:100] + "..."
+            )
+
+    def _record_published(self, state: Dict[str, Any], publish_job: Optional[Dict[str, Any]]):
+        """
+        Record the story in history and release the run's intermediates
+        """
+        story_data = state['story_data']
+        final_video_path = state['final_video_path']
+
+        # Record in history
+        story_data['video_path'] = final_video_path
+        story_data['variants'] = state['variant_paths']
+        self.story_engine.record_story(story_data)
+
+        # Published: intermediates are no longer needed
+        self.storage.complete_run(state['run_id'])
+        if self.config.get('storage', {}).get('sweep_after_run', False):
+            self.storage.sweep()
+
+        state['publish_job'] = publish_job['id'] if publish_job else None
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(description="Generate and publish one reel")
+    parser.add_argument("--tier", choices=["draft", "standard", "archival"],
+                        help="Encode tier (default: chosen from the deadline)")
+    parser.add_argument("--deadline", type=float,
+                        help="Seconds available for the whole run")
+    parser.add_argument("--release-at",
+                        help="Publish time as ISO datetime (queue mode), e.g. 2026-01-31T18:00")
+    parser.add_argument("--slot",
+                        help="Schedule slot as ISO datetime; uses the story and clip prefetched for it")
+    parser.add_argument("--history", type=int, metavar="N",
+                        help="Print the last N published stories and exit")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Show what the next run would do and exit")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="Report import and init time per component and exit")
+    parser.add_argument("--config", default="settings.yaml")
+    args = parser.parse_args()
+
+    if args.history is not None:
+        # History only needs the story file, not a bot
+        with open(args.config, 'r') as f:
+            config = yaml.safe_load(f)
+        from story_engine import StoryEngine
+        for story in StoryEngine(config).history['stories'][-args.history:]:
+            print(f"{story['date']} {story.get('time', '')}  {story.get('genre', ''):10s}  {story.get('title', '')}")
+        sys.exit(0)
+
+    release_at = None
+    if args.release_at:
+        release_at = datetime.fromisoformat(args.release_at).timestamp()
+
+    try:
+        bot = ReelAutomationBot(args.config)
+
+        if args.dry_run:
+            print(json.dumps(bot.dry_run(), indent=2))
+            sys.exit(0)
+
+        if args.profile_startup:
+            profile = bot.profile_startup()
+            print(f"{'main':14s} {'(imports)':22s} {_import_seconds * 1000:8.1f} ms")
+            for entry in sorted(profile, key=lambda e: -(e['import_seconds'] + e['init_seconds'])):
+                print(f"{entry['component']:14s} {entry['module']:22s} "
+                      f"{entry['import_seconds'] * 1000:8.1f} ms import "
+                      f"{entry['init_seconds'] * 1000:8.1f} ms init"
+                      + (f"  ❌ {entry['error']}" if entry['error'] else ""))
+            total = sum(e['import_seconds'] + e['init_seconds'] for e in profile)
+            print(f"{'total':37s} {(total + _import_seconds) * 1000:8.1f} ms")
+            sys.exit(0)
+
+        prefetched = None
+        if args.slot:
+            from sora_prefetch import SoraPrefetcher
+            prefetcher = SoraPrefetcher(bot.config, bot)
+            if prefetcher.enabled:
+                prefetched = prefetcher.claim(datetime.fromisoformat(args.slot))
+
+        result = bot.generate_reel(
+            tier=args.tier,
+            deadline_seconds=args.deadline,
+            release_at=release_at,
+            prefetched=prefetched
+        )
+
+        if result['success']:
+            logger.info(f"\n✅ SUCCESS: {result['title']}")
+            sys.exit(0)
+        else:
+            logger.error(f"\n❌ FAILED: {result['error']}")
+            sys.exit(1)
+
+    except Exception as e:
+        logger.error(f"Critical error: {str(e)}")
+        logger.error(traceback.format_exc())
+        sys.exit(1)
+
+
+if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,167 @@
+import json
+import os
+import threading
+from typing import Dict, Any, Optional
+from utils.logger import setup_logger
+from resource_accounting import run_subprocess
+
+logger = setup_logger("media_probe")
+
+
+class MediaProbe:
+    """
+    Cached ffprobe metadata for raw videos, voice-overs and music
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        self.cache_file = os.path.join(config['paths']['output'], "probe_cache.json")
+        self._lock = threading.Lock()
+        self.cache = self._load_cache()
+
+    def _load_cache(self) -> Dict:
+        """Load probe cache"""
+        if os.path.exists(self.cache_file):
+            try:
+                with open(self.cache_file, 'r') as f:
+                    return json.load(f)
+            except:
+                return {}
+        return {}
+
+    def _save_cache(self):
+        """Save probe cache"""
+        os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+        with open(self.cache_file, 'w') as f:
+            json.dump(self.cache, f, indent=2)
+
+    def probe(self, path: str) -> Optional[Dict[str, Any]]:
+        """
+        Get metadata for a media file, running ffprobe only on cache miss
+
+        Cache entries are keyed by absolute path and invalidated when the
+        file size or modification time changes.
+
+        Args:
+            path: Media file to inspect
+
+        Returns:
+            Dict with duration, video and audio stream info, or None if the
+            file is missing or ffprobe fails
+        """
+        if not path or not os.path.exists(path):
+            return None
+
+        key = os.path.abspath(path)
+        stat = os.stat(path)
+        signature = [stat.st_size, stat.st_mtime_ns]
+
+        with self._lock:
+            entry = self.cache.get(key)
+            if entry and entry.get('signature') == signature:
+                return entry['meta']
+
+        meta = self._run_ffprobe(path)
+        if meta is None:
+            return None
+
+        with self._lock:
+            self.cache[key] = {"signature": signature, "meta": meta}
+            self._save_cache()
+
+        return meta
+
+    def _run_ffprobe(self, path: str) -> Optional[Dict[str, Any]]:
+        """
+        Run ffprobe and reduce its output to the fields the pipeline uses
+        """
+        cmd = [
+            'ffprobe',
+            '-v', 'error',
+            '-print_format', 'json',
+            '-show_format',
+            '-show_streams',
+            path
+        ]
+
+        try:
+            result = run_subprocess(cmd, timeout=30)
+
+            if result.returncode != 0:
+                logger.warning(f"ffprobe failed for {path}: {result.stderr.strip()}")
+                return None
+
+            data = json.loads(result.stdout)
+
+        except Exception as e:
+            logger.warning(f"ffprobe error for {path}: {str(e)}")
+            return None
+
+        meta = {
+            "duration": self._to_float(data.get('format', {}).get('duration')),
+            "video": None,
+            "audio": None
+        }
+
+        for stream in data.get('streams', []):
+            codec_type = stream.get('codec_type')
+
+            if codec_type == 'video' and meta['video'] is None:
+                meta['video'] = {
+                    "codec": stream.get('codec_name'),
+                    "width": stream.get('width'),
+                    "height": stream.get('height'),
+                    "fps": self._parse_rate(stream.get('avg_frame_rate') or stream.get('r_frame_rate')),
+                    "pix_fmt": stream.get('pix_fmt'),
+                    "duration": self._to_float(stream.get('duration'))
+                }
+            elif codec_type == 'audio' and meta['audio'] is None:
+                meta['audio'] = {
+                    "codec": stream.get('codec_name'),
+                    "sample_rate": int(stream.get('sample_rate') or 0),
+                    "channels": stream.get('channels'),
+                    "duration": self._to_float(stream.get('duration'))
+                }
+
+        return meta
+
+    def duration(self, path: str) -> Optional[float]:
+        """
+        Get media duration in seconds
+        """
+        meta = self.probe(path)
+        return meta['duration'] if meta else None
+
+    def video_info(self, path: str) -> Optional[Dict[str, Any]]:
+        """
+        Get first video stream info
+        """
+        meta = self.probe(path)
+        return meta['video'] if meta else None
+
+    def audio_info(self, path: str) -> Optional[Dict[str, Any]]:
+        """
+        Get first audio stream info
+        """
+        meta = self.probe(path)
+        return meta['audio'] if meta else None
+
+    @staticmethod
+    def _to_float(value) -> Optional[float]:
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def _parse_rate(rate: Optional[str]) -> Optional[float]:
+        """
+        Parse ffprobe frame rate such as "30000/1001"
+        """
+        if not rate:
+            return None
+        try:
+            num, _, den = rate.partition('/')
+            den = float(den) if den else 1.0
+            return float(num) / den if den else None
+        except ValueError:
+            return None
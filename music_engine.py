@@ -1,77 +1,196 @@
-import requests
-import random
-from typing import Dict, Any
-from utils.logger import setup_logger
-
-logger = setup_logger("music_engine")
-
-
-class MusicEngine:
-    """
-    Fetch background music from Pixabay
-    """
-
-    def __init__(self, config: Dict[str, Any]):
-        self.api_key = config['pixabay']['api_key']
-        self.api_url = config['pixabay']['api_url']
-
-    def get_background_music(self, genre: str, output_path: str) -> str:
-        """
-        Fetch appropriate background music
-
-        Args:
-            genre: Story genre to match music mood
-            output_path: Where to save the music file
-
-        Returns:
-            Path to downloaded music file
-        """
-        try:
-            # Map genre to music categories
-            mood_map = {
-                "Romance": "emotional",
-                "CEO/Billionaire": "corporate",
-                "Betrayal": "dark",
-                "Heartbreak": "sad",
-                "Rise from Poverty": "inspiring",
-                "Power & Secrets": "suspense"
-            }
-
-            mood = mood_map.get(genre, "dramatic")
-
-            logger.info(f"Fetching {mood} background music...")
-
-            params = {
-                "key": self.api_key,
-                "q": mood,
-                "per_page": 20
-            }
-
-            response = requests.get(self.api_url, params=params, timeout=30)
-            response.raise_for_status()
-
-            data = response.json()
-
-            if data.get('hits'):
-                # Pick random track
-                track = random.choice(data['hits'])
-                audio_url = track['videos']['medium']['url']
-
-                logger.info(f"Downloading music: {track.get('tags', 'Unknown')}")
-
-                # Download
-                audio_response = requests.get(audio_url, timeout=60)
-                audio_response.raise_for_status()
-
-                with open(output_path, 'wb') as f:
-                    f.write(audio_response.content)
-
-                logger.info(f"✓ Music downloaded: {output_path}")
-                return output_path
-            else:
-                logger.warning("No music found, using silent background")
-                return None
-
-        except Exception as e:
-            logger.error(f"Error fetching music: {str(e)}")
-            return None
\ No newline at end of file
+import os
+import requests
+import aiohttp
+import random
+import threading
+from typing import Dict, Any, Tuple
+from utils.logger import setup_logger
+from rate_limiter import get_rate_limiter
+from music_stems import MusicStemCache
+from resource_accounting import record_http
+
+logger = setup_logger("music_engine")
+
+
+class MusicEngine:
+    """
+    Fetch background music from Pixabay
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        self.api_key = config['pixabay']['api_key']
+        self.api_url = config['pixabay']['api_url']
+        self.limiter = get_rate_limiter(config)
+        self.stems = MusicStemCache(config)
+
+    def get_background_music(self, genre: str, output_path: str) -> str:
+        """
+        Fetch appropriate background music
+
+        Args:
+            genre: Story genre to match music mood
+            output_path: Where to save the music file
+
+        Returns:
+            Path to downloaded music file
+        """
+        try:
+            mood, params = self._search_params(genre)
+
+            logger.info(f"Fetching {mood} background music...")
+
+            with self.limiter.slot('pixabay'):
+                response = requests.get(self.api_url, params=params, timeout=30)
+            record_http('pixabay', len(response.content))
+            self.limiter.report_response('pixabay', response)
+            response.raise_for_status()
+
+            data = response.json()
+
+            if data.get('hits'):
+                # Pick random track
+                track = random.choice(data['hits'])
+                audio_url = track['videos']['medium']['url']
+
+                output_path, cached = self._track_target(track, output_path)
+                if cached:
+                    return output_path
+
+                logger.info(f"Downloading music: {track.get('tags', 'Unknown')}")
+
+                # Download
+                audio_response = requests.get(audio_url, timeout=60)
+                audio_response.raise_for_status()
+                record_http('pixabay', len(audio_response.content), calls=0)
+
+                self._save_download(output_path, audio_response.content)
+
+                self._track_downloaded(track, output_path)
+                logger.info(f"✓ Music downloaded: {output_path}")
+                return output_path
+            else:
+                logger.warning("No music found, using silent background")
+                return None
+
+        except Exception as e:
+            logger.error(f"Error fetching music: {str(e)}")
+            return None
+
+    def _search_params(self, genre: str) -> Tuple[str, Dict[str, Any]]:
+        """
+        Map genre to a music mood and build the Pixabay search params
+        """
+        # Map genre to music categories
+        mood_map = {
+            "Romance": "emotional",
+            "CEO/Billionaire": "corporate",
+            "Betrayal": "dark",
+            "Heartbreak": "sad",
+            "Rise from Poverty": "inspiring",
+            "Power & Secrets": "suspense"
+        }
+
+        mood = mood_map.get(genre, "dramatic")
+
+        params = {
+            "key": self.api_key,
+            "q": mood,
+            "per_page": 20
+        }
+
+        return mood, params
+
+    @staticmethod
+    def _save_download(output_path: str, content: bytes):
+        """
+        Write a download under a temp name and move it into place, so a
+        shared cached track is never seen half written
+        """
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+        tmp_path = f"{output_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, output_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _track_target(self, track: Dict[str, Any], output_path: str) -> Tuple[str, bool]:
+        """
+        Where to save a track, and whether it's already in the stem cache
+
+        With stems enabled, tracks are kept once per Pixabay id instead of
+        downloaded again for every reel.
+        """
+        if not self.stems.enabled or 'id' not in track:
+            return output_path, False
+
+        path = self.stems.track_path(track['id'])
+        if self.stems.has_track(track['id']):
+            logger.info(f"✓ Using cached music track {track['id']}")
+            self.stems.add_track(track['id'], path)
+            return path, True
+        return path, False
+
+    def _track_downloaded(self, track: Dict[str, Any], path: str):
+        if self.stems.enabled and 'id' in track:
+            self.stems.add_track(track['id'], path)
+
+
+class AsyncMusicEngine(MusicEngine):
+    """
+    Music fetcher for asyncio pipelines, sharing one aiohttp session
+    """
+
+    def __init__(self, config: Dict[str, Any], session: aiohttp.ClientSession):
+        super().__init__(config)
+        self.session = session
+
+    async def get_background_music(self, genre: str, output_path: str) -> str:
+        """
+        Async get_background_music()
+        """
+        try:
+            mood, params = self._search_params(genre)
+
+            logger.info(f"Fetching {mood} background music...")
+
+            async with self.limiter.slot_async('pixabay'):
+                async with self.session.get(
+                        self.api_url,
+                        params=params,
+                        timeout=aiohttp.ClientTimeout(total=30)
+                ) as response:
+                    record_http('pixabay', response.content_length or 0)
+                    await self.limiter.report_response_async('pixabay', response)
+                    response.raise_for_status()
+                    data = await response.json(content_type=None)
+
+            if data.get('hits'):
+                track = random.choice(data['hits'])
+                audio_url = track['videos']['medium']['url']
+
+                output_path, cached = self._track_target(track, output_path)
+                if cached:
+                    return output_path
+
+                logger.info(f"Downloading music: {track.get('tags', 'Unknown')}")
+
+                async with self.session.get(audio_url, timeout=aiohttp.ClientTimeout(total=60)) as audio_response:
+                    audio_response.raise_for_status()
+                    content = await audio_response.read()
+                record_http('pixabay', len(content), calls=0)
+
+                self._save_download(output_path, content)
+
+                self._track_downloaded(track, output_path)
+                logger.info(f"✓ Music downloaded: {output_path}")
+                return output_path
+            else:
+                logger.warning("No music found, using silent background")
+                return None
+
+        except Exception as e:
+            logger.error(f"Error fetching music: {str(e)}")
+            return None
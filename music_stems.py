@@ -0,0 +1,204 @@
+import os
+import json
+import math
+import time
+import fcntl
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional
+from utils.logger import setup_logger
+from resource_accounting import run_subprocess
+
+logger = setup_logger("music_stems")
+
+STEM_SUFFIX = ".stem.m4a"
+
+
+def is_stem(path: Optional[str]) -> bool:
+    """
+    Whether a music file is a prepared stem (already levelled for mixing)
+    """
+    return bool(path) and path.endswith(STEM_SUFFIX)
+
+
+class MusicStemCache:
+    """
+    Cache of downloaded Pixabay tracks and ready-to-mix music stems
+
+    A stem is a track looped or trimmed to the reel length, loudness
+    normalized, resampled and encoded to AAC once, so the final mux only
+    has to mix it under the voice-over. Stems are keyed by track id and
+    target duration (rounded up to bucket_seconds so similar reel lengths
+    share a stem).
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        stem_config = config.get('music_stems', {})
+
+        self.enabled = stem_config.get('enabled', False)
+        self.stems_dir = config['paths'].get('music_stems', os.path.join(config['paths']['output'], "music_stems"))
+        self.index_file = os.path.join(config['paths']['output'], "music_stems.json")
+        self.loudness = stem_config.get('loudness_lufs', -26)
+        self.sample_rate = stem_config.get('sample_rate', 48000)
+        self.bitrate_kbps = stem_config.get('bitrate_kbps', 128)
+        self.bucket_seconds = stem_config.get('bucket_seconds', 5)
+        self.max_stems = stem_config.get('max_stems', 200)
+        self.max_tracks = stem_config.get('max_tracks', 100)
+        self.in_use_seconds = stem_config.get('in_use_minutes', 60) * 60
+
+        self._lock = threading.Lock()
+
+    def _load_index(self) -> Dict:
+        """Load cache index"""
+        if os.path.exists(self.index_file):
+            try:
+                with open(self.index_file, 'r') as f:
+                    return json.load(f)
+            except:
+                return {"tracks": {}, "stems": {}}
+        return {"tracks": {}, "stems": {}}
+
+    def _save_index(self, index: Dict):
+        """Save cache index"""
+        os.makedirs(os.path.dirname(self.index_file), exist_ok=True)
+        tmp_file = f"{self.index_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(index, f, indent=2)
+        os.replace(tmp_file, self.index_file)
+
+    @contextmanager
+    def _index_lock(self):
+        """
+        Exclusive lock on the index across threads and processes, held
+        across read-modify-write
+        """
+        os.makedirs(os.path.dirname(self.index_file), exist_ok=True)
+        with self._lock, open(self.index_file + ".lock", 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def cached_paths(self) -> List[str]:
+        """
+        Every cached track and stem, for StorageManager.add_reference_provider
+        """
+        index = self._load_index()
+        return [entry['path'] for section in ("tracks", "stems") for entry in index[section].values()]
+
+    def track_path(self, track_id: Any) -> str:
+        """
+        Where the downloaded track with this Pixabay id is kept
+        """
+        return os.path.join(self.stems_dir, f"track_{track_id}.mp3")
+
+    def has_track(self, track_id: Any) -> bool:
+        path = self.track_path(track_id)
+        return os.path.exists(path) and os.path.getsize(path) > 0
+
+    def add_track(self, track_id: Any, path: str):
+        """
+        Register a downloaded track so it survives storage sweeps
+        """
+        with self._index_lock():
+            index = self._load_index()
+            index['tracks'][str(track_id)] = {"path": os.path.abspath(path), "last_used": time.time()}
+            self._evict(index)
+            self._save_index(index)
+
+    def prepare(self, music_path: str, duration: float) -> str:
+        """
+        Get a ready-to-mix stem for a track and reel duration
+
+        Args:
+            music_path: Downloaded track (track_<id>.mp3 from this cache, or
+                any audio file)
+            duration: Reel duration in seconds
+
+        Returns:
+            Stem path, or music_path unchanged if preparation failed
+        """
+        source = os.path.splitext(os.path.basename(music_path))[0]
+        target = math.ceil(duration / self.bucket_seconds) * self.bucket_seconds
+        key = f"{source}_{target}s"
+        stem_path = os.path.join(self.stems_dir, key + STEM_SUFFIX)
+
+        if os.path.exists(stem_path) and os.path.getsize(stem_path) > 0:
+            logger.info(f"✓ Using cached music stem {key}")
+            self._touch(key, stem_path, source, target)
+            return stem_path
+
+        os.makedirs(self.stems_dir, exist_ok=True)
+        tmp_path = f"{stem_path}.{os.getpid()}.{threading.get_ident()}.tmp.m4a"
+
+        # Loop (or trim) to the bucket length and level once. The stem is
+        # longer than the reel, so the fade-out is left to compose, which
+        # knows where the reel really ends.
+        audio_filter = (
+            f"loudnorm=I={self.loudness}:TP=-2:LRA=11,"
+            f"aresample={self.sample_rate}"
+        )
+        cmd = [
+            'ffmpeg', '-y',
+            '-stream_loop', '-1',
+            '-i', music_path,
+            '-t', str(target),
+            '-af', audio_filter,
+            '-ac', '2',
+            '-c:a', 'aac', '-b:a', f"{self.bitrate_kbps}k",
+            tmp_path
+        ]
+
+        logger.info(f"Preparing music stem {key}...")
+        try:
+            result = run_subprocess(cmd, timeout=120)
+            if result.returncode != 0:
+                logger.error(f"FFmpeg error: {result.stderr}")
+                raise Exception(f"FFmpeg failed with code {result.returncode}")
+
+            os.replace(tmp_path, stem_path)
+
+        except Exception as e:
+            logger.warning(f"Music stem preparation failed, mixing raw track: {str(e)}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return music_path
+
+        self._touch(key, stem_path, source, target)
+        logger.info(f"✓ Music stem ready: {stem_path}")
+        return stem_path
+
+    def _touch(self, key: str, stem_path: str, source: str, target: int):
+        with self._index_lock():
+            index = self._load_index()
+            index['stems'][key] = {
+                "path": os.path.abspath(stem_path),
+                "source": source,
+                "duration": target,
+                "last_used": time.time()
+            }
+            self._evict(index)
+            self._save_index(index)
+
+    def _evict(self, index: Dict):
+        """
+        Drop least recently used tracks and stems beyond the size limits
+
+        Entries used within in_use_minutes may belong to a reel still being
+        composed and are kept, even if the cache stays over its limit.
+        """
+        in_use_since = time.time() - self.in_use_seconds
+        for section, limit in (("tracks", self.max_tracks), ("stems", self.max_stems)):
+            entries = index[section]
+            if len(entries) <= limit:
+                continue
+
+            by_age = sorted(entries, key=lambda k: entries[k]['last_used'])
+            evictable = [k for k in by_age if entries[k]['last_used'] < in_use_since]
+            for key in evictable[:len(entries) - limit]:
+                path = entries.pop(key)['path']
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
@@ -1,106 +1,328 @@
-import requests
-import os
-from typing import Dict, Any
-from utils.logger import setup_logger
-
-logger = setup_logger("post_engine")
-
-class PostEngine:
-    """
-    Publish videos to social media via SocialBu API
-    """
-    def __init__(self, config: Dict[str, Any]):
-        self.bearer_token = config['socialbu']['bearer_token']
-        self.api_url = config['socialbu']['api_url']
-        self.account_id = config['socialbu'].get('account_id', '')
-    
-    def publish_to_facebook(
-        self,
-        video_path: str,
-        title: str,
-        description: str
-    ) -> Dict[str, Any]:
-        """
-        Publish video to Facebook via SocialBu
-        
-        Args:
-            video_path: Path to final video
-            title: Post title
-            description: Post description
-            
-        Returns:
-            API response
-        """
-        try:
-            logger.info(f"Publishing '{title}' to Facebook via SocialBu...")
-            
-            # Prepare caption with hashtags
-            caption = f"{title}\n\n{description}\n\n#PocketFM #Shorts #DramaStory #Reels #Viral"
-            
-            headers = {
-                "Authorization": f"Bearer {self.bearer_token}",
-                "Accept": "application/json"
-            }
-            
-            # Check if video exists
-            if not os.path.exists(video_path):
-                raise FileNotFoundError(f"Video file not found: {video_path}")
-            
-            file_size_mb = os.path.getsize(video_path) / (1024*1024)
-            logger.info(f"Video file size: {file_size_mb:.2f} MB")
-            
-            # Prepare multipart form data
-            with open(video_path, 'rb') as video_file:
-                files = {
-                    'media[]': (os.path.basename(video_path), video_file, 'video/mp4')
-                }
-                
-                data = {
-                    'accounts[]': self.account_id,
-                    'caption': caption,
-                    'post_type': 'reel',
-                    'publish_now': '1'
-                }
-                
-                logger.info(f"Uploading to SocialBu (Account ID: {self.account_id})...")
-                logger.info(f"API URL: {self.api_url}")
-                
-                response = requests.post(
-                    self.api_url,
-                    headers=headers,
-                    data=data,
-                    files=files,
-                    timeout=600  # 10 minute timeout for large video uploads
-                )
-                
-                logger.info(f"Response Status: {response.status_code}")
-                
-                # Log response for debugging
-                try:
-                    result = response.json()
-                    logger.info(f"Response JSON: {result}")
-                except:
-                    logger.info(f"Response Text: {response.text}")
-                    result = {"status": response.status_code, "text": response.text}
-                
-                response.raise_for_status()
-                
-                logger.info(f"✓ Successfully published to Facebook!")
-                
-                return result
-                
-        except FileNotFoundError as e:
-            logger.error(f"File error: {str(e)}")
-            raise
-        except requests.exceptions.Timeout:
-            logger.error("Upload timeout - video might be too large or connection is slow")
-            raise
-        except requests.exceptions.RequestException as e:
-            logger.error(f"API request error: {str(e)}")
-            if hasattr(e, 'response') and e.response is not None:
-                logger.error(f"Status Code: {e.response.status_code}")
-                logger.error(f"Response: {e.response.text}")
-            raise
-        except Exception as e:
-            logger.error(f"Unexpected error: {str(e)}")
-            raise
+import requests
+import aiohttp
+import asyncio
+import json
+import os
+import mmap
+import time
+import uuid
+import contextlib
+from typing import Dict, Any, Optional
+from utils.logger import setup_logger
+from encode_profiles import EncodeProfiles
+from rate_limiter import get_rate_limiter
+from resource_accounting import record_http
+
+logger = setup_logger("post_engine")
+
+class PostEngine:
+    """
+    Publish videos to social media via SocialBu API
+    """
+    def __init__(self, config: Dict[str, Any]):
+        self.bearer_token = config['socialbu']['bearer_token']
+        self.api_url = config['socialbu']['api_url']
+        self.account_id = config['socialbu'].get('account_id', '')
+        self.profiles = EncodeProfiles(config)
+        self.limiter = get_rate_limiter(config)
+    
+    def publish_to_facebook(
+        self,
+        video_path: str,
+        title: str,
+        description: str
+    ) -> Dict[str, Any]:
+        """
+        Publish video to Facebook via SocialBu
+        
+        Args:
+            video_path: Path to final video
+            title: Post title
+            description: Post description
+            
+        Returns:
+            API response
+        """
+        logger.info(f"Publishing '{title}' to Facebook via SocialBu...")
+        
+        # Prepare caption with hashtags
+        caption = f"{title}\n\n{description}\n\n#PocketFM #Shorts #DramaStory #Reels #Viral"
+        
+        return self.publish(video_path, caption)
+    
+    def publish(
+        self,
+        video_path: str,
+        caption: str,
+        account_id: Optional[str] = None,
+        post_type: str = 'reel',
+        media: Optional[memoryview] = None,
+        shared_slot: bool = True
+    ) -> Dict[str, Any]:
+        """
+        Publish a video with a ready-made caption to one SocialBu account
+        
+        The multipart body is streamed from a memory map of the video, so
+        no upload holds a copy of the file in memory.
+        
+        Args:
+            video_path: Path to final video
+            caption: Full post caption
+            account_id: SocialBu account (default: configured account)
+            post_type: SocialBu post type
+            media: Shared read-only buffer with the video bytes, used instead
+                of mapping the file again
+            shared_slot: Hold the shared socialbu rate limiter slot during
+                the upload; fan-out paces each target itself instead
+            
+        Returns:
+            API response
+        """
+        account_id = account_id or self.account_id
+        
+        try:
+            headers = self._headers()
+            
+            # Check if video exists
+            if media is None and not os.path.exists(video_path):
+                raise FileNotFoundError(f"Video file not found: {video_path}")
+            
+            file_size = len(media) if media is not None else os.path.getsize(video_path)
+            logger.info(f"Video file size: {file_size / (1024*1024):.2f} MB")
+            
+            # Prepare multipart form data
+            with contextlib.ExitStack() as stack:
+                if media is None:
+                    video_file = stack.enter_context(open(video_path, 'rb'))
+                    mapped = stack.enter_context(mmap.mmap(video_file.fileno(), 0, access=mmap.ACCESS_READ))
+                    media = memoryview(mapped)
+                    stack.callback(media.release)
+                
+                body = MultipartStream(
+                    self._form_fields(caption, account_id, post_type),
+                    'media[]',
+                    os.path.basename(video_path),
+                    media,
+                    'video/mp4'
+                )
+                headers['Content-Type'] = body.content_type
+                
+                logger.info(f"Uploading to SocialBu (Account ID: {account_id})...")
+                logger.info(f"API URL: {self.api_url}")
+                
+                slot = self.limiter.slot('socialbu') if shared_slot else contextlib.nullcontext()
+                with slot:
+                    upload_started = time.time()
+                    response = requests.post(
+                        self.api_url,
+                        headers=headers,
+                        data=body,
+                        timeout=600  # 10 minute timeout for large video uploads
+                    )
+                record_http('socialbu', len(response.content), file_size)
+                self.limiter.report_response('socialbu', response)
+                
+                logger.info(f"Response Status: {response.status_code}")
+                
+                # Log response for debugging
+                try:
+                    result = response.json()
+                    logger.debug(f"Response JSON: {result}")
+                except:
+                    logger.debug(f"Response Text: {response.text}")
+                    result = {"status": response.status_code, "text": response.text}
+                
+                response.raise_for_status()
+                
+                # Feed measured bandwidth back into encode tier selection
+                self.profiles.record_upload(
+                    file_size,
+                    time.time() - upload_started
+                )
+                
+                logger.info(f"✓ Successfully published to account {account_id}!")
+                
+                return result
+                
+        except FileNotFoundError as e:
+            logger.error(f"File error: {str(e)}")
+            raise
+        except requests.exceptions.Timeout:
+            logger.error("Upload timeout - video might be too large or connection is slow")
+            raise
+        except requests.exceptions.RequestException as e:
+            logger.error(f"API request error: {str(e)}")
+            if hasattr(e, 'response') and e.response is not None:
+                logger.error(f"Status Code: {e.response.status_code}")
+                logger.error(f"Response: {e.response.text}")
+            raise
+        except Exception as e:
+            logger.error(f"Unexpected error: {str(e)}")
+            raise
+    
+    def _headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.bearer_token}",
+            "Accept": "application/json"
+        }
+    
+    @staticmethod
+    def _form_fields(caption: str, account_id: str, post_type: str) -> Dict[str, str]:
+        return {
+            'accounts[]': account_id,
+            'caption': caption,
+            'post_type': post_type,
+            'publish_now': '1'
+        }
+
+
+class MultipartStream:
+    """
+    multipart/form-data body read in chunks from the video buffer
+
+    requests would build the whole body in memory, copying the video once
+    per upload. This file-like body has a length, so the request keeps its
+    Content-Length header instead of switching to chunked encoding.
+    """
+    def __init__(self, fields: Dict[str, str], file_field: str, filename: str, media: memoryview, content_type: str):
+        boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={boundary}"
+        
+        head = ''.join(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+            for name, value in fields.items()
+        )
+        head += (
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{file_field}"; filename="{filename}"\r\n'
+            f'Content-Type: {content_type}\r\n\r\n'
+        )
+        tail = f'\r\n--{boundary}--\r\n'
+        
+        self._parts = [memoryview(head.encode()), media, memoryview(tail.encode())]
+        self._length = sum(len(part) for part in self._parts)
+        self._part = 0
+        self._offset = 0
+    
+    def __len__(self) -> int:
+        return self._length
+    
+    def read(self, size: int = -1) -> bytes:
+        chunks = []
+        while self._part < len(self._parts) and size != 0:
+            part = self._parts[self._part]
+            end = len(part) if size < 0 else min(len(part), self._offset + size)
+            chunks.append(part[self._offset:end])
+            if size > 0:
+                size -= end - self._offset
+            self._offset = end
+            if self._offset == len(part):
+                self._part += 1
+                self._offset = 0
+        return b''.join(chunks)
+
+
+class AsyncPostEngine(PostEngine):
+    """
+    SocialBu publisher for asyncio pipelines, sharing one aiohttp session
+    """
+    def __init__(self, config: Dict[str, Any], session: aiohttp.ClientSession):
+        super().__init__(config)
+        self.session = session
+    
+    async def publish_to_facebook(
+        self,
+        video_path: str,
+        title: str,
+        description: str
+    ) -> Dict[str, Any]:
+        """
+        Async publish_to_facebook()
+        """
+        logger.info(f"Publishing '{title}' to Facebook via SocialBu...")
+        
+        caption = f"{title}\n\n{description}\n\n#PocketFM #Shorts #DramaStory #Reels #Viral"
+        
+        return await self.publish(video_path, caption)
+    
+    async def publish(
+        self,
+        video_path: str,
+        caption: str,
+        account_id: Optional[str] = None,
+        post_type: str = 'reel',
+        media: Optional[memoryview] = None
+    ) -> Dict[str, Any]:
+        """
+        Async publish(); the file is streamed from disk by aiohttp
+        """
+        account_id = account_id or self.account_id
+        
+        try:
+            if media is None and not os.path.exists(video_path):
+                raise FileNotFoundError(f"Video file not found: {video_path}")
+            
+            file_size = len(media) if media is not None else os.path.getsize(video_path)
+            logger.info(f"Video file size: {file_size / (1024*1024):.2f} MB")
+            
+            with contextlib.ExitStack() as stack:
+                if media is None:
+                    media = stack.enter_context(open(video_path, 'rb'))
+                
+                form = aiohttp.FormData()
+                for name, value in self._form_fields(caption, account_id, post_type).items():
+                    form.add_field(name, value)
+                form.add_field(
+                    'media[]',
+                    media,
+                    filename=os.path.basename(video_path),
+                    content_type='video/mp4'
+                )
+                
+                logger.info(f"Uploading to SocialBu (Account ID: {account_id})...")
+                
+                async with self.limiter.slot_async('socialbu'):
+                    upload_started = time.time()
+                    async with self.session.post(
+                        self.api_url,
+                        headers=self._headers(),
+                        data=form,
+                        timeout=aiohttp.ClientTimeout(total=600)
+                    ) as response:
+                        await self.limiter.report_response_async('socialbu', response)
+                        
+                        logger.info(f"Response Status: {response.status}")
+                        
+                        text = await response.text()
+                        record_http('socialbu', len(text.encode()), file_size)
+                        try:
+                            result = json.loads(text)
+                            logger.debug(f"Response JSON: {result}")
+                        except ValueError:
+                            logger.debug(f"Response Text: {text}")
+                            result = {"status": response.status, "text": text}
+                        
+                        if response.status >= 400:
+                            logger.error(f"Status Code: {response.status}")
+                            response.raise_for_status()
+                
+                self.profiles.record_upload(
+                    file_size,
+                    time.time() - upload_started
+                )
+                
+                logger.info(f"✓ Successfully published to account {account_id}!")
+                
+                return result
+                
+        except FileNotFoundError as e:
+            logger.error(f"File error: {str(e)}")
+            raise
+        except asyncio.TimeoutError:
+            logger.error("Upload timeout - video might be too large or connection is slow")
+            raise
+        except aiohttp.ClientError as e:
+            logger.error(f"API request error: {str(e)}")
+            raise
+        except Exception as e:
+            logger.error(f"Unexpected error: {str(e)}")
+            raise
@@ -0,0 +1,658 @@
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import sqlite3
+import fcntl
+import hashlib
+import argparse
+import threading
+import yaml
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+from utils.logger import setup_logger, configure_logging, log_context
+from fanout_publisher import FanoutPublisher
+from rate_limiter import get_rate_limiter
+from stage_timings import StageTimings
+
+logger = setup_logger("publish_queue")
+
+
+class PublishQueue:
+    """
+    Durable SQLite-backed queue of finished reels waiting to be published
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        publish_config = config.get('publish', {})
+
+        self.db_path = os.path.join(config['paths']['output'], "publish_queue.db")
+        self.pending_index = os.path.join(config['paths']['output'], "publish_pending.json")
+        self.max_attempts = publish_config.get('max_attempts', 8)
+        self.backoff_base = publish_config.get('backoff_base_seconds', 30)
+        self.backoff_max = publish_config.get('backoff_max_seconds', 3600)
+        self.lease_seconds = publish_config.get('lease_seconds', 900)
+
+        self._init_db()
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _init_db(self):
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    content_hash TEXT NOT NULL UNIQUE,
+                    video_path TEXT NOT NULL,
+                    title TEXT NOT NULL,
+                    description TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    release_at REAL NOT NULL,
+                    next_attempt_at REAL NOT NULL,
+                    claimed_by TEXT,
+                    claimed_until REAL,
+                    last_error TEXT,
+                    result TEXT,
+                    target_results TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_due ON jobs (status, next_attempt_at)")
+
+            # Queues created before fan-out publishing
+            columns = [row['name'] for row in conn.execute("PRAGMA table_info(jobs)")]
+            if 'target_results' not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN target_results TEXT")
+
+    @staticmethod
+    def content_hash(video_path: str) -> str:
+        """
+        SHA-256 of the video file, used as the idempotency key
+        """
+        digest = hashlib.sha256()
+        with open(video_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def enqueue(
+            self,
+            video_path: str,
+            title: str,
+            description: str,
+            release_at: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        Queue a finished reel for publishing
+
+        Enqueuing the same video twice returns the existing job instead of
+        creating a second post.
+
+        Args:
+            video_path: Path to final video
+            title: Post title
+            description: Post description
+            release_at: Unix time before which the reel must not go live
+                (default: now)
+
+        Returns:
+            Job record
+        """
+        if not os.path.exists(video_path):
+            raise FileNotFoundError(f"Video file not found: {video_path}")
+
+        content_hash = self.content_hash(video_path)
+        now = time.time()
+        release_at = release_at or now
+
+        with self._connect() as conn:
+            cursor = conn.execute(
+                """
+                INSERT OR IGNORE INTO jobs
+                    (content_hash, video_path, title, description, release_at,
+                     next_attempt_at, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (content_hash, os.path.abspath(video_path), title, description,
+                 release_at, release_at, now, now)
+            )
+            job = self._get(conn, content_hash=content_hash)
+
+        if cursor.rowcount == 0:
+            logger.info(f"Reel already queued as job {job['id']} ({job['status']}), not adding again")
+        else:
+            when = datetime.fromtimestamp(release_at).strftime('%Y-%m-%d %H:%M:%S')
+            logger.info(f"✓ Queued '{title}' for publishing (job {job['id']}, release {when})")
+            self._write_pending_index()
+
+        return job
+
+    def claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Claim the next due job
+
+        Jobs whose lease expired (worker crashed mid-upload) are claimable
+        again.
+
+        Args:
+            worker_id: Identifier of the claiming worker
+
+        Returns:
+            Job record, or None when nothing is due
+        """
+        now = time.time()
+
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    """
+                    SELECT * FROM jobs
+                    WHERE (status = 'pending' AND next_attempt_at <= ?)
+                       OR (status = 'in_progress' AND claimed_until < ?)
+                    ORDER BY release_at, id
+                    LIMIT 1
+                    """,
+                    (now, now)
+                ).fetchone()
+
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+
+                conn.execute(
+                    """
+                    UPDATE jobs
+                    SET status = 'in_progress', claimed_by = ?, claimed_until = ?, updated_at = ?
+                    WHERE id = ?
+                    """,
+                    (worker_id, now + self.lease_seconds, now, row['id'])
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+        return dict(row)
+
+    def mark_published(self, job_id: int, result: Any, worker_id: Optional[str] = None) -> bool:
+        """
+        Record a successful publish
+
+        Args:
+            job_id: Job to update
+            result: Publish result to store
+            worker_id: Worker holding the claim; if given, the job is only
+                updated while that worker still holds it
+
+        Returns:
+            True if the job was updated
+        """
+        query = """
+            UPDATE jobs
+            SET status = 'published', attempts = attempts + 1, result = ?,
+                last_error = NULL, claimed_by = NULL, claimed_until = NULL, updated_at = ?
+            WHERE id = ?
+        """
+        params = [json.dumps(result, default=str), time.time(), job_id]
+        if worker_id is not None:
+            query += " AND claimed_by = ?"
+            params.append(worker_id)
+
+        with self._connect() as conn:
+            cursor = conn.execute(query, params)
+        self._write_pending_index()
+        return cursor.rowcount > 0
+
+    def mark_failed(
+            self,
+            job_id: int,
+            error: str,
+            target_results: Optional[Dict[str, Any]] = None,
+            worker_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Record a failed attempt and schedule the retry with exponential backoff
+
+        After max_attempts the job is parked as failed. The video stays on
+        disk and the job can be requeued with retry().
+
+        Args:
+            job_id: Job to update
+            error: Error message
+            target_results: Per-target results of a partial fan-out, so
+                retries skip targets that already succeeded
+            worker_id: Worker holding the claim; if given and the lease has
+                passed to another worker, the job is left as it is
+
+        Returns:
+            Updated job record (the current record if left as it is)
+        """
+        now = time.time()
+
+        with self._connect() as conn:
+            job = self._get(conn, job_id=job_id)
+            if worker_id is not None and job['claimed_by'] != worker_id:
+                return job
+
+            attempts = job['attempts'] + 1
+
+            if attempts >= self.max_attempts:
+                status, next_attempt_at = 'failed', job['next_attempt_at']
+            else:
+                delay = min(self.backoff_max, self.backoff_base * 2 ** (attempts - 1))
+                # Jitter so several workers don't retry in lockstep
+                delay *= random.uniform(0.8, 1.2)
+                status, next_attempt_at = 'pending', now + delay
+
+            target_results = self._merge_results(job, target_results)
+
+            conn.execute(
+                """
+                UPDATE jobs
+                SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?,
+                    target_results = ?, claimed_by = NULL, claimed_until = NULL, updated_at = ?
+                WHERE id = ? AND claimed_by IS ?
+                """,
+                (status, attempts, next_attempt_at, error,
+                 json.dumps(target_results, default=str), now, job_id, job['claimed_by'])
+            )
+            job = self._get(conn, job_id=job_id)
+
+        self._write_pending_index()
+        return job
+
+    def save_target_result(self, job_id: int, worker_id: str, name: str, result: Dict[str, Any]) -> bool:
+        """
+        Record one fan-out target's result as soon as its upload finishes
+
+        A success is stored even if the lease has passed to another
+        worker, so nobody posts to that target again. Storing also
+        extends the lease while the remaining uploads run.
+
+        Returns:
+            True if the worker still holds the job
+        """
+        now = time.time()
+
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                job = self._get(conn, job_id=job_id)
+                holder = job['claimed_by'] == worker_id and job['status'] == 'in_progress'
+
+                if holder or result.get('success'):
+                    target_results = json.loads(job['target_results'] or '{}')
+                    target_results[name] = result
+                    conn.execute(
+                        "UPDATE jobs SET target_results = ?, updated_at = ? WHERE id = ?",
+                        (json.dumps(target_results, default=str), now, job_id)
+                    )
+                if holder:
+                    conn.execute(
+                        "UPDATE jobs SET claimed_until = ? WHERE id = ?",
+                        (now + self.lease_seconds, job_id)
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+        return holder
+
+    def defer(
+            self,
+            job_id: int,
+            retry_in: float,
+            reason: str,
+            target_results: Optional[Dict[str, Any]] = None,
+            worker_id: Optional[str] = None
+    ) -> bool:
+        """
+        Put a job back until a rate limit frees up, without counting an attempt
+
+        Args:
+            job_id: Job to update
+            retry_in: Seconds until the job is due again
+            reason: Stored as the job's last error
+            target_results: Per-target results so far
+            worker_id: Worker holding the claim; if given, the job is only
+                updated while that worker still holds it
+
+        Returns:
+            True if the job was updated
+        """
+        now = time.time()
+
+        with self._connect() as conn:
+            job = self._get(conn, job_id=job_id)
+            if worker_id is not None and job['claimed_by'] != worker_id:
+                return False
+
+            cursor = conn.execute(
+                """
+                UPDATE jobs
+                SET status = 'pending', next_attempt_at = ?, last_error = ?, target_results = ?,
+                    claimed_by = NULL, claimed_until = NULL, updated_at = ?
+                WHERE id = ? AND claimed_by IS ?
+                """,
+                (now + retry_in, reason, json.dumps(self._merge_results(job, target_results), default=str),
+                 now, job_id, job['claimed_by'])
+            )
+
+        self._write_pending_index()
+        return cursor.rowcount > 0
+
+    @staticmethod
+    def _merge_results(job: Dict[str, Any], target_results: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        New per-target results over the stored ones, never dropping a stored success
+        """
+        stored = json.loads(job['target_results'] or '{}')
+        if target_results is None:
+            return stored
+        return {**target_results, **{name: r for name, r in stored.items() if r.get('success')}}
+
+    def retry(self, job_id: int) -> bool:
+        """
+        Requeue a failed job immediately
+        """
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                """
+                UPDATE jobs
+                SET status = 'pending', attempts = 0, next_attempt_at = ?, updated_at = ?
+                WHERE id = ? AND status = 'failed'
+                """,
+                (now, now, job_id)
+            )
+        self._write_pending_index()
+        return cursor.rowcount > 0
+
+    def list_jobs(self, status: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        with self._connect() as conn:
+            if status:
+                rows = conn.execute(
+                    "SELECT * FROM jobs WHERE status = ? ORDER BY id DESC LIMIT ?", (status, limit)
+                ).fetchall()
+            else:
+                rows = conn.execute("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def pending_paths(self) -> List[str]:
+        """
+        Videos not yet published, which must not be removed from disk
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT video_path FROM jobs WHERE status != 'published'"
+            ).fetchall()
+        return [row['video_path'] for row in rows]
+
+    def _write_pending_index(self):
+        """
+        Mirror unpublished video paths to JSON for the storage manager
+
+        Locked across query and write, so a writer holding an older list
+        can't replace a newer one.
+        """
+        tmp_file = f"{self.pending_index}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(self.pending_index + ".lock", 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                with open(tmp_file, 'w') as f:
+                    json.dump({"pending": self.pending_paths()}, f, indent=2)
+                os.replace(tmp_file, self.pending_index)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _get(conn: sqlite3.Connection, job_id: int = None, content_hash: str = None) -> Dict[str, Any]:
+        if job_id is not None:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        else:
+            row = conn.execute("SELECT * FROM jobs WHERE content_hash = ?", (content_hash,)).fetchone()
+        return dict(row)
+
+
+class PartialPublishError(Exception):
+    """Some fan-out targets failed; carries the per-target results"""
+
+    def __init__(self, message: str, target_results: Dict[str, Any]):
+        super().__init__(message)
+        self.target_results = target_results
+
+
+class DeferredPublishError(Exception):
+    """Some fan-out targets are rate limited for longer than a lease allows"""
+
+    def __init__(self, message: str, target_results: Dict[str, Any], retry_in: float):
+        super().__init__(message)
+        self.target_results = target_results
+        self.retry_in = retry_in
+
+
+class PublishWorker:
+    """
+    Background worker threads that upload queued reels
+    """
+
+    def __init__(self, config: Dict[str, Any], queue: Optional[PublishQueue] = None, publisher=None):
+        publish_config = config.get('publish', {})
+
+        self.config = config
+        self.queue = queue or PublishQueue(config)
+        self.publisher = publisher
+        self.fanout = FanoutPublisher(config) if publish_config.get('targets') else None
+        self.limiter = get_rate_limiter(config)
+        self.timings = StageTimings(config)
+        self.num_workers = publish_config.get('workers', 1)
+        self.poll_interval = publish_config.get('poll_interval_seconds', 15)
+        # Rate limit waits inside one claim must leave room in the lease
+        # for the uploads themselves; longer waits reschedule the job
+        self.fanout_max_wait = publish_config.get('fanout_max_wait_seconds', self.queue.lease_seconds / 3)
+
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def _get_publisher(self):
+        if self.publisher is None:
+            from post_engine import PostEngine
+            self.publisher = PostEngine(self.config)
+        return self.publisher
+
+    def process_one(self, worker_id: str) -> bool:
+        """
+        Claim and publish a single due job
+
+        Returns:
+            True if a job was processed
+        """
+        job = self.queue.claim(worker_id)
+        if job is None:
+            return False
+
+        with log_context(stage="upload"):
+            self._process(worker_id, job)
+        return True
+
+    def _process(self, worker_id: str, job: Dict[str, Any]):
+        """Publish a claimed job, recording success or scheduling a retry"""
+        logger.info(f"[{worker_id}] Publishing job {job['id']}: '{job['title']}' (attempt {job['attempts'] + 1})")
+
+        started = time.time()
+        try:
+            if self.fanout:
+                result = self._publish_fanout(job, worker_id)
+            else:
+                result = self._get_publisher().publish_to_facebook(
+                    job['video_path'],
+                    job['title'],
+                    job['description']
+                )
+        except DeferredPublishError as e:
+            if self.queue.defer(job['id'], e.retry_in, str(e), e.target_results, worker_id=worker_id):
+                logger.info(f"[{worker_id}] Job {job['id']}: {str(e)}, resuming in {e.retry_in:.0f}s")
+            else:
+                logger.warning(f"[{worker_id}] Job {job['id']}: {str(e)}, lease already passed to another worker")
+            return
+
+        except Exception as e:
+            job = self.queue.mark_failed(job['id'], str(e), getattr(e, 'target_results', None), worker_id=worker_id)
+            if job['status'] == 'failed':
+                logger.error(
+                    f"[{worker_id}] ❌ Job {job['id']} failed after {job['attempts']} attempts, "
+                    f"video kept at {job['video_path']}"
+                )
+            elif job['status'] == 'pending':
+                wait = job['next_attempt_at'] - time.time()
+                logger.warning(f"[{worker_id}] Job {job['id']} failed: {str(e)}, retrying in {wait:.0f}s")
+            else:
+                logger.warning(f"[{worker_id}] Job {job['id']} failed: {str(e)}, lease already passed to another worker")
+            return
+
+        # Recorded straight away: anything failing after this must not
+        # send the job back to the queue and post the reel twice
+        if self.queue.mark_published(job['id'], result, worker_id=worker_id):
+            logger.info(f"[{worker_id}] ✓ Job {job['id']} published")
+        else:
+            logger.warning(f"[{worker_id}] ⚠ Job {job['id']} published, but its lease had passed to another worker")
+
+        try:
+            self.timings.record('upload', time.time() - started)
+
+            late = started - job['release_at']
+            if job['attempts'] == 0 and late > 60:
+                logger.warning(f"[{worker_id}] ⚠ Job {job['id']} upload started {late / 60:.1f} min after its release time")
+        except Exception as e:
+            logger.warning(f"[{worker_id}] ⚠ Bookkeeping for job {job['id']} failed: {str(e)}")
+
+    def _publish_fanout(self, job: Dict[str, Any], worker_id: str) -> Dict[str, Any]:
+        """
+        Publish a job to all targets, skipping those done on earlier attempts
+
+        Each target's result is stored as its upload finishes, so a worker
+        taking over the job never posts to a target twice.
+
+        Returns:
+            Per-target results
+
+        Raises:
+            PartialPublishError: If any target failed
+            DeferredPublishError: If targets were left out for their rate limits
+        """
+        previous = json.loads(job.get('target_results') or '{}')
+        done = [name for name, r in previous.items() if r.get('success')]
+
+        def save(name: str, result: Dict[str, Any]):
+            if not self.queue.save_target_result(job['id'], worker_id, name, result):
+                logger.warning(f"[{worker_id}] Job {job['id']} lease passed to another worker during fan-out")
+
+        results = {
+            **previous,
+            **self.fanout.publish(
+                job['video_path'], job['title'], job['description'],
+                skip=done, max_wait=self.fanout_max_wait, on_result=save
+            )
+        }
+
+        failed = [name for name, r in results.items() if not r['success'] and not r.get('deferred')]
+        if failed:
+            raise PartialPublishError(f"Publish failed for: {', '.join(failed)}", results)
+
+        deferred = {name: r for name, r in results.items() if r.get('deferred')}
+        if deferred:
+            raise DeferredPublishError(
+                f"Rate limited: {', '.join(deferred)}",
+                results,
+                min(r['retry_in'] for r in deferred.values())
+            )
+
+        return results
+
+    def _run(self, worker_id: str):
+        while not self._stop.is_set():
+            try:
+                # Don't claim jobs while SocialBu is rate limiting us
+                wait = self.limiter.wait_time('socialbu')
+                if wait > 0:
+                    self._stop.wait(wait)
+                    continue
+
+                if not self.process_one(worker_id):
+                    self._stop.wait(self.poll_interval)
+            except Exception as e:
+                logger.error(f"[{worker_id}] Worker error: {str(e)}")
+                self._stop.wait(self.poll_interval)
+
+    def start(self):
+        """
+        Start worker threads in the background
+        """
+        for i in range(self.num_workers):
+            worker_id = f"{os.uname().nodename}-{os.getpid()}-{i}-{uuid.uuid4().hex[:6]}"
+            thread = threading.Thread(target=self._run, args=(worker_id,), name=f"publish-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"✓ Started {self.num_workers} publish worker(s)")
+
+    def stop(self, timeout: float = 30):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+
+def main():
+    """Publish queue CLI: run workers or inspect jobs"""
+    parser = argparse.ArgumentParser(description="Background publish queue")
+    parser.add_argument("command", choices=["worker", "list", "retry"])
+    parser.add_argument("job_id", nargs="?", type=int, help="Job to retry")
+    parser.add_argument("--status", help="Filter list by status")
+    parser.add_argument("--config", default="settings.yaml")
+    args = parser.parse_args()
+
+    with open(args.config, 'r') as f:
+        config = yaml.safe_load(f)
+    configure_logging(config)
+
+    queue = PublishQueue(config)
+
+    if args.command == "worker":
+        worker = PublishWorker(config, queue)
+        worker.start()
+        try:
+            while True:
+                time.sleep(60)
+        except KeyboardInterrupt:
+            logger.info("Stopping publish workers...")
+            worker.stop()
+
+    elif args.command == "retry":
+        if args.job_id is None or not queue.retry(args.job_id):
+            print("No failed job with that id")
+            sys.exit(1)
+        print(f"Job {args.job_id} requeued")
+
+    else:
+        for job in queue.list_jobs(args.status):
+            release = datetime.fromtimestamp(job['release_at']).strftime('%Y-%m-%d %H:%M')
+            print(f"{job['id']:5d}  {job['status']:12s} {job['attempts']:2d}  {release}  {job['title']}")
+
+
+if __name__ == "__main__":
+    main()
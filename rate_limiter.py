@@ -0,0 +1,440 @@
+import os
+import time
+import asyncio
+import uuid
+import sqlite3
+import threading
+from contextlib import contextmanager, asynccontextmanager
+from datetime import datetime, timezone, timedelta
+from email.utils import parsedate_to_datetime
+from typing import Dict, Any, Optional
+from utils.logger import setup_logger
+
+logger = setup_logger("rate_limiter")
+
+
+class QuotaExceededError(Exception):
+    """Daily quota for a provider is used up"""
+
+    def __init__(self, provider: str, reset_in: float):
+        super().__init__(f"Daily quota exhausted for {provider}, resets in {reset_in / 3600:.1f}h")
+        self.provider = provider
+        self.reset_in = reset_in
+
+
+class RateLimiter:
+    """
+    Token bucket, concurrency cap and daily quota per provider
+
+    State lives in a SQLite database so every thread and process on the
+    host sees the same buckets. The database uses WAL, so it must be on
+    local disk; hosts share limits through the job broker instead (see
+    RemoteRateLimiter). Providers without a rate_limits entry are not
+    limited.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        self.limits = config.get('rate_limits', {})
+        self.db_path = os.path.join(config['paths']['output'], "rate_limits.db")
+        self._init_db()
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _init_db(self):
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS buckets (
+                    provider TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    blocked_until REAL NOT NULL DEFAULT 0
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS leases (
+                    id TEXT PRIMARY KEY,
+                    provider TEXT NOT NULL,
+                    pid INTEGER NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS quota (
+                    provider TEXT NOT NULL,
+                    day TEXT NOT NULL,
+                    used INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (provider, day)
+                )
+            """)
+
+    def set_limits(self, provider: str, limits: Dict[str, Any]):
+        """
+        Limit a provider that isn't listed under rate_limits, e.g. a
+        publish target's own bucket
+        """
+        self.limits = {**self.limits, provider: limits}
+
+    def _try_acquire(self, provider: str, limits: Dict[str, Any]):
+        """
+        Attempt to take a token and a concurrency slot in one transaction
+
+        Returns:
+            Tuple of (lease id or None, seconds to wait before retrying)
+        """
+        now = time.time()
+        rate = limits.get('rate_per_minute', 60) / 60.0
+        burst = limits.get('burst', 1)
+        max_concurrent = limits.get('max_concurrent')
+        daily_quota = limits.get('daily_quota')
+        today = datetime.now(timezone.utc).strftime('%Y-%m-%d')
+
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("DELETE FROM leases WHERE expires_at < ?", (now,))
+
+                row = conn.execute("SELECT * FROM buckets WHERE provider = ?", (provider,)).fetchone()
+                if row is None:
+                    tokens, blocked_until = float(burst), 0.0
+                else:
+                    tokens = min(burst, row['tokens'] + (now - row['updated_at']) * rate)
+                    blocked_until = row['blocked_until']
+
+                wait = 0.0
+                if blocked_until > now:
+                    wait = blocked_until - now
+                elif tokens < 1:
+                    wait = (1 - tokens) / rate
+
+                if not wait and max_concurrent:
+                    active = conn.execute(
+                        "SELECT COUNT(*) FROM leases WHERE provider = ?", (provider,)
+                    ).fetchone()[0]
+                    if active >= max_concurrent:
+                        # No way to know when a slot frees up, check again shortly
+                        wait = 0.5
+
+                if not wait and daily_quota:
+                    used = conn.execute(
+                        "SELECT used FROM quota WHERE provider = ? AND day = ?", (provider, today)
+                    ).fetchone()
+                    if used and used[0] >= daily_quota:
+                        conn.execute("ROLLBACK")
+                        raise QuotaExceededError(provider, self._seconds_to_utc_midnight())
+
+                if wait:
+                    conn.execute("ROLLBACK")
+                    return None, wait
+
+                lease_id = uuid.uuid4().hex
+                conn.execute(
+                    """
+                    INSERT INTO buckets (provider, tokens, updated_at, blocked_until)
+                    VALUES (?, ?, ?, 0)
+                    ON CONFLICT(provider) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at
+                    """,
+                    (provider, tokens - 1, now)
+                )
+                conn.execute(
+                    "INSERT INTO leases (id, provider, pid, expires_at) VALUES (?, ?, ?, ?)",
+                    (lease_id, provider, os.getpid(), now + limits.get('lease_seconds', 900))
+                )
+                conn.execute(
+                    """
+                    INSERT INTO quota (provider, day, used) VALUES (?, ?, 1)
+                    ON CONFLICT(provider, day) DO UPDATE SET used = used + 1
+                    """,
+                    (provider, today)
+                )
+                conn.execute("COMMIT")
+                return lease_id, 0.0
+
+            except QuotaExceededError:
+                raise
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def acquire(self, provider: str, timeout: Optional[float] = None) -> Optional[str]:
+        """
+        Block until a call to the provider is allowed
+
+        Args:
+            provider: Provider name as configured under rate_limits
+            timeout: Give up after this many seconds
+
+        Returns:
+            Lease id to pass to release(), or None for unlimited providers
+
+        Raises:
+            QuotaExceededError: The daily quota is used up
+            TimeoutError: No slot within timeout
+        """
+        limits = self.limits.get(provider)
+        if not limits:
+            return None
+
+        started = time.time()
+        while True:
+            lease_id, wait = self._try_acquire(provider, limits)
+            if lease_id:
+                waited = time.time() - started
+                if waited >= 1:
+                    logger.info(f"Rate limiter: waited {waited:.1f}s for {provider}")
+                return lease_id
+
+            if timeout is not None and time.time() - started + wait > timeout:
+                raise TimeoutError(f"No {provider} slot within {timeout:.0f}s")
+            time.sleep(wait)
+
+    async def acquire_async(self, provider: str, timeout: Optional[float] = None) -> Optional[str]:
+        """
+        Async acquire(): waits without blocking the event loop
+        """
+        limits = self.limits.get(provider)
+        if not limits:
+            return None
+
+        started = time.time()
+        while True:
+            lease_id, wait = await asyncio.to_thread(self._try_acquire, provider, limits)
+            if lease_id:
+                waited = time.time() - started
+                if waited >= 1:
+                    logger.info(f"Rate limiter: waited {waited:.1f}s for {provider}")
+                return lease_id
+
+            if timeout is not None and time.time() - started + wait > timeout:
+                raise TimeoutError(f"No {provider} slot within {timeout:.0f}s")
+            await asyncio.sleep(wait)
+
+    def release(self, lease_id: Optional[str]):
+        """
+        Free the concurrency slot taken by acquire()
+        """
+        if not lease_id:
+            return
+        with self._connect() as conn:
+            conn.execute("DELETE FROM leases WHERE id = ?", (lease_id,))
+
+    @contextmanager
+    def slot(self, provider: str, timeout: Optional[float] = None):
+        """
+        Context manager holding a provider slot for the duration of a call
+        """
+        lease_id = self.acquire(provider, timeout)
+        try:
+            yield
+        finally:
+            self.release(lease_id)
+
+    @asynccontextmanager
+    async def slot_async(self, provider: str, timeout: Optional[float] = None):
+        """
+        Async slot() for coroutines sharing one event loop
+        """
+        lease_id = await self.acquire_async(provider, timeout)
+        try:
+            yield
+        finally:
+            await asyncio.to_thread(self.release, lease_id)
+
+    def block(self, provider: str, seconds: float):
+        """
+        Stop all callers from hitting the provider for the given time
+        """
+        until = time.time() + seconds
+        with self._connect() as conn:
+            conn.execute(
+                """
+                INSERT INTO buckets (provider, tokens, updated_at, blocked_until)
+                VALUES (?, 0, ?, ?)
+                ON CONFLICT(provider) DO UPDATE SET blocked_until = MAX(blocked_until, excluded.blocked_until)
+                """,
+                (provider, time.time(), until)
+            )
+        logger.warning(f"Rate limiter: {provider} blocked for {seconds:.0f}s")
+
+    def report_response(self, provider: str, response) -> Optional[float]:
+        """
+        Feed an HTTP response back into the limiter
+
+        A 429 or 503 blocks the provider for the Retry-After period (or a
+        short default when the header is missing).
+
+        Args:
+            provider: Provider name
+            response: requests/aiohttp response or None
+
+        Returns:
+            Seconds the provider is blocked for, or None if the response
+            wasn't a rate-limit signal
+        """
+        delay = self._retry_delay(provider, response)
+        if delay is not None:
+            self.block(provider, delay)
+        return delay
+
+    async def report_response_async(self, provider: str, response) -> Optional[float]:
+        """
+        Async report_response(): the block is written off the event loop
+        """
+        delay = self._retry_delay(provider, response)
+        if delay is not None:
+            await asyncio.to_thread(self.block, provider, delay)
+        return delay
+
+    def _retry_delay(self, provider: str, response) -> Optional[float]:
+        """
+        Block time a response asks for, None if it isn't a rate-limit signal
+        """
+        status = getattr(response, 'status_code', None) or getattr(response, 'status', None)
+        if status not in (429, 503):
+            return None
+
+        delay = self.parse_retry_after(response.headers.get('Retry-After'))
+        if delay is None:
+            delay = self.limits.get(provider, {}).get('default_retry_after', 30)
+        return delay
+
+    def wait_time(self, provider: str) -> float:
+        """
+        Seconds until a call to the provider could start, for scheduling
+
+        Returns:
+            0 when a call could go now; the time to quota reset when the
+            daily quota is used up
+        """
+        limits = self.limits.get(provider)
+        if not limits:
+            return 0.0
+        return self._bucket_wait(provider, limits)
+
+    def _bucket_wait(self, provider: str, limits: Dict[str, Any]) -> float:
+        now = time.time()
+        rate = limits.get('rate_per_minute', 60) / 60.0
+        burst = limits.get('burst', 1)
+
+        if limits.get('daily_quota') and self._quota_used(provider) >= limits['daily_quota']:
+            return self._seconds_to_utc_midnight()
+
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM buckets WHERE provider = ?", (provider,)).fetchone()
+
+        if row is None:
+            return 0.0
+        if row['blocked_until'] > now:
+            return row['blocked_until'] - now
+
+        tokens = min(burst, row['tokens'] + (now - row['updated_at']) * rate)
+        return 0.0 if tokens >= 1 else (1 - tokens) / rate
+
+    def quota_remaining(self, provider: str) -> Optional[int]:
+        """
+        Calls left today, or None without a daily quota
+        """
+        daily_quota = self.limits.get(provider, {}).get('daily_quota')
+        if not daily_quota:
+            return None
+        return max(0, daily_quota - self._quota_used(provider))
+
+    def _quota_used(self, provider: str) -> int:
+        today = datetime.now(timezone.utc).strftime('%Y-%m-%d')
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT used FROM quota WHERE provider = ? AND day = ?", (provider, today)
+            ).fetchone()
+        return row['used'] if row else 0
+
+    @staticmethod
+    def parse_retry_after(value: Optional[str]) -> Optional[float]:
+        """
+        Parse a Retry-After header given in seconds or as an HTTP date
+        """
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def _seconds_to_utc_midnight() -> float:
+        now = datetime.now(timezone.utc)
+        midnight = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+        return (midnight - now).total_seconds()
+
+
+class RemoteRateLimiter(RateLimiter):
+    """
+    Rate limiter whose buckets live on the job broker
+
+    Used on every node when distributed.broker_url is set, so a provider's
+    rate, concurrency cap, daily quota and Retry-After blocks hold across
+    all hosts rather than per host. Waiting still happens locally; only
+    the bucket reads and writes go to the broker.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        from broker_client import BrokerClient
+
+        self.limits = config.get('rate_limits', {})
+        self.client = BrokerClient(config)
+
+    def _try_acquire(self, provider: str, limits: Dict[str, Any]):
+        from broker_client import BrokerError
+
+        try:
+            lease_id, wait = self.client.call("limits/try_acquire", provider=provider, limits=limits)
+        except BrokerError as e:
+            if e.code == 'quota_exceeded':
+                raise QuotaExceededError(provider, e.payload.get('reset_in', 0))
+            raise
+        return lease_id, wait
+
+    def _bucket_wait(self, provider: str, limits: Dict[str, Any]) -> float:
+        return self.client.call("limits/bucket_wait", provider=provider, limits=limits)
+
+    def _quota_used(self, provider: str) -> int:
+        return self.client.call("limits/quota_used", provider=provider)
+
+    def release(self, lease_id: Optional[str]):
+        if not lease_id:
+            return
+        self.client.call("limits/release", lease_id=lease_id)
+
+    def block(self, provider: str, seconds: float):
+        self.client.call("limits/block", provider=provider, seconds=seconds)
+        logger.warning(f"Rate limiter: {provider} blocked for {seconds:.0f}s on all nodes")
+
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(config: Dict[str, Any]) -> RateLimiter:
+    """
+    Shared limiter per output directory, so all clients in a process use one instance
+
+    With distributed.broker_url set the limiter is the broker's, shared by
+    every node.
+    """
+    broker_url = config.get('distributed', {}).get('broker_url')
+    key = broker_url or os.path.abspath(config['paths']['output'])
+    with _limiters_lock:
+        if key not in _limiters:
+            _limiters[key] = RemoteRateLimiter(config) if broker_url else RateLimiter(config)
+        return _limiters[key]
@@ -0,0 +1,414 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import sqlite3
+import argparse
+import tempfile
+import threading
+import subprocess
+import contextvars
+import yaml
+from contextlib import contextmanager, asynccontextmanager
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+from utils.logger import setup_logger
+
+logger = setup_logger("resource_accounting")
+
+
+class StageUsage:
+    """
+    Resource counters for one pipeline stage of one run
+    """
+
+    def __init__(self):
+        self.child_cpu_seconds = 0.0
+        self.child_peak_rss_kb = 0
+        self.bytes_down = 0
+        self.bytes_up = 0
+        self.api_calls: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def add_child(self, usage):
+        with self._lock:
+            self.child_cpu_seconds += usage.ru_utime + usage.ru_stime
+            self.child_peak_rss_kb = max(self.child_peak_rss_kb, usage.ru_maxrss)
+
+    def add_http(self, provider: str, bytes_down: int, bytes_up: int, calls: int):
+        with self._lock:
+            self.bytes_down += bytes_down
+            self.bytes_up += bytes_up
+            if calls:
+                self.api_calls[provider] = self.api_calls.get(provider, 0) + calls
+
+
+# Counters of the stage running in the current thread/task. asyncio tasks
+# and asyncio.to_thread inherit it, so concurrent reels don't mix.
+_current_usage: contextvars.ContextVar[Optional[StageUsage]] = contextvars.ContextVar(
+    "current_usage", default=None
+)
+
+
+def record_http(provider: str, bytes_down: int = 0, bytes_up: int = 0, calls: int = 1):
+    """
+    Count an API call and its transfer against the running stage
+
+    No-op outside an accounted stage.
+    """
+    usage = _current_usage.get()
+    if usage is not None:
+        usage.add_http(provider, bytes_down or 0, bytes_up or 0, calls)
+
+
+def run_subprocess(cmd: List[str], timeout: Optional[float] = None, env: Optional[Dict[str, str]] = None):
+    """
+    subprocess.run() replacement that charges the child's rusage to the stage
+
+    The child is reaped with os.wait4, which reports its own CPU time and
+    peak memory, so concurrent FFmpeg runs in other threads don't leak in.
+    Output goes through temp files since the pipes can't be drained by
+    communicate() without reaping the child.
+
+    Returns:
+        subprocess.CompletedProcess with text stdout/stderr
+
+    Raises:
+        subprocess.TimeoutExpired: The child was killed after timeout
+    """
+    with tempfile.TemporaryFile() as out, tempfile.TemporaryFile() as err:
+        proc = subprocess.Popen(cmd, stdout=out, stderr=err, env=env)
+        deadline = time.time() + timeout if timeout else None
+
+        while True:
+            pid, status, usage = os.wait4(proc.pid, os.WNOHANG)
+            if pid:
+                break
+            if deadline and time.time() > deadline:
+                proc.kill()
+                _, status, usage = os.wait4(proc.pid, 0)
+                proc.returncode = os.waitstatus_to_exitcode(status)
+                _charge(usage)
+                raise subprocess.TimeoutExpired(cmd, timeout)
+            time.sleep(0.05)
+
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        _charge(usage)
+
+        out.seek(0)
+        err.seek(0)
+        return subprocess.CompletedProcess(
+            cmd,
+            proc.returncode,
+            out.read().decode(errors='replace'),
+            err.read().decode(errors='replace')
+        )
+
+
+def _charge(usage):
+    current = _current_usage.get()
+    if current is not None:
+        current.add_child(usage)
+
+
+class ResourceAccounting:
+    """
+    Per-run, per-stage resource usage stored in output/run_resources.db
+
+    The database uses WAL and must be on local disk, not shared between
+    hosts over NFS.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        accounting_config = config.get('accounting', {})
+
+        self.enabled = accounting_config.get('enabled', True)
+        self.db_path = os.path.join(config['paths']['output'], "run_resources.db")
+        self.costs = accounting_config.get('costs', {})
+        self.sora_daily_quota = config.get('rate_limits', {}).get('sora', {}).get('daily_quota')
+
+        if self.enabled:
+            self._init_db()
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _init_db(self):
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS runs (
+                    run_id TEXT PRIMARY KEY,
+                    started_at REAL NOT NULL,
+                    finished_at REAL,
+                    success INTEGER,
+                    genre TEXT,
+                    tier TEXT,
+                    reel_seconds REAL,
+                    host TEXT
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS stage_usage (
+                    run_id TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    started_at REAL NOT NULL,
+                    wall_seconds REAL NOT NULL,
+                    child_cpu_seconds REAL NOT NULL,
+                    child_peak_rss_kb INTEGER NOT NULL,
+                    bytes_down INTEGER NOT NULL,
+                    bytes_up INTEGER NOT NULL,
+                    api_calls TEXT NOT NULL,
+                    error TEXT
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_stage_usage_run ON stage_usage (run_id)")
+
+    @contextmanager
+    def stage(self, run_id: str, stage: str):
+        """
+        Account everything done inside the block to a run's stage
+        """
+        if not self.enabled:
+            yield None
+            return
+
+        usage = StageUsage()
+        token = _current_usage.set(usage)
+        started = time.time()
+        error = None
+        try:
+            yield usage
+        except Exception as e:
+            error = str(e)[:500]
+            raise
+        finally:
+            _current_usage.reset(token)
+            try:
+                self._save_stage(run_id, stage, started, time.time() - started, usage, error)
+            except Exception as e:
+                logger.warning(f"Could not record {stage} usage: {str(e)}")
+
+    @asynccontextmanager
+    async def stage_async(self, run_id: str, stage: str):
+        """
+        Async stage() for coroutines: the usage row is written off the event loop
+        """
+        if not self.enabled:
+            yield None
+            return
+
+        usage = StageUsage()
+        token = _current_usage.set(usage)
+        started = time.time()
+        error = None
+        try:
+            yield usage
+        except Exception as e:
+            error = str(e)[:500]
+            raise
+        finally:
+            _current_usage.reset(token)
+            try:
+                await asyncio.to_thread(
+                    self._save_stage, run_id, stage, started, time.time() - started, usage, error
+                )
+            except Exception as e:
+                logger.warning(f"Could not record {stage} usage: {str(e)}")
+
+    def _save_stage(self, run_id: str, stage: str, started: float, wall: float, usage: StageUsage, error: Optional[str]):
+        with self._connect() as conn:
+            conn.execute(
+                """
+                INSERT INTO runs (run_id, started_at, host) VALUES (?, ?, ?)
+                ON CONFLICT(run_id) DO NOTHING
+                """,
+                (run_id, started, os.uname().nodename)
+            )
+            conn.execute(
+                """
+                INSERT INTO stage_usage
+                    (run_id, stage, started_at, wall_seconds, child_cpu_seconds, child_peak_rss_kb,
+                     bytes_down, bytes_up, api_calls, error)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (run_id, stage, started, wall, usage.child_cpu_seconds, usage.child_peak_rss_kb,
+                 usage.bytes_down, usage.bytes_up, json.dumps(usage.api_calls), error)
+            )
+
+    def finish_run(self, state: Dict[str, Any], success: bool):
+        """
+        Record a run's outcome
+        """
+        if not self.enabled:
+            return
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    """
+                    INSERT INTO runs (run_id, started_at, host) VALUES (?, ?, ?)
+                    ON CONFLICT(run_id) DO NOTHING
+                    """,
+                    (state['run_id'], state.get('started', time.time()), os.uname().nodename)
+                )
+                conn.execute(
+                    """
+                    UPDATE runs SET finished_at = ?, success = ?, genre = ?, tier = ?, reel_seconds = ?
+                    WHERE run_id = ?
+                    """,
+                    (time.time(), int(success), state.get('genre'), state.get('tier'),
+                     state.get('reel_duration'), state['run_id'])
+                )
+        except Exception as e:
+            logger.warning(f"Could not record run outcome: {str(e)}")
+
+    def report(self, since: float, until: float) -> Dict[str, Any]:
+        """
+        Throughput, cost per reel and per-stage breakdown for runs started
+        in [since, until)
+
+        Returns:
+            Dict with runs, throughput, per_reel, stages, capacity and cost
+        """
+        with self._connect() as conn:
+            runs = [dict(r) for r in conn.execute(
+                "SELECT * FROM runs WHERE started_at >= ? AND started_at < ?", (since, until)
+            )]
+            run_ids = [r['run_id'] for r in runs]
+            stages = [dict(r) for r in conn.execute(
+                f"SELECT * FROM stage_usage WHERE run_id IN ({','.join('?' for _ in run_ids)})", run_ids
+            )] if run_ids else []
+
+        succeeded = [r for r in runs if r['success']]
+        n = max(1, len(succeeded))
+        days = max(1e-9, (until - since) / 86400)
+
+        totals = {"wall_seconds": 0.0, "child_cpu_seconds": 0.0, "bytes_down": 0, "bytes_up": 0}
+        api_calls: Dict[str, int] = {}
+        by_stage: Dict[str, Dict[str, Any]] = {}
+
+        for row in stages:
+            for key in totals:
+                totals[key] += row[key]
+            for provider, calls in json.loads(row['api_calls']).items():
+                api_calls[provider] = api_calls.get(provider, 0) + calls
+
+            entry = by_stage.setdefault(row['stage'], {
+                "count": 0, "wall": [], "child_cpu_seconds": 0.0, "peak_rss_kb": 0, "errors": 0
+            })
+            entry['count'] += 1
+            entry['wall'].append(row['wall_seconds'])
+            entry['child_cpu_seconds'] += row['child_cpu_seconds']
+            entry['peak_rss_kb'] = max(entry['peak_rss_kb'], row['child_peak_rss_kb'])
+            entry['errors'] += 1 if row['error'] else 0
+
+        total_wall = sum(sum(e['wall']) for e in by_stage.values()) or 1
+        stage_report = {}
+        for name, entry in by_stage.items():
+            walls = sorted(entry['wall'])
+            stage_report[name] = {
+                "runs": entry['count'],
+                "errors": entry['errors'],
+                "avg_wall_seconds": sum(walls) / len(walls),
+                "p95_wall_seconds": walls[max(0, -(-95 * len(walls) // 100) - 1)],
+                "wall_share": sum(walls) / total_wall,
+                "avg_child_cpu_seconds": entry['child_cpu_seconds'] / entry['count'],
+                "peak_rss_mb": entry['peak_rss_kb'] / 1024
+            }
+
+        per_reel = {
+            "wall_seconds": totals['wall_seconds'] / n,
+            "child_cpu_seconds": totals['child_cpu_seconds'] / n,
+            "mb_down": totals['bytes_down'] / n / (1024 * 1024),
+            "mb_up": totals['bytes_up'] / n / (1024 * 1024),
+            "api_calls": {p: c / n for p, c in api_calls.items()}
+        }
+
+        # Reels per day one box sustains, limited by CPU or by the Sora quota
+        capacity = {}
+        if per_reel['child_cpu_seconds'] > 0:
+            capacity['cpu'] = (os.cpu_count() or 1) * 86400 / per_reel['child_cpu_seconds']
+        sora_calls = per_reel['api_calls'].get('sora')
+        if self.sora_daily_quota and sora_calls:
+            capacity['sora_quota'] = self.sora_daily_quota / sora_calls
+        bottleneck = min(capacity, key=capacity.get) if capacity else None
+
+        cost = sum(per_reel['api_calls'].get(p, 0) * price for p, price in self.costs.get('api_calls', {}).items())
+        cost += per_reel['child_cpu_seconds'] / 3600 * self.costs.get('cpu_hour', 0)
+        cost += (per_reel['mb_down'] + per_reel['mb_up']) / 1024 * self.costs.get('transfer_gb', 0)
+
+        return {
+            "runs": len(runs),
+            "succeeded": len(succeeded),
+            "failed": len([r for r in runs if r['success'] == 0]),
+            "throughput_per_day": len(succeeded) / days,
+            "per_reel": per_reel,
+            "stages": stage_report,
+            "capacity_per_day": capacity,
+            "bottleneck": bottleneck,
+            "cost_per_reel": cost
+        }
+
+
+def _parse_date(value: str) -> float:
+    return datetime.fromisoformat(value).timestamp()
+
+
+def main():
+    """Resource accounting CLI: capacity and cost report"""
+    parser = argparse.ArgumentParser(description="Per-run resource usage report")
+    parser.add_argument("command", choices=["report"])
+    parser.add_argument("--since", help="Start date, ISO (default: 7 days ago)")
+    parser.add_argument("--until", help="End date, ISO (default: now)")
+    parser.add_argument("--json", action="store_true", help="Print raw JSON")
+    parser.add_argument("--config", default="settings.yaml")
+    args = parser.parse_args()
+
+    with open(args.config, 'r') as f:
+        config = yaml.safe_load(f)
+
+    until = _parse_date(args.until) if args.until else time.time()
+    since = _parse_date(args.since) if args.since else until - 7 * 86400
+
+    report = ResourceAccounting(config).report(since, until)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        sys.exit(0)
+
+    start, end = datetime.fromtimestamp(since), datetime.fromtimestamp(until)
+    print(f"Runs {start:%Y-%m-%d %H:%M} - {end:%Y-%m-%d %H:%M}: "
+          f"{report['succeeded']} ok, {report['failed']} failed, "
+          f"{report['throughput_per_day']:.1f} reels/day")
+
+    per_reel = report['per_reel']
+    print(f"\nPer reel: {per_reel['wall_seconds']:.0f}s wall, {per_reel['child_cpu_seconds']:.0f}s FFmpeg CPU, "
+          f"{per_reel['mb_down']:.1f} MB down, {per_reel['mb_up']:.1f} MB up, ~{report['cost_per_reel']:.3f} cost")
+    for provider, calls in sorted(per_reel['api_calls'].items()):
+        print(f"  {provider:12s} {calls:6.1f} calls")
+
+    print(f"\n{'stage':10s} {'avg':>7s} {'p95':>7s} {'share':>6s} {'cpu':>7s} {'rss MB':>7s} {'errors':>6s}")
+    for name, entry in sorted(report['stages'].items(), key=lambda kv: -kv[1]['wall_share']):
+        print(f"{name:10s} {entry['avg_wall_seconds']:6.0f}s {entry['p95_wall_seconds']:6.0f}s "
+              f"{entry['wall_share']:6.0%} {entry['avg_child_cpu_seconds']:6.0f}s "
+              f"{entry['peak_rss_mb']:7.0f} {entry['errors']:6d}")
+
+    if report['capacity_per_day']:
+        print()
+        for limit, reels in report['capacity_per_day'].items():
+            print(f"Capacity ({limit}): {reels:.0f} reels/day")
+        print(f"Bottleneck: {report['bottleneck']}")
+
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
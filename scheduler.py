@@ -1,84 +1,307 @@
-import schedule
-import time
-import yaml
-import subprocess
-import sys
-from datetime import datetime
-from utils.logger import setup_logger
-
-logger = setup_logger("scheduler")
-
-
-class ReelScheduler:
-    """
-    Schedule and manage automated reel generation
-    """
-
-    def __init__(self, config_path: str = "settings.yaml"):
-        with open(config_path, 'r') as f:
-            self.config = yaml.safe_load(f)
-
-        self.schedule_times = self.config['schedule']['times']
-        logger.info(f"Scheduler initialized with times: {self.schedule_times}")
-
-    def run_bot(self):
-        """Execute the bot"""
-        logger.info("\n" + "🎬" * 30)
-        logger.info(f"Scheduled run triggered at {datetime.now()}")
-        logger.info("🎬" * 30 + "\n")
-
-        try:
-            # Run main.py as subprocess
-            result = subprocess.run(
-                [sys.executable, "main.py"],
-                capture_output=True,
-                text=True,
-                timeout=600  # 10 minute timeout
-            )
-
-            if result.returncode == 0:
-                logger.info("✓ Bot execution successful")
-            else:
-                logger.error(f"❌ Bot execution failed with code {result.returncode}")
-                logger.error(f"STDERR: {result.stderr}")
-
-        except subprocess.TimeoutExpired:
-            logger.error("❌ Bot execution timeout (10 minutes)")
-        except Exception as e:
-            logger.error(f"❌ Error running bot: {str(e)}")
-
-    def start(self):
-        """Start the scheduler"""
-        logger.info("\n" + "=" * 60)
-        logger.info("AI REEL AUTOMATION SCHEDULER STARTED")
-        logger.info("=" * 60)
-
-        # Schedule jobs
-        for time_str in self.schedule_times:
-            schedule.every().day.at(time_str).do(self.run_bot)
-            logger.info(f"✓ Scheduled daily run at {time_str}")
-
-        logger.info(f"\nNext run: {schedule.next_run()}")
-        logger.info("Scheduler is now running. Press Ctrl+C to stop.\n")
-
-        # Run loop
-        try:
-            while True:
-                schedule.run_pending()
-                time.sleep(60)  # Check every minute
-
-        except KeyboardInterrupt:
-            logger.info("\n\nScheduler stopped by user")
-        except Exception as e:
-            logger.error(f"\n\nScheduler crashed: {str(e)}")
-            raise
-
-
-def main():
-    """Entry point for scheduler"""
-    scheduler = ReelScheduler()
-    scheduler.start()
-
-
-if __name__ == "__main__":
+import schedule
+import time
+import yaml
+import argparse
+import threading
+import subprocess
+import sys
+from datetime import datetime, timedelta, time as dt_time
+from typing import Dict, Any, List, Optional, Set
+from zoneinfo import ZoneInfo
+from utils.logger import setup_logger, configure_logging
+from stage_timings import StageTimings
+from storage_manager import StorageManager
+from publish_queue import PublishWorker
+from distributed_worker import submit_reels
+from sora_prefetch import SoraPrefetcher, PREFETCH_STAGES
+
+logger = setup_logger("scheduler")
+
+
+class ReelScheduler:
+    """
+    Schedule and manage automated reel generation
+
+    Runs start early enough for the reel to go live at each slot: the lead
+    time is the p95 of recent stage durations, and the finished reel is
+    held until the slot (publish queue release time, or a wait before an
+    inline upload).
+    """
+
+    def __init__(self, config_path: str = "settings.yaml"):
+        self.config_path = config_path
+        with open(config_path, 'r') as f:
+            self.config = yaml.safe_load(f)
+        configure_logging(self.config)
+
+        schedule_config = self.config['schedule']
+        self.schedule_times = schedule_config['times']
+        self.timezone = ZoneInfo(schedule_config.get('timezone', 'UTC'))
+        self.start_early = schedule_config.get('start_early', True)
+        self.lead_margin = schedule_config.get('lead_margin_minutes', 5) * 60
+        self.check_interval = schedule_config.get('check_interval_seconds', 30)
+        self.timings = StageTimings(self.config)
+        self._started_slots: Set[str] = set()
+        self._local_times: List[str] = []
+
+        self.storage = StorageManager(self.config)
+        self.sweep_interval_hours = self.config.get('storage', {}).get('sweep_interval_hours')
+
+        publish_config = self.config.get('publish', {})
+        self.queue_mode = publish_config.get('mode') == 'queue'
+        self.publish_worker = None
+        if self.queue_mode and publish_config.get('worker_in_scheduler', True):
+            self.publish_worker = PublishWorker(self.config)
+        self.distributed = self.config.get('distributed', {}).get('enabled', False)
+
+        # Staged clips live on this host, so worker nodes couldn't use them
+        self.prefetcher = SoraPrefetcher(self.config, config_path=config_path)
+        self.prefetch = self.prefetcher.enabled and self.start_early and not self.distributed
+        if self.prefetch:
+            self.storage.add_reference_provider(self.prefetcher.staged_paths)
+        logger.info(f"Scheduler initialized with times: {self.schedule_times} ({self.timezone.key})")
+
+    def lead_seconds(self, slot: Optional[datetime] = None) -> float:
+        """
+        Time to start a run before its slot; shorter when the slot's story
+        and Sora clip are already staged
+        """
+        prefetched = self.prefetch and slot is not None and self.prefetcher.is_ready(slot)
+        return self.timings.lead_seconds(exclude=PREFETCH_STAGES if prefetched else ()) + self.lead_margin
+
+    def upcoming_slots(self, now: Optional[datetime] = None, days: int = 2) -> List[datetime]:
+        """
+        Slot times after now, in the configured timezone
+        """
+        now = now or datetime.now(self.timezone)
+        slots = []
+        for offset in range(days):
+            day = (now + timedelta(days=offset)).date()
+            for time_str in self.schedule_times:
+                hour, minute = (int(part) for part in time_str.split(':'))
+                slot = datetime.combine(day, dt_time(hour, minute), tzinfo=self.timezone)
+                if slot > now:
+                    slots.append(slot)
+        return sorted(slots)
+
+    def plan(self, now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """
+        Start time and predicted outcome for each upcoming slot
+        """
+        now = now or datetime.now(self.timezone)
+        plan = []
+        for slot in self.upcoming_slots(now):
+            lead = self.lead_seconds(slot)
+            plan.append({
+                "slot": slot,
+                "start_at": slot - timedelta(seconds=lead),
+                "lead_seconds": lead,
+                # At start_at there is always less than the full lead left;
+                # only a start past the safety margin eats into the estimate
+                "at_risk": (slot - now).total_seconds() < lead - self.lead_margin,
+                "started": slot.isoformat() in self._started_slots,
+                "prefetched": self.prefetch and self.prefetcher.is_ready(slot)
+            })
+        return plan
+
+    def check_slots(self):
+        """
+        Start runs whose slot is within the lead time
+        """
+        now = datetime.now(self.timezone)
+
+        for entry in self.plan(now):
+            slot = entry['slot']
+            if entry['started'] or now < entry['start_at']:
+                continue
+
+            remaining = (slot - now).total_seconds()
+            if entry['at_risk']:
+                logger.warning(
+                    f"⚠ Slot {slot:%Y-%m-%d %H:%M %Z} predicted to miss: needs "
+                    f"~{(entry['lead_seconds'] - self.lead_margin) / 60:.0f} min, {remaining / 60:.0f} min left"
+                )
+
+            self._started_slots.add(slot.isoformat())
+            threading.Thread(target=self.run_bot, args=(slot,), name=f"run-{slot:%H%M}", daemon=True).start()
+
+        # Forget slots that have passed
+        self._started_slots = {s for s in self._started_slots if datetime.fromisoformat(s) > now}
+
+        if self.prefetch:
+            self.prefetch_slots(now)
+
+    def prefetch_slots(self, now: datetime):
+        """
+        Start Sora renders for the next slots, and drop stale staged clips
+        """
+        try:
+            self.prefetcher.expire(now)
+        except Exception as e:
+            logger.error(f"❌ Cleaning the Sora staging area failed: {str(e)}")
+
+        pending = [s for s in self.upcoming_slots(now) if s.isoformat() not in self._started_slots]
+        for slot in self.prefetcher.due_slots(pending, now):
+            threading.Thread(
+                target=self.prefetcher.prefetch,
+                args=(slot,),
+                name=f"prefetch-{slot:%H%M}",
+                daemon=True
+            ).start()
+
+    def run_bot(self, slot: Optional[datetime] = None):
+        """Execute the bot, for a given slot when starting early"""
+        logger.info("\n" + "🎬" * 30)
+        logger.info(f"Scheduled run triggered at {datetime.now()}" + (f" for slot {slot:%H:%M %Z}" if slot else ""))
+        logger.info("🎬" * 30 + "\n")
+
+        release_at = None
+        deadline = None
+        if slot:
+            # Uploading starts early enough (inline or from the queue) to be live at the slot
+            release_at = slot - timedelta(seconds=self.timings.estimate('upload'))
+            deadline = max(0.0, (release_at - datetime.now(self.timezone)).total_seconds())
+
+        if self.distributed:
+            # Worker nodes pick it up from the shared job queue
+            try:
+                submit_reels(
+                    self.config,
+                    release_at=release_at.timestamp() if release_at else None,
+                    deadline_seconds=deadline
+                )
+            except Exception as e:
+                logger.error(f"❌ Error submitting reel job: {str(e)}")
+            return
+
+        cmd = [sys.executable, "main.py", "--config", self.config_path]
+        timeout = 600  # 10 minute timeout
+        if slot:
+            cmd += ["--release-at", release_at.isoformat(), "--deadline", f"{deadline:.0f}"]
+            if self.prefetch:
+                cmd += ["--slot", slot.isoformat()]
+            # Inline publishing holds the reel in the process until the slot
+            timeout = max(timeout, (slot - datetime.now(self.timezone)).total_seconds() + 600)
+
+        try:
+            # Run main.py as subprocess
+            result = subprocess.run(
+                cmd,
+                capture_output=True,
+                text=True,
+                timeout=timeout
+            )
+
+            if result.returncode == 0:
+                logger.info("✓ Bot execution successful")
+                if release_at and datetime.now(self.timezone) > release_at:
+                    late = (datetime.now(self.timezone) - release_at).total_seconds()
+                    logger.warning(f"⚠ Slot {slot:%Y-%m-%d %H:%M %Z} missed: reel ready {late / 60:.1f} min late")
+            else:
+                logger.error(f"❌ Bot execution failed with code {result.returncode}")
+                logger.error(f"STDERR: {result.stderr}")
+
+        except subprocess.TimeoutExpired:
+            logger.error(f"❌ Bot execution timeout ({timeout / 60:.0f} minutes)")
+        except Exception as e:
+            logger.error(f"❌ Error running bot: {str(e)}")
+
+    def schedule_slot_runs(self):
+        """
+        Register daily runs at the slot times
+
+        schedule runs jobs in the host's local time, so the slots are
+        converted from the configured timezone. Called hourly: the jobs are
+        re-registered when a DST change on either side moves them.
+        """
+        now = datetime.now(self.timezone)
+        local_times = sorted({
+            slot.astimezone().strftime('%H:%M')
+            for slot in self.upcoming_slots(now)[:len(self.schedule_times)]
+        })
+        if local_times == self._local_times:
+            return
+
+        schedule.clear('slot-run')
+        for time_str in local_times:
+            schedule.every().day.at(time_str).do(self.run_bot).tag('slot-run')
+            logger.info(f"✓ Scheduled daily run at {time_str} local time")
+        self._local_times = local_times
+
+    def run_storage_sweep(self):
+        """Apply output retention policies"""
+        try:
+            self.storage.sweep()
+        except Exception as e:
+            logger.error(f"❌ Storage sweep failed: {str(e)}")
+
+    def start(self):
+        """Start the scheduler"""
+        logger.info("\n" + "=" * 60)
+        logger.info("AI REEL AUTOMATION SCHEDULER STARTED")
+        logger.info("=" * 60)
+
+        # Schedule jobs
+        if self.start_early:
+            schedule.every(self.check_interval).seconds.do(self.check_slots)
+            for entry in self.plan():
+                logger.info(
+                    f"✓ Slot {entry['slot']:%Y-%m-%d %H:%M %Z}: start at {entry['start_at']:%H:%M} "
+                    f"(lead ~{entry['lead_seconds'] / 60:.0f} min)"
+                    + (" ⚠ predicted to miss" if entry['at_risk'] else "")
+                )
+        else:
+            self.schedule_slot_runs()
+            schedule.every().hour.do(self.schedule_slot_runs)
+
+        if self.sweep_interval_hours:
+            schedule.every(self.sweep_interval_hours).hours.do(self.run_storage_sweep)
+            logger.info(f"✓ Scheduled storage sweep every {self.sweep_interval_hours}h")
+
+        if self.publish_worker:
+            self.publish_worker.start()
+
+        logger.info(f"\nNext run: {schedule.next_run()}")
+        logger.info("Scheduler is now running. Press Ctrl+C to stop.\n")
+
+        # Run loop
+        try:
+            while True:
+                schedule.run_pending()
+                time.sleep(min(60, self.check_interval))
+
+        except KeyboardInterrupt:
+            logger.info("\n\nScheduler stopped by user")
+            if self.publish_worker:
+                self.publish_worker.stop()
+        except Exception as e:
+            logger.error(f"\n\nScheduler crashed: {str(e)}")
+            raise
+
+
+def main():
+    """Entry point for scheduler"""
+    parser = argparse.ArgumentParser(description="Reel scheduler")
+    parser.add_argument("command", nargs="?", default="run", choices=["run", "plan"])
+    args = parser.parse_args()
+
+    scheduler = ReelScheduler()
+
+    if args.command == "plan":
+        for stage, entry in scheduler.timings.summary().items():
+            print(f"{stage:10s} p95 {entry['estimate']:7.0f}s  ({entry['samples']} samples)")
+        print()
+        for entry in scheduler.plan():
+            print(
+                f"{entry['slot']:%Y-%m-%d %H:%M %Z}  start {entry['start_at']:%H:%M}  "
+                f"lead {entry['lead_seconds'] / 60:4.0f} min"
+                + ("  prefetched" if entry['prefetched'] else "")
+                + ("  PREDICTED MISS" if entry['at_risk'] else "")
+            )
+        return
+
+    scheduler.start()
+
+
+if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,154 +1,351 @@
-import requests
-import time
-from typing import Dict, Any
-from utils.logger import setup_logger
-
-logger = setup_logger("sora_client")
-
-
-class SoraClient:
-    """
-    Client for Sora 2 video generation via RapidAPI
-    """
-
-    def __init__(self, config: Dict[str, Any]):
-        self.api_key = config['sora']['key']
-        self.host = config['sora']['host']
-        self.api_url = config['sora']['api_url']
-        self.max_retries = config['video']['max_retries']
-
-    def generate_video(self, visual_prompt: str, output_path: str) -> str:
-        """
-        Generate video using Sora 2 API
-
-        Args:
-            visual_prompt: Detailed scene description
-            output_path: Where to save the video
-
-        Returns:
-            Path to downloaded video file
-        """
-        try:
-            # Enhance prompt for Pocket-FM style
-            enhanced_prompt = f"""Pocket-FM style cinematic short video: {visual_prompt}
-
-Style requirements:
-- Vertical 9:16 portrait format
-- Cinematic color grading
-- Dramatic lighting
-- Emotional atmosphere
-- Professional film quality
-- Smooth camera movement
-- 30 seconds duration
-- High detail and realism"""
-
-            headers = {
-                "X-Rapidapi-Key": self.api_key,
-                "X-Rapidapi-Host": self.host,
-                "Content-Type": "application/json"
-            }
-
-            payload = {
-                "input": enhanced_prompt,
-                "model": "Sora 2",
-                "videoCount": "1",
-                "type": "text/video",
-                "resolution": "portrait"
-            }
-
-            logger.info("Requesting video generation from Sora 2...")
-
-            for attempt in range(self.max_retries):
-                try:
-                    response = requests.post(
-                        self.api_url,
-                        headers=headers,
-                        json=payload,
-                        timeout=300  # 5 minutes timeout
-                    )
-                    response.raise_for_status()
-
-                    result = response.json()
-                    logger.info(f"Sora API Response: {result}")
-
-                    # Handle different response formats
-                    video_url = None
-
-                    if isinstance(result, dict):
-                        # Try different possible keys
-                        video_url = (result.get('video_url') or
-                                     result.get('url') or
-                                     result.get('output') or
-                                     result.get('data', {}).get('url'))
-
-                        # If status is processing, wait and poll
-                        if result.get('status') == 'processing':
-                            task_id = result.get('task_id') or result.get('id')
-                            if task_id:
-                                video_url = self._poll_video_status(task_id, headers)
-
-                    if video_url:
-                        logger.info(f"Video URL received: {video_url}")
-                        return self._download_video(video_url, output_path)
-                    else:
-                        logger.warning(f"Attempt {attempt + 1}: No video URL in response")
-
-                except requests.exceptions.RequestException as e:
-                    logger.warning(f"Attempt {attempt + 1} failed: {str(e)}")
-                    if attempt < self.max_retries - 1:
-                        time.sleep(10)
-                    else:
-                        raise
-
-            raise Exception("Failed to generate video after all retries")
-
-        except Exception as e:
-            logger.error(f"Error in video generation: {str(e)}")
-            raise
-
-    def _poll_video_status(self, task_id: str, headers: Dict, max_wait: int = 300) -> str:
-        """
-        Poll for video generation completion
-        """
-        logger.info(f"Polling for video completion (task: {task_id})...")
-        start_time = time.time()
-
-        while time.time() - start_time < max_wait:
-            try:
-                # Adjust this endpoint based on actual API documentation
-                status_url = f"{self.api_url}/{task_id}"
-                response = requests.get(status_url, headers=headers, timeout=30)
-                response.raise_for_status()
-
-                result = response.json()
-                status = result.get('status')
-
-                if status == 'completed':
-                    return result.get('video_url') or result.get('url')
-                elif status == 'failed':
-                    raise Exception(f"Video generation failed: {result.get('error')}")
-
-                logger.info(f"Status: {status}, waiting...")
-                time.sleep(10)
-
-            except Exception as e:
-                logger.warning(f"Polling error: {str(e)}")
-                time.sleep(10)
-
-        raise Exception("Video generation timeout")
-
-    def _download_video(self, video_url: str, output_path: str) -> str:
-        """
-        Download video from URL
-        """
-        logger.info(f"Downloading video to {output_path}...")
-
-        response = requests.get(video_url, stream=True, timeout=120)
-        response.raise_for_status()
-
-        with open(output_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
-
-        logger.info(f"✓ Video downloaded: {output_path}")
-        return output_path
\ No newline at end of file
+import requests
+import aiohttp
+import asyncio
+import json
+import os
+import time
+from typing import Dict, Any, Optional, Tuple
+from utils.logger import setup_logger
+from rate_limiter import get_rate_limiter
+from sora_webhook import get_webhook_receiver
+from resource_accounting import record_http
+
+logger = setup_logger("sora_client")
+
+
+class SoraClient:
+    """
+    Client for Sora 2 video generation via RapidAPI
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        self.api_key = config['sora']['key']
+        self.host = config['sora']['host']
+        self.api_url = config['sora']['api_url']
+        self.max_retries = config['video']['max_retries']
+        self.poll_interval = config['sora'].get('poll_interval', 10)
+        self.limiter = get_rate_limiter(config)
+        self.webhook = get_webhook_receiver(config)
+
+    def generate_video(self, visual_prompt: str, output_path: str) -> str:
+        """
+        Generate video using Sora 2 API
+
+        Args:
+            visual_prompt: Detailed scene description
+            output_path: Where to save the video
+
+        Returns:
+            Path to downloaded video file
+        """
+        try:
+            headers, payload = self._build_request(visual_prompt)
+
+            logger.info("Requesting video generation from Sora 2...")
+
+            for attempt in range(self.max_retries):
+                try:
+                    with self.limiter.slot('sora'):
+                        response = requests.post(
+                            self.api_url,
+                            headers=headers,
+                            json=payload,
+                            timeout=300  # 5 minutes timeout
+                        )
+                    record_http('sora', len(response.content), len(response.request.body or b''))
+                    self.limiter.report_response('sora', response)
+                    response.raise_for_status()
+
+                    result = response.json()
+                    logger.debug(f"Sora API Response: {result}")
+
+                    video_url, task_id = self._parse_response(result)
+                    if task_id:
+                        # Status is processing, wait and poll
+                        video_url = self._poll_video_status(task_id, headers)
+
+                    if video_url:
+                        logger.info(f"Video URL received: {video_url}")
+                        return self._download_video(video_url, output_path)
+                    else:
+                        logger.warning(f"Attempt {attempt + 1}: No video URL in response")
+
+                except requests.exceptions.RequestException as e:
+                    logger.warning(f"Attempt {attempt + 1} failed: {str(e)}")
+                    if attempt >= self.max_retries - 1:
+                        raise
+
+                    status = getattr(getattr(e, 'response', None), 'status_code', None)
+                    if status not in (429, 503):
+                        # Rate-limit responses already block the limiter for
+                        # exactly Retry-After; anything else backs off
+                        time.sleep(10 * 2 ** attempt)
+
+            raise Exception("Failed to generate video after all retries")
+
+        except Exception as e:
+            logger.error(f"Error in video generation: {str(e)}")
+            raise
+
+    def _build_request(self, visual_prompt: str) -> Tuple[Dict, Dict]:
+        """
+        Build headers and payload for a generation request
+        """
+        # Enhance prompt for Pocket-FM style
+        enhanced_prompt = f"""Pocket-FM style cinematic short video: {visual_prompt}
+
+Style requirements:
+- Vertical 9:16 portrait format
+- Cinematic color grading
+- Dramatic lighting
+- Emotional atmosphere
+- Professional film quality
+- Smooth camera movement
+- 30 seconds duration
+- High detail and realism"""
+
+        headers = {
+            "X-Rapidapi-Key": self.api_key,
+            "X-Rapidapi-Host": self.host,
+            "Content-Type": "application/json"
+        }
+
+        payload = {
+            "input": enhanced_prompt,
+            "model": "Sora 2",
+            "videoCount": "1",
+            "type": "text/video",
+            "resolution": "portrait"
+        }
+
+        if self.webhook:
+            payload[self.webhook.callback_field] = self.webhook.callback_url
+
+        return headers, payload
+
+    @staticmethod
+    def _parse_response(result: Any) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Get the video URL, or the task id to poll while still processing
+
+        Returns:
+            Tuple of (video_url, task_id), either may be None
+        """
+        if not isinstance(result, dict):
+            return None, None
+
+        # Handle different response formats
+        video_url = (result.get('video_url') or
+                     result.get('url') or
+                     result.get('output') or
+                     result.get('data', {}).get('url'))
+
+        task_id = None
+        if result.get('status') == 'processing':
+            task_id = result.get('task_id') or result.get('id')
+
+        return video_url, task_id
+
+    @staticmethod
+    def _poll_result(result: Dict[str, Any]) -> Optional[str]:
+        """
+        Video URL from a status response, None while still running
+
+        Raises:
+            Exception: Generation failed
+        """
+        status = result.get('status')
+
+        if status == 'completed':
+            return result.get('video_url') or result.get('url')
+        elif status == 'failed':
+            raise Exception(f"Video generation failed: {result.get('error')}")
+
+        logger.info(f"Status: {status}, waiting...")
+        return None
+
+    def _poll_video_status(self, task_id: str, headers: Dict, max_wait: int = 300) -> str:
+        """
+        Poll for video generation completion
+        """
+        logger.info(f"Polling for video completion (task: {task_id})...")
+        start_time = time.time()
+
+        while time.time() - start_time < max_wait:
+            if self.webhook:
+                # Woken by the completion callback; the status request
+                # below only runs as a fallback if none arrives
+                payload = self.webhook.wait(task_id, self._callback_timeout(start_time, max_wait))
+                video_url = self._poll_result(payload) if payload else None
+                if video_url:
+                    return video_url
+
+            try:
+                # Adjust this endpoint based on actual API documentation
+                status_url = f"{self.api_url}/{task_id}"
+                with self.limiter.slot('sora_poll'):
+                    response = requests.get(status_url, headers=headers, timeout=30)
+                record_http('sora_poll', len(response.content))
+                if self.limiter.report_response('sora_poll', response):
+                    # Next slot() waits out the Retry-After
+                    continue
+                response.raise_for_status()
+
+                result = response.json()
+
+            except (requests.exceptions.RequestException, ValueError) as e:
+                logger.warning(f"Polling error: {str(e)}")
+                if not self.webhook:
+                    time.sleep(self.poll_interval)
+                continue
+
+            video_url = self._poll_result(result)
+            if video_url:
+                return video_url
+
+            if not self.webhook:
+                time.sleep(self.poll_interval)
+
+        raise Exception("Video generation timeout")
+
+    def _callback_timeout(self, start_time: float, max_wait: int) -> float:
+        """
+        How long to wait for a callback before falling back to a status poll
+        """
+        remaining = max_wait - (time.time() - start_time)
+        return max(0.0, min(self.webhook.fallback_poll_seconds, remaining))
+
+    def _download_video(self, video_url: str, output_path: str) -> str:
+        """
+        Download video from URL
+        """
+        logger.info(f"Downloading video to {output_path}...")
+
+        response = requests.get(video_url, stream=True, timeout=120)
+        response.raise_for_status()
+
+        with open(output_path, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=8192):
+                f.write(chunk)
+        record_http('sora', os.path.getsize(output_path), calls=0)
+
+        logger.info(f"✓ Video downloaded: {output_path}")
+        return output_path
+
+
+class AsyncSoraClient(SoraClient):
+    """
+    Sora client for asyncio pipelines; render waits don't hold a thread
+    """
+
+    def __init__(self, config: Dict[str, Any], session: aiohttp.ClientSession):
+        super().__init__(config)
+        self.session = session
+
+    async def generate_video(self, visual_prompt: str, output_path: str) -> str:
+        """
+        Async generate_video()
+        """
+        try:
+            headers, payload = self._build_request(visual_prompt)
+
+            logger.info("Requesting video generation from Sora 2...")
+
+            for attempt in range(self.max_retries):
+                try:
+                    async with self.limiter.slot_async('sora'):
+                        async with self.session.post(
+                                self.api_url,
+                                headers=headers,
+                                json=payload,
+                                timeout=aiohttp.ClientTimeout(total=300)
+                        ) as response:
+                            record_http('sora', response.content_length or 0, len(json.dumps(payload)))
+                            await self.limiter.report_response_async('sora', response)
+                            response.raise_for_status()
+                            result = await response.json(content_type=None)
+
+                    logger.debug(f"Sora API Response: {result}")
+
+                    video_url, task_id = self._parse_response(result)
+                    if task_id:
+                        video_url = await self._poll_video_status(task_id, headers)
+
+                    if video_url:
+                        logger.info(f"Video URL received: {video_url}")
+                        return await self._download_video(video_url, output_path)
+                    else:
+                        logger.warning(f"Attempt {attempt + 1}: No video URL in response")
+
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    logger.warning(f"Attempt {attempt + 1} failed: {str(e)}")
+                    if attempt >= self.max_retries - 1:
+                        raise
+
+                    if getattr(e, 'status', None) not in (429, 503):
+                        await asyncio.sleep(10 * 2 ** attempt)
+
+            raise Exception("Failed to generate video after all retries")
+
+        except Exception as e:
+            logger.error(f"Error in video generation: {str(e)}")
+            raise
+
+    async def _poll_video_status(self, task_id: str, headers: Dict, max_wait: int = 300) -> str:
+        """
+        Async _poll_video_status()
+        """
+        logger.info(f"Polling for video completion (task: {task_id})...")
+        start_time = time.time()
+
+        while time.time() - start_time < max_wait:
+            if self.webhook:
+                payload = await self.webhook.wait_async(task_id, self._callback_timeout(start_time, max_wait))
+                video_url = self._poll_result(payload) if payload else None
+                if video_url:
+                    return video_url
+
+            try:
+                status_url = f"{self.api_url}/{task_id}"
+                async with self.limiter.slot_async('sora_poll'):
+                    async with self.session.get(
+                            status_url,
+                            headers=headers,
+                            timeout=aiohttp.ClientTimeout(total=30)
+                    ) as response:
+                        record_http('sora_poll', response.content_length or 0)
+                        if await self.limiter.report_response_async('sora_poll', response):
+                            continue
+                        response.raise_for_status()
+                        result = await response.json(content_type=None)
+
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                logger.warning(f"Polling error: {str(e)}")
+                if not self.webhook:
+                    await asyncio.sleep(self.poll_interval)
+                continue
+
+            video_url = self._poll_result(result)
+            if video_url:
+                return video_url
+
+            if not self.webhook:
+                await asyncio.sleep(self.poll_interval)
+
+        raise Exception("Video generation timeout")
+
+    async def _download_video(self, video_url: str, output_path: str) -> str:
+        """
+        Async _download_video()
+        """
+        logger.info(f"Downloading video to {output_path}...")
+
+        async with self.session.get(video_url, timeout=aiohttp.ClientTimeout(total=120)) as response:
+            response.raise_for_status()
+            with open(output_path, 'wb') as f:
+                async for chunk in response.content.iter_chunked(64 * 1024):
+                    f.write(chunk)
+        record_http('sora', os.path.getsize(output_path), calls=0)
+
+        logger.info(f"✓ Video downloaded: {output_path}")
+        return output_path
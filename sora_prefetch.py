@@ -0,0 +1,285 @@
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import argparse
+import threading
+import yaml
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+from utils.logger import setup_logger, configure_logging, log_context
+
+logger = setup_logger("sora_prefetch")
+
+# Stages a prefetch runs ahead of the slot
+PREFETCH_STAGES = ["story", "video"]
+
+META_FILE = "meta.json"
+RAW_FILE = "raw.mp4"
+
+
+class SoraPrefetcher:
+    """
+    Prepare the story and Sora clip of upcoming schedule slots ahead of time
+
+    Each slot gets a staging entry, <staging>/<YYYYmmdd_HHMM>/, holding the
+    downloaded clip (raw.mp4) and meta.json with its status and the run
+    state after the story and video stages. The slot's run claims the entry
+    and only does TTS, composition and publishing. Entries not claimed
+    within stale_minutes after their slot are dropped.
+    """
+
+    def __init__(self, config: Dict[str, Any], bot=None, config_path: str = "settings.yaml"):
+        prefetch_config = config.get('prefetch', {})
+
+        self.config = config
+        self.enabled = prefetch_config.get('enabled', False)
+        self.slots_ahead = prefetch_config.get('slots_ahead', 1)
+        self.horizon = prefetch_config.get('horizon_hours', 3) * 3600
+        self.wait_seconds = prefetch_config.get('wait_seconds', 600)
+        self.stale_seconds = prefetch_config.get('stale_minutes', 60) * 60
+        self.render_timeout = prefetch_config.get('render_timeout_minutes', 60) * 60
+        self.staging_dir = config['paths'].get('sora_staging', os.path.join(config['paths']['output'], "sora_staging"))
+
+        self._bot = bot
+        self._config_path = config_path
+        self._lock = threading.Lock()
+
+    def _get_bot(self):
+        with self._lock:
+            if self._bot is None:
+                from main import ReelAutomationBot
+                self._bot = ReelAutomationBot(self._config_path)
+            return self._bot
+
+    @staticmethod
+    def slot_key(slot: datetime) -> str:
+        return slot.strftime('%Y%m%d_%H%M')
+
+    def entry_dir(self, slot: datetime) -> str:
+        return os.path.join(self.staging_dir, self.slot_key(slot))
+
+    def _load_meta(self, entry_dir: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(os.path.join(entry_dir, META_FILE), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save_meta(self, entry_dir: str, meta: Dict[str, Any]):
+        meta['updated'] = time.time()
+        meta_path = os.path.join(entry_dir, META_FILE)
+        tmp_path = f"{meta_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f, indent=2)
+        os.replace(tmp_path, meta_path)
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """
+        Staged entries with their meta (entry_dir added)
+        """
+        if not os.path.isdir(self.staging_dir):
+            return []
+
+        entries = []
+        for name in sorted(os.listdir(self.staging_dir)):
+            entry_dir = os.path.join(self.staging_dir, name)
+            meta = self._load_meta(entry_dir) if os.path.isdir(entry_dir) else None
+            if meta is not None:
+                entries.append({**meta, "entry_dir": entry_dir})
+        return entries
+
+    def is_ready(self, slot: datetime) -> bool:
+        meta = self._load_meta(self.entry_dir(slot))
+        return bool(meta) and meta['status'] == "ready"
+
+    def staged_paths(self) -> List[str]:
+        """
+        Files in staging, for StorageManager.add_reference_provider
+        """
+        return [
+            os.path.join(entry['entry_dir'], name)
+            for entry in self.entries()
+            for name in (RAW_FILE, META_FILE)
+        ]
+
+    def prefetch(self, slot: datetime) -> Optional[Dict[str, Any]]:
+        """
+        Pick the genre, write the story and render the Sora clip for a slot
+
+        Returns:
+            The staged run state, or None if the slot was already staged or
+            the prefetch failed
+        """
+        entry_dir = self.entry_dir(slot)
+        os.makedirs(self.staging_dir, exist_ok=True)
+        try:
+            # Also the lock: only one prefetch per slot
+            os.mkdir(entry_dir)
+        except FileExistsError:
+            return None
+
+        bot = self._get_bot()
+        state = bot.new_run(run_id=f"{self.slot_key(slot)}_{uuid.uuid4().hex[:6]}")
+        # Slots staged earlier haven't reached history yet, keep their genres out
+        state['exclude_genres'] = [e['genre'] for e in self.entries() if e.get('genre')]
+
+        meta = {"slot": slot.isoformat(), "status": "rendering", "pid": os.getpid(), "created": time.time()}
+        self._save_meta(entry_dir, meta)
+
+        logger.info(f"Prefetching story and Sora clip for slot {slot:%Y-%m-%d %H:%M %Z}...")
+        try:
+            with log_context(run_id=state['run_id']):
+                for stage in PREFETCH_STAGES:
+                    bot.run_stage(stage, state)
+
+            # Kept in staging until the slot's run moves it back
+            os.replace(state['raw_video_path'], os.path.join(entry_dir, RAW_FILE))
+
+        except Exception as e:
+            logger.error(f"❌ Prefetch for slot {slot:%H:%M %Z} failed: {str(e)}")
+            bot.fail_run(state)
+            # Left in place so the slot isn't retried on every check; the
+            # slot's run starts from scratch
+            self._save_meta(entry_dir, {**meta, "status": "failed", "error": str(e)})
+            return None
+
+        self._save_meta(entry_dir, {**meta, "status": "ready", "genre": state['genre'], "state": state})
+        logger.info(f"✓ Slot {slot:%H:%M %Z} staged: {state['story_data']['title']} ({state['genre']})")
+        return state
+
+    def claim(self, slot: datetime) -> Optional[Dict[str, Any]]:
+        """
+        Take the staged run for a slot, waiting for a render in progress
+
+        The clip is moved back to raw_videos, where the video stage wrote it.
+
+        Returns:
+            Run state with the story and video stages done, or None
+        """
+        entry_dir = self.entry_dir(slot)
+        deadline = time.time() + self.wait_seconds
+
+        meta = self._load_meta(entry_dir)
+        while meta and meta['status'] == "rendering" and self._alive(meta) and time.time() < deadline:
+            logger.info(f"Waiting for the Sora clip prefetched for slot {slot:%H:%M %Z}...")
+            time.sleep(10)
+            meta = self._load_meta(entry_dir)
+
+        if not meta or meta['status'] != "ready":
+            logger.info(f"No prefetched clip for slot {slot:%H:%M %Z}, generating from scratch")
+            return None
+
+        claimed_dir = f"{entry_dir}.claimed.{os.getpid()}"
+        try:
+            os.rename(entry_dir, claimed_dir)
+        except OSError:
+            # Another run claimed it first
+            return None
+
+        state = meta['state']
+        os.replace(os.path.join(claimed_dir, RAW_FILE), state['raw_video_path'])
+        shutil.rmtree(claimed_dir, ignore_errors=True)
+
+        logger.info(f"✓ Using prefetched story and clip for slot {slot:%H:%M %Z}: {state['story_data']['title']}")
+        return state
+
+    def _alive(self, meta: Dict[str, Any]) -> bool:
+        """
+        Whether a rendering entry's prefetch may still finish
+        """
+        if time.time() - meta.get('updated', 0) > self.render_timeout:
+            return False
+        try:
+            os.kill(meta['pid'], 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def expire(self, now: Optional[datetime] = None) -> int:
+        """
+        Drop staging entries that can no longer be used
+
+        That is, entries unclaimed stale_minutes after their slot, renders
+        whose process died or timed out, and leftovers of interrupted claims.
+
+        Returns:
+            Number of entries removed
+        """
+        if not os.path.isdir(self.staging_dir):
+            return 0
+
+        removed = 0
+        for entry in self.entries():
+            slot = datetime.fromisoformat(entry['slot'])
+            slot_age = ((now or datetime.now(slot.tzinfo)) - slot).total_seconds()
+
+            if entry['status'] == "rendering":
+                stale = not self._alive(entry)
+            else:
+                stale = slot_age > self.stale_seconds
+
+            if not stale:
+                continue
+
+            logger.info(f"Dropping {entry['status']} staged entry for slot {slot:%Y-%m-%d %H:%M %Z}")
+            if entry['status'] != "failed" and entry.get('state'):
+                # Ready but never used: close its run
+                self._get_bot().fail_run(entry['state'])
+            shutil.rmtree(entry['entry_dir'], ignore_errors=True)
+            removed += 1
+
+        for name in os.listdir(self.staging_dir):
+            path = os.path.join(self.staging_dir, name)
+            if ".claimed." in name and time.time() - os.path.getmtime(path) > self.render_timeout:
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+
+        return removed
+
+    def due_slots(self, slots: List[datetime], now: datetime) -> List[datetime]:
+        """
+        Of the upcoming slots, the next slots_ahead within the horizon that
+        have no staging entry yet
+        """
+        due = []
+        for slot in slots[:self.slots_ahead]:
+            if (slot - now).total_seconds() <= self.horizon and not os.path.exists(self.entry_dir(slot)):
+                due.append(slot)
+        return due
+
+
+def main():
+    """Sora prefetch CLI: inspect, prefetch or clean the staging area"""
+    parser = argparse.ArgumentParser(description="Prefetch story and Sora clip for upcoming slots")
+    parser.add_argument("command", choices=["status", "prefetch", "expire"])
+    parser.add_argument("--slot", help="Slot as ISO datetime with timezone (prefetch)")
+    parser.add_argument("--config", default="settings.yaml")
+    args = parser.parse_args()
+
+    with open(args.config, 'r') as f:
+        config = yaml.safe_load(f)
+    configure_logging(config)
+
+    prefetcher = SoraPrefetcher(config, config_path=args.config)
+
+    if args.command == "status":
+        for entry in prefetcher.entries():
+            title = entry.get('state', {}).get('story_data', {}).get('title', '')
+            print(f"{entry['slot']}  {entry['status']:9s}  {entry.get('genre', ''):18s}  {title}")
+    elif args.command == "prefetch":
+        if not args.slot:
+            parser.error("prefetch requires --slot")
+        sys.exit(0 if prefetcher.prefetch(datetime.fromisoformat(args.slot)) else 1)
+    else:
+        print(f"Removed {prefetcher.expire()} staging entries")
+
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+import sys
+import json
+import time
+import asyncio
+import argparse
+import threading
+import urllib.request
+import yaml
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from typing import Dict, Any, List, Optional, Callable
+from utils.logger import setup_logger
+
+logger = setup_logger("sora_webhook")
+
+CALLBACK_PATH = "/sora/callback"
+
+
+class WebhookReceiver:
+    """
+    Embedded HTTP endpoint receiving Sora completion callbacks
+
+    The callback URL is sent with each generation request. Notifications
+    are matched to waiting reels by task id; one that arrives before
+    anyone waits (the render finished before the POST returned) is kept
+    until picked up.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        webhook_config = config['sora'].get('webhook', {})
+
+        self.host = webhook_config.get('host', '0.0.0.0')
+        self.port = webhook_config.get('port', 8089)
+        self.public_url = webhook_config.get('public_url', f"http://localhost:{self.port}").rstrip('/')
+        self.secret = webhook_config.get('secret', '')
+        self.callback_field = webhook_config.get('callback_field', 'callback_url')
+        self.fallback_poll_seconds = webhook_config.get('fallback_poll_seconds', 60)
+        self.result_ttl = webhook_config.get('result_ttl_seconds', 3600)
+
+        self._lock = threading.Lock()
+        self._results: Dict[str, Dict[str, Any]] = {}
+        self._received_at: Dict[str, float] = {}
+        self._waiters: Dict[str, List[Callable[[Dict[str, Any]], None]]] = {}
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def callback_url(self) -> str:
+        url = self.public_url + CALLBACK_PATH
+        return f"{url}?token={self.secret}" if self.secret else url
+
+    def start(self) -> bool:
+        """
+        Start serving in a background thread
+
+        Returns:
+            False if the port couldn't be bound (callers fall back to polling)
+        """
+        if self._server:
+            return True
+
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                receiver._handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        except OSError as e:
+            logger.warning(f"Sora webhook disabled, can't listen on {self.host}:{self.port}: {str(e)}")
+            return False
+
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="sora-webhook", daemon=True).start()
+        logger.info(f"✓ Sora webhook listening on {self.host}:{self.port} ({self.public_url}{CALLBACK_PATH})")
+        return True
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def _handle(self, request: BaseHTTPRequestHandler):
+        url = urlparse(request.path)
+        token = parse_qs(url.query).get('token', [''])[0]
+
+        if url.path != CALLBACK_PATH:
+            request.send_response(404)
+            request.end_headers()
+            return
+        if self.secret and token != self.secret:
+            logger.warning(f"Rejected Sora callback with bad token from {request.client_address[0]}")
+            request.send_response(403)
+            request.end_headers()
+            return
+
+        try:
+            length = int(request.headers.get('Content-Length', 0))
+            payload = json.loads(request.rfile.read(length) or b'{}')
+            task_id = str(payload.get('task_id') or payload.get('id') or '')
+            if not task_id:
+                raise ValueError("no task id")
+        except (ValueError, TypeError) as e:
+            request.send_response(400)
+            request.end_headers()
+            request.wfile.write(f"Bad callback: {str(e)}".encode())
+            return
+
+        request.send_response(204)
+        request.end_headers()
+
+        logger.info(f"Sora callback for task {task_id}: {payload.get('status')}")
+        self.notify(task_id, payload)
+
+    def notify(self, task_id: str, payload: Dict[str, Any]):
+        """
+        Deliver a notification to the reel waiting on the task
+        """
+        with self._lock:
+            self._expire()
+            waiters = self._waiters.pop(task_id, [])
+            if not waiters:
+                self._results[task_id] = payload
+                self._received_at[task_id] = time.time()
+
+        for deliver in waiters:
+            deliver(payload)
+
+    def _expire(self):
+        cutoff = time.time() - self.result_ttl
+        for task_id in [t for t, at in self._received_at.items() if at < cutoff]:
+            self._results.pop(task_id, None)
+            self._received_at.pop(task_id, None)
+
+    def _take_or_register(self, task_id: str, deliver: Callable[[Dict[str, Any]], None]) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if task_id in self._results:
+                self._received_at.pop(task_id, None)
+                return self._results.pop(task_id)
+            self._waiters.setdefault(task_id, []).append(deliver)
+        return None
+
+    def _unregister(self, task_id: str, deliver: Callable[[Dict[str, Any]], None]):
+        with self._lock:
+            waiters = self._waiters.get(task_id, [])
+            if deliver in waiters:
+                waiters.remove(deliver)
+            if not waiters:
+                self._waiters.pop(task_id, None)
+
+    def wait(self, task_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """
+        Block until a notification for the task arrives
+
+        Returns:
+            Notification payload, or None on timeout
+        """
+        event = threading.Event()
+        received = {}
+
+        def deliver(payload):
+            received['payload'] = payload
+            event.set()
+
+        payload = self._take_or_register(str(task_id), deliver)
+        if payload is not None:
+            return payload
+
+        if not event.wait(timeout):
+            self._unregister(str(task_id), deliver)
+        return received.get('payload')
+
+    async def wait_async(self, task_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """
+        Async wait(); no thread is held while waiting
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def deliver(payload):
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(payload))
+
+        payload = self._take_or_register(str(task_id), deliver)
+        if payload is not None:
+            return payload
+
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self._unregister(str(task_id), deliver)
+            return None
+
+
+_receivers: Dict[str, WebhookReceiver] = {}
+_receivers_lock = threading.Lock()
+
+
+def get_webhook_receiver(config: Dict[str, Any]) -> Optional[WebhookReceiver]:
+    """
+    Shared, started receiver for the process, or None when callbacks are
+    disabled or the port is taken
+    """
+    webhook_config = config['sora'].get('webhook', {})
+    if not webhook_config.get('enabled', False):
+        return None
+
+    key = f"{webhook_config.get('host', '0.0.0.0')}:{webhook_config.get('port', 8089)}"
+    with _receivers_lock:
+        if key not in _receivers:
+            receiver = WebhookReceiver(config)
+            _receivers[key] = receiver if receiver.start() else None
+        return _receivers[key]
+
+
+def send_callback(
+        url: str,
+        task_id: str,
+        status: str = "completed",
+        video_url: Optional[str] = None,
+        error: Optional[str] = None
+) -> int:
+    """
+    Post a Sora-style completion notification (local stand-in sender)
+
+    Returns:
+        HTTP status of the receiver's response
+    """
+    payload = {"task_id": task_id, "status": status}
+    if video_url:
+        payload['video_url'] = video_url
+    if error:
+        payload['error'] = error
+
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(payload).encode(),
+        headers={"Content-Type": "application/json"},
+        method="POST"
+    )
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return response.status
+
+
+def main():
+    """Sora webhook CLI: run a receiver or send a test notification"""
+    parser = argparse.ArgumentParser(description="Sora completion webhook")
+    parser.add_argument("command", choices=["listen", "send"])
+    parser.add_argument("--task-id", help="Task id to notify (send)")
+    parser.add_argument("--status", default="completed", choices=["completed", "failed", "processing"])
+    parser.add_argument("--video-url", help="Finished video URL (send)")
+    parser.add_argument("--error", help="Failure reason (send)")
+    parser.add_argument("--url", help="Receiver URL (default: configured callback URL)")
+    parser.add_argument("--config", default="settings.yaml")
+    args = parser.parse_args()
+
+    with open(args.config, 'r') as f:
+        config = yaml.safe_load(f)
+
+    receiver = WebhookReceiver(config)
+
+    if args.command == "send":
+        if not args.task_id:
+            parser.error("send requires --task-id")
+        status = send_callback(args.url or receiver.callback_url, args.task_id, args.status, args.video_url, args.error)
+        print(f"Receiver answered {status}")
+        sys.exit(0)
+
+    if not receiver.start():
+        sys.exit(1)
+    print(f"Callback URL: {receiver.callback_url}")
+
+    original_notify = receiver.notify
+
+    def notify(task_id, payload):
+        print(json.dumps({"task_id": task_id, **payload}))
+        original_notify(task_id, payload)
+
+    receiver.notify = notify
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        receiver.stop()
+
+
+if __name__ == "__main__":
+    main()
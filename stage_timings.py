@@ -0,0 +1,99 @@
+import os
+import json
+import threading
+from typing import Dict, Any, List, Optional, Iterable
+from utils.logger import setup_logger
+
+logger = setup_logger("stage_timings")
+
+
+# Seconds per stage until enough runs have been measured. "upload" is the
+# upload itself, by the publish queue or inline; "publish" is the rest of
+# the publish stage, without the upload or the hold for the release time.
+DEFAULT_STAGE_SECONDS = {
+    "story": 20,
+    "video": 420,
+    "audio": 30,
+    "compose": 120,
+    "publish": 10,
+    "upload": 90,
+}
+
+
+class StageTimings:
+    """
+    Duration history per pipeline stage, for lead-time estimates
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        schedule_config = config.get('schedule', {})
+
+        self.timings_file = os.path.join(config['paths']['output'], "stage_timings.json")
+        self.max_samples = schedule_config.get('timing_samples', 50)
+        self.percentile = schedule_config.get('lead_percentile', 95)
+        self.defaults = {**DEFAULT_STAGE_SECONDS, **schedule_config.get('default_stage_seconds', {})}
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, List[float]]:
+        """Load duration history"""
+        if os.path.exists(self.timings_file):
+            try:
+                with open(self.timings_file, 'r') as f:
+                    return json.load(f)
+            except:
+                return {}
+        return {}
+
+    def _save(self, timings: Dict[str, List[float]]):
+        """Save duration history"""
+        os.makedirs(os.path.dirname(self.timings_file), exist_ok=True)
+        tmp_file = f"{self.timings_file}.{os.getpid()}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(timings, f, indent=2)
+        os.replace(tmp_file, self.timings_file)
+
+    def record(self, stage: str, seconds: float):
+        """
+        Add a measured stage duration, keeping the most recent samples
+        """
+        with self._lock:
+            timings = self._load()
+            samples = timings.setdefault(stage, [])
+            samples.append(round(seconds, 2))
+            del samples[:-self.max_samples]
+            self._save(timings)
+
+    def estimate(self, stage: str, timings: Optional[Dict[str, List[float]]] = None) -> float:
+        """
+        Percentile (p95 by default) duration of a stage
+
+        Falls back to the default estimate before any run was measured.
+        """
+        samples = sorted((timings if timings is not None else self._load()).get(stage, []))
+        if not samples:
+            return float(self.defaults.get(stage, 0))
+
+        # Nearest-rank percentile
+        rank = max(1, -(-self.percentile * len(samples) // 100))
+        return float(samples[int(rank) - 1])
+
+    def lead_seconds(self, exclude: Iterable[str] = ()) -> float:
+        """
+        Estimated time from starting a run until the reel is live
+
+        Args:
+            exclude: Stages already done (e.g. prefetched story and video)
+        """
+        timings = self._load()
+        stages = (set(self.defaults) | set(timings)) - set(exclude)
+        return sum(self.estimate(stage, timings) for stage in stages)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        Per-stage sample count and estimate
+        """
+        timings = self._load()
+        return {
+            stage: {"samples": len(timings.get(stage, [])), "estimate": self.estimate(stage, timings)}
+            for stage in sorted(set(self.defaults) | set(timings))
+        }
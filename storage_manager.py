@@ -0,0 +1,342 @@
+import os
+import sys
+import json
+import time
+import fcntl
+import shutil
+import argparse
+import threading
+import yaml
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Any, List, Set, Callable, Iterable
+from utils.logger import setup_logger, configure_logging
+from music_stems import MusicStemCache
+
+logger = setup_logger("storage_manager")
+
+
+class StorageManager:
+    """
+    Track per-run artifacts and apply retention policies to the output tree
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        self.paths = config['paths']
+        storage_config = config.get('storage', {})
+
+        self.retention = storage_config.get('retention', {})
+        self.temp_max_age_hours = storage_config.get('temp_max_age_hours', 6)
+        self.reference_indexes = storage_config.get('reference_indexes', [])
+        self.manifest_file = os.path.join(self.paths['output'], "run_manifest.json")
+        self.max_manifest_runs = storage_config.get('max_manifest_runs', 500)
+
+        self._lock = threading.Lock()
+        self._reference_providers: List[Callable[[], Iterable[str]]] = []
+
+        # Cached music is shared by later runs, whichever run downloaded it
+        stems = MusicStemCache(config)
+        if stems.enabled:
+            self.add_reference_provider(stems.cached_paths)
+
+    def _load_manifest(self) -> Dict:
+        """Load run manifest"""
+        if os.path.exists(self.manifest_file):
+            try:
+                with open(self.manifest_file, 'r') as f:
+                    return json.load(f)
+            except:
+                return {"runs": {}}
+        return {"runs": {}}
+
+    def _save_manifest(self, manifest: Dict):
+        """Save run manifest"""
+        os.makedirs(os.path.dirname(self.manifest_file), exist_ok=True)
+        tmp_file = f"{self.manifest_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_file, self.manifest_file)
+
+    @contextmanager
+    def _manifest_lock(self):
+        """
+        Exclusive lock on the manifest, held across read-modify-write so
+        threads and concurrent processes (batch workers) don't drop each
+        other's runs
+        """
+        os.makedirs(os.path.dirname(self.manifest_file), exist_ok=True)
+        with self._lock, open(self.manifest_file + ".lock", 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def track(self, run_id: str, path: str, kind: str = "artifact"):
+        """
+        Record a file produced by a run
+
+        Args:
+            run_id: Run identifier
+            path: File produced by the run
+            kind: "intermediate" (deleted once the run is published) or
+                "artifact" (kept until retention removes it)
+        """
+        if not path:
+            return
+
+        with self._manifest_lock():
+            manifest = self._load_manifest()
+            run = manifest['runs'].setdefault(run_id, {
+                "started": datetime.now().isoformat(timespec='seconds'),
+                "status": "running",
+                "artifacts": []
+            })
+            run['artifacts'].append({"path": os.path.abspath(path), "kind": kind})
+            self._save_manifest(manifest)
+
+    def complete_run(self, run_id: str, success: bool = True) -> int:
+        """
+        Mark a run finished and delete its intermediates if it succeeded
+
+        Failed runs keep their intermediates for debugging; the periodic
+        sweep removes them once they age out.
+
+        Args:
+            run_id: Run identifier
+            success: Whether the reel was produced and handed to publishing
+
+        Returns:
+            Bytes freed
+        """
+        freed = 0
+
+        with self._manifest_lock():
+            manifest = self._load_manifest()
+            run = manifest['runs'].get(run_id)
+            if run is None:
+                return 0
+
+            run['status'] = "completed" if success else "failed"
+            run['finished'] = datetime.now().isoformat(timespec='seconds')
+
+            # Keep the manifest bounded
+            if len(manifest['runs']) > self.max_manifest_runs:
+                for old_id in sorted(manifest['runs'])[:-self.max_manifest_runs]:
+                    del manifest['runs'][old_id]
+
+            self._save_manifest(manifest)
+
+            if success:
+                keep = self.referenced_paths()
+                for artifact in run['artifacts']:
+                    if artifact['kind'] == "intermediate" and artifact['path'] not in keep:
+                        freed += self._delete(artifact['path'])
+
+        if freed:
+            logger.info(f"✓ Removed intermediates for run {run_id} ({freed / (1024 * 1024):.1f} MB)")
+        return freed
+
+    def add_reference_provider(self, provider: Callable[[], Iterable[str]]):
+        """
+        Register a callable returning paths that must never be deleted
+        """
+        self._reference_providers.append(provider)
+
+    def referenced_paths(self) -> Set[str]:
+        """
+        Collect paths still in use
+
+        Includes every file of runs still in progress, any path listed in
+        the configured JSON cache indexes and paths from registered
+        providers.
+        """
+        referenced = set()
+
+        for run in self._load_manifest()['runs'].values():
+            if run.get('status') == "running":
+                referenced.update(a['path'] for a in run['artifacts'])
+
+        for index_file in self.reference_indexes:
+            if not os.path.exists(index_file):
+                continue
+            try:
+                with open(index_file, 'r') as f:
+                    referenced.update(self._paths_in(json.load(f)))
+            except Exception as e:
+                logger.warning(f"Could not read reference index {index_file}: {str(e)}")
+
+        for provider in self._reference_providers:
+            try:
+                referenced.update(os.path.abspath(p) for p in provider() if p)
+            except Exception as e:
+                logger.warning(f"Reference provider failed: {str(e)}")
+
+        return referenced
+
+    def _paths_in(self, data) -> Iterable[str]:
+        """
+        Yield every string in a JSON structure that is an existing file path
+        """
+        if isinstance(data, dict):
+            for key, value in data.items():
+                yield from self._paths_in(key)
+                yield from self._paths_in(value)
+        elif isinstance(data, list):
+            for value in data:
+                yield from self._paths_in(value)
+        elif isinstance(data, str) and os.path.isfile(data):
+            yield os.path.abspath(data)
+
+    def sweep(self, dry_run: bool = False) -> Dict[str, Any]:
+        """
+        Apply age, count and size retention to each configured directory
+
+        Stale temp_*.mp4 intermediates are removed from final_videos
+        regardless of policy. Referenced files are never deleted.
+
+        Args:
+            dry_run: Only report what would be deleted
+
+        Returns:
+            Dict with per-directory deleted file counts and bytes freed
+        """
+        logger.info("Running storage sweep" + (" (dry run)" if dry_run else "") + "...")
+
+        keep = self.referenced_paths()
+        now = time.time()
+        report = {"dry_run": dry_run, "directories": {}, "freed_bytes": 0}
+
+        for name, policy in self.retention.items():
+            directory = self.paths.get(name)
+            if not directory or not os.path.isdir(directory):
+                continue
+
+            files = sorted(
+                (f for f in self._list_files(directory) if f['path'] not in keep),
+                key=lambda f: f['mtime']
+            )
+            doomed = []
+
+            max_age_days = policy.get('max_age_days')
+            if max_age_days is not None:
+                cutoff = now - max_age_days * 86400
+                doomed += [f for f in files if f['mtime'] < cutoff]
+                files = [f for f in files if f['mtime'] >= cutoff]
+
+            if name == 'final_videos':
+                temp_cutoff = now - self.temp_max_age_hours * 3600
+                stale = [
+                    f for f in files
+                    if os.path.basename(f['path']).startswith('temp_') and f['mtime'] < temp_cutoff
+                ]
+                doomed += stale
+                files = [f for f in files if f not in stale]
+
+            # Oldest first until the directory fits its count and size limits
+            max_files = policy.get('max_files')
+            max_bytes = policy['max_size_mb'] * 1024 * 1024 if policy.get('max_size_mb') else None
+            total = sum(f['size'] for f in files)
+            while files and (
+                    (max_files is not None and len(files) > max_files) or
+                    (max_bytes is not None and total > max_bytes)
+            ):
+                oldest = files.pop(0)
+                total -= oldest['size']
+                doomed.append(oldest)
+
+            freed = 0
+            for f in doomed:
+                freed += f['size'] if dry_run else self._delete(f['path'])
+
+            report['directories'][name] = {"deleted": len(doomed), "freed_bytes": freed}
+            report['freed_bytes'] += freed
+
+        logger.info(
+            f"✓ Storage sweep {'would free' if dry_run else 'freed'} "
+            f"{report['freed_bytes'] / (1024 * 1024):.1f} MB"
+        )
+        return report
+
+    def disk_usage(self) -> Dict[str, Any]:
+        """
+        Report usage per output directory and free space on the output volume
+        """
+        report = {"directories": {}}
+
+        for name, directory in self.paths.items():
+            if name == 'output' or not os.path.isdir(directory):
+                continue
+            files = list(self._list_files(directory))
+            report['directories'][name] = {
+                "files": len(files),
+                "bytes": sum(f['size'] for f in files)
+            }
+
+        if os.path.isdir(self.paths['output']):
+            usage = shutil.disk_usage(self.paths['output'])
+            report['volume'] = {"total": usage.total, "used": usage.used, "free": usage.free}
+
+        return report
+
+    @staticmethod
+    def _list_files(directory: str) -> Iterable[Dict[str, Any]]:
+        for root, _, names in os.walk(directory):
+            for name in names:
+                path = os.path.abspath(os.path.join(root, name))
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield {"path": path, "size": stat.st_size, "mtime": stat.st_mtime}
+
+    @staticmethod
+    def _delete(path: str) -> int:
+        """
+        Delete a file, returning the bytes freed
+        """
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+            return size
+        except FileNotFoundError:
+            return 0
+        except OSError as e:
+            logger.warning(f"Could not delete {path}: {str(e)}")
+            return 0
+
+
+def _format_mb(size: int) -> str:
+    return f"{size / (1024 * 1024):.1f} MB"
+
+
+def main():
+    """Storage CLI: report usage or run a retention sweep"""
+    parser = argparse.ArgumentParser(description="Output storage management")
+    parser.add_argument("command", choices=["usage", "sweep"])
+    parser.add_argument("--dry-run", action="store_true", help="Report without deleting")
+    parser.add_argument("--config", default="settings.yaml")
+    args = parser.parse_args()
+
+    with open(args.config, 'r') as f:
+        config = yaml.safe_load(f)
+    configure_logging(config)
+
+    storage = StorageManager(config)
+
+    if args.command == "sweep":
+        report = storage.sweep(dry_run=args.dry_run)
+        for name, entry in report['directories'].items():
+            print(f"{name:15s} {entry['deleted']:5d} files  {_format_mb(entry['freed_bytes'])}")
+    else:
+        report = storage.disk_usage()
+        for name, entry in report['directories'].items():
+            print(f"{name:15s} {entry['files']:5d} files  {_format_mb(entry['bytes'])}")
+        if 'volume' in report:
+            print(f"{'free':15s}        {_format_mb(report['volume']['free'])}")
+
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
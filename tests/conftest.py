@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+# The bot's modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def config(tmp_path):
+    """Minimal configuration writing everything under a temporary directory"""
+    return {
+        "paths": {
+            "output": str(tmp_path / "output"),
+        },
+    }
@@ -0,0 +1,56 @@
+import pytest
+
+from distributed_worker import JobBroker, LeaseLostError, RemoteJobQueue, StageArtifacts
+
+
+@pytest.fixture
+def broker(config):
+    config['distributed'] = {"broker_host": "127.0.0.1", "broker_port": 0, "broker_token": "secret"}
+    broker = JobBroker(config)
+    broker.start()
+    yield broker
+    broker.stop()
+
+
+@pytest.fixture
+def node_config(broker, tmp_path):
+    port = broker._server.server_address[1]
+    return {
+        "paths": {"output": str(tmp_path / "node")},
+        "distributed": {"broker_url": f"http://127.0.0.1:{port}", "broker_token": "secret"},
+    }
+
+
+def test_remote_claim_is_exclusive_and_lease_checked(node_config):
+    queue = RemoteJobQueue(node_config)
+    job_id = queue.submit({"run_id": "run1"}, "story")
+
+    job = queue.claim("worker-a", ["story"])
+    assert job['id'] == job_id
+    assert queue.claim("worker-b", ["story"]) is None
+    assert not queue.heartbeat(job_id, "worker-b")
+
+    queue.advance(job_id, "worker-a", "video", job['state'])
+    with pytest.raises(LeaseLostError):
+        queue.advance(job_id, "worker-a", "audio", job['state'])
+
+
+def test_stage_files_travel_through_the_broker(node_config, tmp_path):
+    video = tmp_path / "node" / "raw.mp4"
+    video.parent.mkdir(parents=True)
+    video.write_bytes(b"frames" * 1000)
+    state = {"run_id": "run1", "raw_video_path": str(video)}
+
+    artifacts = StageArtifacts(node_config)
+    artifacts.push(state)
+    video.unlink()
+    artifacts.pull(state)
+
+    assert video.read_bytes() == b"frames" * 1000
+
+
+def test_bad_token_is_rejected(node_config):
+    node_config['distributed']['broker_token'] = "wrong"
+
+    with pytest.raises(Exception, match="403"):
+        RemoteJobQueue(node_config).counts()
@@ -0,0 +1,77 @@
+import json
+import os
+
+import pytest
+
+from encode_profiles import EncodeProfiles
+
+
+@pytest.fixture
+def profiles(config):
+    return EncodeProfiles(config)
+
+
+def test_no_deadline_uses_default_tier(config):
+    config['encode'] = {"default_tier": "draft"}
+    assert EncodeProfiles(config).choose_tier(30) == "draft"
+
+
+@pytest.mark.parametrize("deadline, tier", [
+    (200, "archival"),   # ~120s encode + ~48s upload
+    (100, "standard"),   # ~45s + ~28s
+    (50, "draft"),       # ~18s + ~16s
+])
+def test_picks_best_tier_within_deadline(profiles, deadline, tier):
+    assert profiles.choose_tier(30, deadline) == tier
+
+
+def test_falls_back_to_fastest_tier_when_nothing_fits(profiles):
+    assert profiles.choose_tier(30, 10) == "draft"
+
+
+def test_measured_stats_change_the_choice(config, profiles):
+    os.makedirs(config['paths']['output'])
+    with open(profiles.stats_file, 'w') as f:
+        json.dump({"tiers": {"archival": {"encode_ratio": 1.0}}, "upload": {"mbps": 50.0}}, f)
+
+    # Picked up from disk, e.g. written by another process
+    assert profiles.choose_tier(30, 40) == "archival"
+
+
+def test_target_size_caps_bitrate(config):
+    config['encode'] = {"target_size_mb": 10, "audio_bitrate_kbps": 128}
+    profiles = EncodeProfiles(config)
+
+    # 10 MB over 40s is 2048 kbps, less overhead and audio
+    assert profiles.target_bitrate_kbps(40) == int(2048 * 0.98 - 128)
+    assert profiles.estimate("archival", 40)['size_mb'] < 10
+
+
+def test_video_args_capped_crf_and_two_pass(config):
+    config['encode'] = {"max_bitrate_kbps": 3000, "mode": "two_pass"}
+    profiles = EncodeProfiles(config)
+
+    args, two_pass = profiles.video_args("standard", 30)
+    assert two_pass
+    assert args[args.index('-b:v') + 1] == "3000k"
+
+    args, two_pass = profiles.video_args("standard", 30, allow_two_pass=False)
+    assert not two_pass
+    assert args[args.index('-crf') + 1] == "23"
+    assert args[args.index('-maxrate') + 1] == "3000k"
+
+
+def test_unknown_tier_raises(profiles):
+    with pytest.raises(ValueError):
+        profiles.get_tier("lossless")
+
+
+def test_shared_encode_time_is_not_learned(config, profiles, tmp_path):
+    output = tmp_path / "reel.mp4"
+    output.write_bytes(b"\0" * 4_000_000)
+
+    profiles.record_encode("standard", 30, None, str(output))
+
+    measured = profiles.stats['tiers']['standard']
+    assert 'encode_ratio' not in measured
+    assert measured['bitrate_kbps'] > 0
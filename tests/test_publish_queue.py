@@ -0,0 +1,166 @@
+import json
+import time
+
+import pytest
+
+from publish_queue import PublishQueue, PublishWorker
+
+
+class FakePublisher:
+    def __init__(self, error=None):
+        self.error = error
+        self.calls = 0
+
+    def publish_to_facebook(self, video_path, title, description):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        return {"success": True, "post_id": f"post-{self.calls}"}
+
+
+class FakeTargetPublisher:
+    def __init__(self):
+        self.accounts = []
+
+    def publish(self, video_path, caption, account_id=None, post_type='reel', media=None, shared_slot=True):
+        self.accounts.append(account_id)
+        return {"post_id": f"post-{account_id}"}
+
+
+@pytest.fixture
+def queue(config):
+    config['publish'] = {"lease_seconds": 60, "max_attempts": 3, "backoff_base_seconds": 30}
+    return PublishQueue(config)
+
+
+@pytest.fixture
+def video(tmp_path):
+    path = tmp_path / "reel.mp4"
+    path.write_bytes(b"not really a video")
+    return str(path)
+
+
+def test_enqueue_same_video_returns_existing_job(queue, video):
+    first = queue.enqueue(video, "Title", "Description")
+    second = queue.enqueue(video, "Other title", "Other description")
+
+    assert second['id'] == first['id']
+    assert len(queue.list_jobs()) == 1
+
+
+def test_claimed_job_is_not_claimed_again_until_lease_expires(queue, video, monkeypatch):
+    job = queue.enqueue(video, "Title", "Description")
+
+    assert queue.claim("worker-a")['id'] == job['id']
+    assert queue.claim("worker-b") is None
+
+    later = time.time() + 61
+    monkeypatch.setattr(time, "time", lambda: later)
+    assert queue.claim("worker-b")['id'] == job['id']
+
+
+def test_expired_lease_cannot_overwrite_new_owner(queue, video, monkeypatch):
+    job = queue.enqueue(video, "Title", "Description")
+    queue.claim("worker-a")
+
+    later = time.time() + 61
+    monkeypatch.setattr(time, "time", lambda: later)
+    queue.claim("worker-b")
+
+    assert not queue.mark_published(job['id'], {"post_id": "late"}, worker_id="worker-a")
+    stale = queue.mark_failed(job['id'], "timeout", worker_id="worker-a")
+    assert stale['status'] == 'in_progress'
+    assert stale['attempts'] == 0
+
+    assert queue.mark_published(job['id'], {"post_id": "ok"}, worker_id="worker-b")
+    assert queue.list_jobs('published')[0]['id'] == job['id']
+
+
+def test_failed_attempts_back_off_then_park(queue, video):
+    job = queue.enqueue(video, "Title", "Description")
+    queue.claim("worker-a")
+
+    job = queue.mark_failed(job['id'], "boom", worker_id="worker-a")
+    assert job['status'] == 'pending'
+    assert job['attempts'] == 1
+    assert job['next_attempt_at'] > time.time()
+    assert queue.claim("worker-a") is None
+
+    queue.mark_failed(job['id'], "boom")
+    job = queue.mark_failed(job['id'], "boom")
+    assert job['status'] == 'failed'
+    assert job['attempts'] == 3
+
+    assert queue.retry(job['id'])
+    assert queue.list_jobs('pending')[0]['attempts'] == 0
+
+
+def test_worker_publishes_once_even_if_bookkeeping_fails(config, queue, video):
+    publisher = FakePublisher()
+    worker = PublishWorker(config, queue=queue, publisher=publisher)
+
+    def broken_record(stage, seconds):
+        raise OSError("disk full")
+
+    worker.timings.record = broken_record
+    job = queue.enqueue(video, "Title", "Description")
+
+    assert worker.process_one("worker-a")
+    assert queue.list_jobs('published')[0]['id'] == job['id']
+
+    # Nothing left to publish a second time
+    assert not worker.process_one("worker-a")
+    assert publisher.calls == 1
+
+
+def test_worker_schedules_retry_when_upload_fails(config, queue, video):
+    worker = PublishWorker(config, queue=queue, publisher=FakePublisher(RuntimeError("HTTP 503")))
+    job = queue.enqueue(video, "Title", "Description")
+
+    assert worker.process_one("worker-a")
+
+    job = queue.list_jobs()[0]
+    assert job['status'] == 'pending'
+    assert job['attempts'] == 1
+    assert job['last_error'] == "HTTP 503"
+    assert job['claimed_by'] is None
+
+
+def test_target_success_is_kept_after_lease_passes(queue, video, monkeypatch):
+    job = queue.enqueue(video, "Title", "Description")
+    queue.claim("worker-a")
+
+    later = time.time() + 61
+    monkeypatch.setattr(time, "time", lambda: later)
+    queue.claim("worker-b")
+
+    assert not queue.save_target_result(job['id'], "worker-a", "fb_main", {"success": True})
+    job = queue.mark_failed(job['id'], "ig failed", {"ig_main": {"success": False}}, worker_id="worker-b")
+
+    results = json.loads(job['target_results'])
+    assert results['fb_main']['success']
+    assert not results['ig_main']['success']
+
+
+def test_rate_limited_target_is_deferred_not_waited_for(config, queue, video):
+    config['publish']['targets'] = [
+        {"name": "fast", "account_id": "1"},
+        {"name": "slow", "account_id": "2", "max_per_hour": 1},
+    ]
+    worker = PublishWorker(config, queue=queue)
+    publisher = FakeTargetPublisher()
+    worker.fanout.publisher = publisher
+    # This hour's post to the slow target is already made
+    worker.fanout.limiter.acquire("socialbu:slow")
+    queue.enqueue(video, "Title", "Description")
+
+    assert worker.process_one("worker-a")
+
+    job = queue.list_jobs()[0]
+    assert job['status'] == 'pending'
+    assert job['attempts'] == 0
+    assert job['next_attempt_at'] > time.time() + 3000
+    results = json.loads(job['target_results'])
+    assert results['fast']['success']
+    assert results['slow']['deferred']
+    assert publisher.accounts == ["1"]
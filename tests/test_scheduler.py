@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import pytest
+import schedule
+import yaml
+
+from scheduler import ReelScheduler
+from stage_timings import DEFAULT_STAGE_SECONDS
+
+TZ = ZoneInfo("America/New_York")
+MARGIN = 5 * 60
+LEAD = sum(DEFAULT_STAGE_SECONDS.values()) + MARGIN
+
+
+@pytest.fixture
+def scheduler(tmp_path, config):
+    config.update({
+        "schedule": {
+            "times": ["10:00", "18:00"],
+            "timezone": TZ.key,
+            "lead_margin_minutes": 5,
+        },
+        "prefetch": {"enabled": False},
+    })
+    config_path = tmp_path / "settings.yaml"
+    config_path.write_text(yaml.safe_dump(config))
+    yield ReelScheduler(str(config_path))
+    schedule.clear()
+
+
+def plan_for(scheduler, now, slot):
+    return next(entry for entry in scheduler.plan(now) if entry['slot'] == slot)
+
+
+def test_plan_starts_runs_one_lead_before_slot(scheduler):
+    slot = datetime(2026, 3, 2, 10, 0, tzinfo=TZ)
+    entry = plan_for(scheduler, slot - timedelta(hours=6), slot)
+
+    assert entry['lead_seconds'] == LEAD
+    assert entry['start_at'] == slot - timedelta(seconds=LEAD)
+    assert not entry['at_risk']
+    assert not entry['started']
+
+
+def test_run_started_on_time_is_not_at_risk(scheduler):
+    slot = datetime(2026, 3, 2, 10, 0, tzinfo=TZ)
+    start_at = slot - timedelta(seconds=LEAD)
+
+    # The check loop reaches start_at up to check_interval late
+    assert not plan_for(scheduler, start_at, slot)['at_risk']
+    assert not plan_for(scheduler, start_at + timedelta(seconds=30), slot)['at_risk']
+
+
+def test_run_started_past_the_margin_is_at_risk(scheduler):
+    slot = datetime(2026, 3, 2, 10, 0, tzinfo=TZ)
+    late_start = slot - timedelta(seconds=LEAD - MARGIN - 60)
+
+    assert plan_for(scheduler, late_start, slot)['at_risk']
+
+
+def test_plan_lists_upcoming_slots_in_order(scheduler):
+    now = datetime(2026, 3, 2, 12, 0, tzinfo=TZ)
+    slots = [entry['slot'] for entry in scheduler.plan(now)]
+
+    assert slots[:3] == [
+        datetime(2026, 3, 2, 18, 0, tzinfo=TZ),
+        datetime(2026, 3, 3, 10, 0, tzinfo=TZ),
+        datetime(2026, 3, 3, 18, 0, tzinfo=TZ),
+    ]
+
+
+def test_daily_runs_use_slot_times_converted_to_local_time(scheduler):
+    scheduler.schedule_slot_runs()
+
+    now = datetime.now(TZ)
+    expected = sorted({
+        datetime.combine(now.date(), datetime.strptime(t, "%H:%M").time(), tzinfo=TZ).astimezone().strftime('%H:%M')
+        for t in ("10:00", "18:00")
+    })
+    assert sorted(job.at_time.strftime('%H:%M') for job in schedule.get_jobs('slot-run')) == expected
+
+    # Unchanged local times leave the jobs alone
+    jobs = schedule.get_jobs('slot-run')
+    scheduler.schedule_slot_runs()
+    assert schedule.get_jobs('slot-run') == jobs
@@ -0,0 +1,46 @@
+import pytest
+
+from stage_timings import StageTimings, DEFAULT_STAGE_SECONDS
+
+
+@pytest.fixture
+def timings(config):
+    return StageTimings(config)
+
+
+def test_defaults_before_any_measurement(timings):
+    assert timings.estimate("video") == DEFAULT_STAGE_SECONDS["video"]
+    assert timings.lead_seconds() == sum(DEFAULT_STAGE_SECONDS.values())
+
+
+def test_p95_is_nearest_rank(config):
+    config['schedule'] = {"timing_samples": 100}
+    timings = StageTimings(config)
+    for seconds in range(1, 101):
+        timings.record("video", seconds)
+
+    assert timings.estimate("video") == 95.0
+
+
+def test_p95_of_few_samples_is_the_slowest(timings):
+    for seconds in (30, 10, 20):
+        timings.record("compose", seconds)
+
+    assert timings.estimate("compose") == 30.0
+
+
+def test_only_recent_samples_are_kept(config):
+    config['schedule'] = {"timing_samples": 5}
+    timings = StageTimings(config)
+    for seconds in (500, 1, 2, 3, 4, 5):
+        timings.record("story", seconds)
+
+    assert timings.estimate("story") == 5.0
+    assert timings.summary()["story"]["samples"] == 5
+
+
+def test_lead_seconds_excludes_prefetched_stages(timings):
+    timings.record("video", 300)
+
+    full = timings.lead_seconds()
+    assert timings.lead_seconds(exclude=("story", "video")) == full - 300 - DEFAULT_STAGE_SECONDS["story"]
@@ -0,0 +1,109 @@
+import asyncio
+import os
+
+import pytest
+
+from voice_engine import VoiceEngine
+
+
+class RecordingVoiceEngine(VoiceEngine):
+    """Writes the text instead of calling Edge-TTS, optionally failing first"""
+
+    def __init__(self, config, failures=0):
+        super().__init__(config)
+        self.calls = []
+        self.failures = failures
+
+    async def _generate_async(self, text, output_path):
+        self.calls.append(text)
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("websocket closed")
+        with open(output_path, 'w') as f:
+            f.write(text)
+
+
+@pytest.fixture
+def config(config, tmp_path):
+    config['paths']['tts_cache'] = str(tmp_path / "tts_cache")
+    config['edge_tts'] = {
+        "voice": "en-US-EmmaMultilingualNeural",
+        "rate": "+5%",
+        "pitch": "+0Hz",
+        "parallel": True,
+        "sentence_retries": 3,
+    }
+    return config
+
+
+def synthesize(engine, index, sentence):
+    return asyncio.run(engine._synthesize_sentence(index, sentence, asyncio.Semaphore(1)))
+
+
+def test_split_sentences_keeps_punctuation():
+    script = "She opened the letter. It was from him!  Why now?\nShe didn't know… Then she smiled."
+
+    assert VoiceEngine._split_sentences(script) == [
+        "She opened the letter.",
+        "It was from him!",
+        "Why now?",
+        "She didn't know…",
+        "Then she smiled.",
+    ]
+
+
+def test_split_sentences_without_final_punctuation():
+    assert VoiceEngine._split_sentences("  One line. And a trailing clause ") == [
+        "One line.",
+        "And a trailing clause",
+    ]
+    assert VoiceEngine._split_sentences("   ") == []
+
+
+def test_cache_key_depends_on_voice_settings(config):
+    engine = VoiceEngine(config)
+    path = engine._cache_path("Hello there.")
+
+    assert path == engine._cache_path("Hello there.")
+    assert path != engine._cache_path("Hello there!")
+
+    config['edge_tts']['rate'] = "+10%"
+    assert VoiceEngine(config)._cache_path("Hello there.") != path
+
+
+def test_cached_sentence_is_not_synthesized_again(config):
+    engine = RecordingVoiceEngine(config)
+
+    first = synthesize(engine, 0, "It was from him!")
+    second = synthesize(engine, 3, "It was from him!")
+
+    assert first == second == engine._cache_path("It was from him!")
+    assert engine.calls == ["It was from him!"]
+    with open(first) as f:
+        assert f.read() == "It was from him!"
+
+
+def test_failed_sentence_is_retried_alone(config, monkeypatch):
+    async def no_wait(seconds):
+        pass
+
+    monkeypatch.setattr(asyncio, "sleep", no_wait)
+    engine = RecordingVoiceEngine(config, failures=2)
+
+    path = synthesize(engine, 0, "Why now?")
+
+    assert engine.calls == ["Why now?"] * 3
+    assert os.path.getsize(path) > 0
+    assert [f for f in os.listdir(engine.cache_dir) if f.endswith(".tmp")] == []
+
+
+def test_sentence_failing_every_attempt_raises(config, monkeypatch):
+    async def no_wait(seconds):
+        pass
+
+    monkeypatch.setattr(asyncio, "sleep", no_wait)
+    engine = RecordingVoiceEngine(config, failures=3)
+
+    with pytest.raises(Exception, match="failed after 3 attempts"):
+        synthesize(engine, 1, "Then she smiled.")
+    assert os.listdir(engine.cache_dir) == []
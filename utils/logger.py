@@ -1,48 +1,266 @@
-import logging
-import os
-from datetime import datetime
-from logging.handlers import RotatingFileHandler
-
-
-def setup_logger(name: str, log_file: str = None, level=logging.INFO):
-    """
-    Set up logger with file and console handlers
-    """
-    # Create logs directory if it doesn't exist
-    log_dir = "logs"
-    os.makedirs(log_dir, exist_ok=True)
-
-    # Create logger
-    logger = logging.getLogger(name)
-    logger.setLevel(level)
-
-    # Avoid duplicate handlers
-    if logger.handlers:
-        return logger
-
-    # Create formatters
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
-
-    # Console handler
-    console_handler = logging.StreamHandler()
-    console_handler.setLevel(level)
-    console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
-
-    # File handler with rotation
-    if log_file is None:
-        log_file = os.path.join(log_dir, f"{name}_{datetime.now().strftime('%Y%m%d')}.log")
-
-    file_handler = RotatingFileHandler(
-        log_file,
-        maxBytes=10 * 1024 * 1024,  # 10MB
-        backupCount=5
-    )
-    file_handler.setLevel(level)
-    file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
-
-    return logger
\ No newline at end of file
+import os
+import sys
+import json
+import queue
+import atexit
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+from typing import Dict, Any, List, Optional
+
+# Run and stage of the code logging; asyncio tasks and copied contexts
+# inherit them, so concurrent reels' records stay apart
+_run_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("log_run_id", default=None)
+_stage: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("log_stage", default=None)
+
+# Tunable through configure_logging()
+_settings = {
+    "level": logging.INFO,
+    "max_message_chars": 2000,
+    "max_bytes": 10 * 1024 * 1024,  # 10MB
+    "backup_count": 5,
+    "dir": "logs",
+}
+
+_lock = threading.Lock()
+_queue_handler: Optional["_ContextQueueHandler"] = None
+_listener: Optional[QueueListener] = None
+_listener_pid: Optional[int] = None
+_file_handler: Optional[logging.Handler] = None
+# Per-logger log_file handlers, re-attached when a forked child restarts the listener
+_extra_handlers: List[logging.Handler] = []
+
+
+class _LazyRotatingFileHandler(RotatingFileHandler):
+    """
+    Rotating file handler that creates the log directory and opens the
+    file on the first record, so importing a module costs nothing on disk
+    """
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+        return super()._open()
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line, tagged with the run and stage ids
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "run_id": getattr(record, 'run_id', None),
+            "stage": getattr(record, 'stage', None),
+            "pid": record.process,
+            "thread": record.threadName,
+        }
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class _ContextQueueHandler(QueueHandler):
+    """
+    Hands records to the listener thread without doing any I/O
+
+    Runs in the logging thread, so it captures the run/stage context and
+    formats the message there. Long messages (API payloads) are truncated;
+    tracebacks are kept whole.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.run_id = _run_id.get()
+        record.stage = _stage.get()
+
+        message = record.getMessage()
+        limit = _settings['max_message_chars']
+        if limit and len(message) > limit:
+            record = logging.makeLogRecord(record.__dict__)
+            record.msg = f"{message[:limit]}... [{len(message) - limit} chars truncated]"
+            record.args = None
+
+        return super().prepare(record)
+
+    def enqueue(self, record: logging.LogRecord):
+        if _listener_pid != os.getpid():
+            # Forked worker: the listener thread didn't survive the fork
+            _start_listener()
+        self.queue.put_nowait(record)
+
+
+def _log_path() -> str:
+    """
+    One consolidated log per process, e.g. logs/main_20260131_4242.log
+
+    Old ones are removed by the storage sweep (storage.retention.logs).
+    """
+    program = os.path.splitext(os.path.basename(sys.argv[0]))[0]
+    if program in ("", "-", "-c"):
+        program = "python"
+    return os.path.join(_settings['dir'], f"{program}_{datetime.now().strftime('%Y%m%d')}_{os.getpid()}.log")
+
+
+def _new_file_handler() -> logging.Handler:
+    handler = _LazyRotatingFileHandler(
+        _log_path(),
+        maxBytes=_settings['max_bytes'],
+        backupCount=_settings['backup_count'],
+        encoding='utf-8',
+        delay=True
+    )
+    handler.setFormatter(JsonFormatter())
+    return handler
+
+
+def _start_listener():
+    """
+    (Re)start the background thread writing the console and file logs
+    """
+    global _listener, _listener_pid, _file_handler
+
+    with _lock:
+        if _listener_pid == os.getpid():
+            return
+
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(logging.Formatter(
+            '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+            datefmt='%Y-%m-%d %H:%M:%S'
+        ))
+
+        _file_handler = _new_file_handler()
+
+        # Unbounded: a slow disk or console never blocks a reel
+        _queue_handler.queue = queue.SimpleQueue()
+        _listener = QueueListener(_queue_handler.queue, console_handler, _file_handler, *_extra_handlers)
+        _listener.start()
+        _listener_pid = os.getpid()
+
+
+def _after_fork():
+    """Fresh lock in a forked child, another thread may have held it"""
+    global _lock
+    _lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def stop_logging():
+    """
+    Flush pending records and stop the listener thread
+
+    Registered with atexit; multiprocessing workers, which exit without
+    running atexit handlers, call it themselves.
+    """
+    global _listener_pid
+
+    with _lock:
+        if _listener is not None and _listener_pid == os.getpid():
+            _listener.stop()
+            _listener_pid = None
+
+
+def setup_logger(name: str, log_file: str = None, level=None):
+    """
+    Set up a logger writing through the process-wide logging queue
+
+    Console output keeps the plain text format; the file log is JSON lines
+    with run and stage ids. All loggers of a process share one rotated file.
+
+    Args:
+        name: Logger name (usually the module)
+        log_file: Extra file to also write this logger's records to
+        level: Logging level (default: configured level, INFO)
+    """
+    global _queue_handler
+
+    # Create logger
+    logger = logging.getLogger(name)
+    logger.setLevel(level or _settings['level'])
+
+    # Avoid duplicate handlers
+    if logger.handlers:
+        return logger
+
+    with _lock:
+        if _queue_handler is None:
+            _queue_handler = _ContextQueueHandler(queue.SimpleQueue())
+            atexit.register(stop_logging)
+    if _listener_pid != os.getpid():
+        _start_listener()
+
+    logger.addHandler(_queue_handler)
+    logger.propagate = False
+
+    if log_file is not None:
+        extra_handler = _LazyRotatingFileHandler(
+            log_file,
+            maxBytes=_settings['max_bytes'],
+            backupCount=_settings['backup_count'],
+            encoding='utf-8',
+            delay=True
+        )
+        extra_handler.setFormatter(JsonFormatter())
+        extra_handler.addFilter(logging.Filter(name))
+        with _lock:
+            _extra_handlers.append(extra_handler)
+            _listener.handlers = _listener.handlers + (extra_handler,)
+
+    return logger
+
+
+def configure_logging(config: Dict[str, Any]):
+    """
+    Apply the logging section of settings.yaml
+
+    Args:
+        config: Full configuration; uses logging.level,
+            logging.max_message_chars and paths.logs
+    """
+    global _file_handler
+
+    logging_config = config.get('logging', {})
+
+    log_dir = config.get('paths', {}).get('logs')
+    if log_dir and log_dir != _settings['dir']:
+        _settings['dir'] = log_dir
+        with _lock:
+            # Records already written stay in the old file
+            if _listener is not None and _listener_pid == os.getpid():
+                old_handler, _file_handler = _file_handler, _new_file_handler()
+                _listener.handlers = tuple(
+                    _file_handler if h is old_handler else h for h in _listener.handlers
+                )
+                old_handler.close()
+
+    _settings['max_message_chars'] = logging_config.get('max_message_chars', _settings['max_message_chars'])
+
+    level = logging_config.get('level')
+    if level:
+        _settings['level'] = logging.getLevelName(str(level).upper())
+        for logger in logging.Logger.manager.loggerDict.values():
+            if isinstance(logger, logging.Logger) and _queue_handler in logger.handlers:
+                logger.setLevel(_settings['level'])
+
+
+@contextmanager
+def log_context(run_id: Optional[str] = None, stage: Optional[str] = None):
+    """
+    Tag records logged inside the block with a run and/or stage id
+    """
+    tokens = []
+    if run_id is not None:
+        tokens.append((_run_id, _run_id.set(run_id)))
+    if stage is not None:
+        tokens.append((_stage, _stage.set(stage)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
\ No newline at end of file
@@ -1,57 +1,209 @@
-import asyncio
-import edge_tts
-import os
-from typing import Dict, Any
-from utils.logger import setup_logger
-
-logger = setup_logger("voice_engine")
-
-
-class VoiceEngine:
-    """
-    Generate voice-overs using Edge-TTS
-    """
-
-    def __init__(self, config: Dict[str, Any]):
-        self.voice = config['edge_tts']['voice']
-        self.rate = config['edge_tts']['rate']
-        self.pitch = config['edge_tts']['pitch']
-
-    async def _generate_async(self, text: str, output_path: str):
-        """
-        Async voice generation
-        """
-        communicate = edge_tts.Communicate(
-            text=text,
-            voice=self.voice,
-            rate=self.rate,
-            pitch=self.pitch
-        )
-        await communicate.save(output_path)
-
-    def generate_voiceover(self, script: str, output_path: str) -> str:
-        """
-        Generate voice-over from script
-
-        Args:
-            script: The narration text
-            output_path: Where to save the audio file
-
-        Returns:
-            Path to generated audio file
-        """
-        try:
-            logger.info("Generating voice-over...")
-
-            # Run async function
-            asyncio.run(self._generate_async(script, output_path))
-
-            if os.path.exists(output_path):
-                logger.info(f"✓ Voice-over generated: {output_path}")
-                return output_path
-            else:
-                raise Exception("Voice file not created")
-
-        except Exception as e:
-            logger.error(f"Error generating voice-over: {str(e)}")
-            raise
\ No newline at end of file
+import asyncio
+import edge_tts
+import os
+import re
+import uuid
+import hashlib
+from typing import Dict, Any, List
+from utils.logger import setup_logger
+from rate_limiter import get_rate_limiter
+from resource_accounting import run_subprocess, record_http
+
+logger = setup_logger("voice_engine")
+
+
+class VoiceEngine:
+    """
+    Generate voice-overs using Edge-TTS
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        self.voice = config['edge_tts']['voice']
+        self.rate = config['edge_tts']['rate']
+        self.pitch = config['edge_tts']['pitch']
+        self.limiter = get_rate_limiter(config)
+
+        # Sentence-parallel mode
+        self.parallel = config['edge_tts'].get('parallel', False)
+        self.max_workers = config['edge_tts'].get('max_workers', 4)
+        self.sentence_pause_ms = config['edge_tts'].get('sentence_pause_ms', 250)
+        self.sentence_retries = config['edge_tts'].get('sentence_retries', 3)
+        self.cache_dir = config['paths'].get('tts_cache', os.path.join(config['paths']['output'], "tts_cache"))
+
+    async def _generate_async(self, text: str, output_path: str):
+        """
+        Async voice generation
+        """
+        communicate = edge_tts.Communicate(
+            text=text,
+            voice=self.voice,
+            rate=self.rate,
+            pitch=self.pitch
+        )
+        await communicate.save(output_path)
+        record_http('edge_tts', os.path.getsize(output_path), len(text.encode()))
+
+    def generate_voiceover(self, script: str, output_path: str) -> str:
+        """
+        Generate voice-over from script
+
+        Args:
+            script: The narration text
+            output_path: Where to save the audio file
+
+        Returns:
+            Path to generated audio file
+        """
+        try:
+            logger.info("Generating voice-over...")
+
+            if self.parallel and len(self._split_sentences(script)) > 1:
+                asyncio.run(self._generate_parallel(script, output_path))
+            else:
+                # Run async function
+                with self.limiter.slot('edge_tts'):
+                    asyncio.run(self._generate_async(script, output_path))
+
+            if os.path.exists(output_path):
+                logger.info(f"✓ Voice-over generated: {output_path}")
+                return output_path
+            else:
+                raise Exception("Voice file not created")
+
+        except Exception as e:
+            logger.error(f"Error generating voice-over: {str(e)}")
+            raise
+
+    @staticmethod
+    def _split_sentences(script: str) -> List[str]:
+        """
+        Split narration into sentences, keeping the closing punctuation
+        """
+        sentences = re.split(r'(?<=[.!?…])\s+', script.strip())
+        return [s.strip() for s in sentences if s.strip()]
+
+    def _cache_path(self, sentence: str) -> str:
+        """
+        Cache file for a sentence with the current voice settings
+        """
+        key = hashlib.sha256(f"{self.voice}|{self.rate}|{self.pitch}|{sentence}".encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.mp3")
+
+    async def _generate_parallel(self, script: str, output_path: str):
+        """
+        Synthesize sentences concurrently and join them
+        """
+        sentences = self._split_sentences(script)
+        workers = asyncio.Semaphore(self.max_workers)
+
+        logger.info(f"Synthesizing {len(sentences)} sentences ({self.max_workers} at a time)...")
+        parts = await asyncio.gather(*(
+            self._synthesize_sentence(i, sentence, workers)
+            for i, sentence in enumerate(sentences)
+        ))
+
+        await asyncio.to_thread(self._concat_sentences, parts, output_path)
+
+    async def _synthesize_sentence(self, index: int, sentence: str, workers: asyncio.Semaphore) -> str:
+        """
+        Synthesize one sentence, retrying it alone on failure
+
+        Returns:
+            Path to the cached sentence audio
+        """
+        path = self._cache_path(sentence)
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            # Keep recently used entries clear of the retention sweep
+            os.utime(path)
+            return path
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Unique per call: threads and concurrent reels may synthesize the same sentence
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+
+        for attempt in range(self.sentence_retries):
+            try:
+                async with workers:
+                    async with self.limiter.slot_async('edge_tts'):
+                        await self._generate_async(sentence, tmp_path)
+
+                if not os.path.exists(tmp_path) or os.path.getsize(tmp_path) == 0:
+                    raise Exception("empty audio")
+
+                os.replace(tmp_path, path)
+                return path
+
+            except Exception as e:
+                logger.warning(f"Sentence {index + 1} attempt {attempt + 1} failed: {str(e)}")
+                if attempt < self.sentence_retries - 1:
+                    await asyncio.sleep(2 ** attempt)
+
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise Exception(f"Sentence {index + 1} failed after {self.sentence_retries} attempts: {sentence[:40]}")
+
+    def _concat_sentences(self, parts: List[str], output_path: str):
+        """
+        Join sentence clips with fixed pauses
+
+        Each clip's leading and trailing silence is trimmed first, so the
+        gaps are exactly sentence_pause_ms regardless of Edge-TTS padding.
+        """
+        trim = "silenceremove=start_periods=1:start_threshold=-50dB"
+        pause = self.sentence_pause_ms / 1000
+
+        cmd = ['ffmpeg', '-y']
+        filters = []
+        for i, part in enumerate(parts):
+            cmd += ['-i', part]
+            chain = f"[{i}:a]aformat=sample_rates=24000:channel_layouts=mono,{trim},areverse,{trim},areverse"
+            if i < len(parts) - 1 and pause > 0:
+                chain += f",apad=pad_dur={pause}"
+            filters.append(chain + f"[s{i}]")
+
+        inputs = ''.join(f"[s{i}]" for i in range(len(parts)))
+        filters.append(f"{inputs}concat=n={len(parts)}:v=0:a=1[voice]")
+
+        tmp_path = output_path + ".tmp.mp3"
+        cmd += [
+            '-filter_complex', ';'.join(filters),
+            '-map', '[voice]',
+            '-c:a', 'libmp3lame', '-q:a', '2',
+            tmp_path
+        ]
+
+        result = run_subprocess(cmd, timeout=120)
+        if result.returncode != 0:
+            logger.error(f"FFmpeg error: {result.stderr}")
+            raise Exception(f"Joining sentences failed with code {result.returncode}")
+
+        os.replace(tmp_path, output_path)
+
+
+class AsyncVoiceEngine(VoiceEngine):
+    """
+    Voice engine for asyncio pipelines, running on the caller's event loop
+    """
+
+    async def generate_voiceover(self, script: str, output_path: str) -> str:
+        """
+        Async generate_voiceover()
+        """
+        try:
+            logger.info("Generating voice-over...")
+
+            if self.parallel and len(self._split_sentences(script)) > 1:
+                await self._generate_parallel(script, output_path)
+            else:
+                async with self.limiter.slot_async('edge_tts'):
+                    await self._generate_async(script, output_path)
+
+            if os.path.exists(output_path):
+                logger.info(f"✓ Voice-over generated: {output_path}")
+                return output_path
+            else:
+                raise Exception("Voice file not created")
+
+        except Exception as e:
+            logger.error(f"Error generating voice-over: {str(e)}")
+            raise